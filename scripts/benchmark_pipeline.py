@@ -0,0 +1,256 @@
+"""
+benchmark_pipeline.py
+~~~~~~~~~~~~~~~~~~~~~
+
+Time and memory-profile the transition table scripts at several table sizes.
+
+Synthetic Millington-shaped tables are made with `generate_trans_table.py`,
+so no input data or network access is needed. For each table size we run
+
+- each stage of the pipeline in `repurpose_trans_rules_agrosuccess.py`, in
+  order, each stage taking the previous stage's output,
+- `summarise_millington_succession` from `summarise_millington_table.py`,
+- `millington_succession_html_to_csv` from `clean_millington_trans_table.py`
+  (reported as skipped if pandas can't parse html because lxml or
+  bs4/html5lib aren't installed). `convert_doc_to_html` needs LibreOffice
+  and the source .doc file so isn't benchmarked.
+
+Each function is run `repeat` times to measure wall time, keeping the
+fastest, and once more under :mod:`tracemalloc` to measure peak memory
+allocated by Python, so tracing doesn't distort the timings. Stages which
+check the whole table for duplicate transitions can't be given stacked
+scenario variants directly, so they're run on each scenario in turn and the
+results summed.
+
+Results are written as JSON and can be compared against a previously saved
+baseline, e.g.::
+
+    python benchmark_pipeline.py --sizes 1000 100000 --save baseline.json
+    python benchmark_pipeline.py --sizes 1000 100000 --baseline baseline.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import pandas as pd
+
+from generate_trans_table import (
+    SCENARIO_COL,
+    generate_millington_table_of_size,
+)
+from repurpose_trans_rules_agrosuccess import make_repurpose_pipeline
+from summarise_millington_table import summarise_millington_succession
+import clean_millington_trans_table as cmt
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+# Pipeline stages asserting there are no duplicate transitions in the table
+PER_SCENARIO_STAGES = ["merge_shrubland"]
+
+
+def _timed(func, make_args, repeat):
+    """Result of `func` and fastest of `repeat` calls with fresh arguments."""
+    best = None
+    for _ in range(repeat):
+        args = make_args()
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def _peak_memory(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(func, make_args, repeat=3):
+    """Run `func`, returning its result, wall time and peak memory.
+
+    Args:
+        func (function): Function to benchmark.
+        make_args (function): Called with no arguments before each run of
+            `func` to give a fresh tuple of arguments, so functions which
+            modify their input are always given the same input.
+        repeat (int, optional): Number of timed runs.
+    """
+    result, seconds = _timed(func, make_args, repeat)
+    return result, seconds, _peak_memory(func, *make_args())
+
+
+def _per_scenario(func):
+    """Apply `func` to each scenario in a stacked table, restack results."""
+    def wrapped(df):
+        if SCENARIO_COL not in df.columns:
+            return func(df)
+        results = []
+        for scenario, scenario_df in df.groupby(SCENARIO_COL, sort=False):
+            result = func(scenario_df.drop(columns=SCENARIO_COL).copy())
+            result[SCENARIO_COL] = scenario
+            results.append(result)
+        return pd.concat(results)
+    return wrapped
+
+
+def _record(function, table_rows, n_rows, seconds, peak_bytes):
+    return {"function": function, "table_rows": table_rows, "n_rows": n_rows,
+            "seconds": seconds, "peak_mb": peak_bytes / 2 ** 20}
+
+
+def _skipped(function, table_rows, n_rows, reason):
+    """Record of a function which couldn't be benchmarked."""
+    return {"function": function, "table_rows": table_rows,
+            "n_rows": n_rows, "seconds": None, "peak_mb": None,
+            "skipped": reason}
+
+
+def benchmark_repurpose_stages(df, repeat=3):
+    """Benchmark each stage of the repurposing pipeline on table `df`."""
+    records = []
+    table_rows = len(df.index)
+    for stage in make_repurpose_pipeline("start", "delta_D").stages:
+        func = stage
+        if stage.name in PER_SCENARIO_STAGES:
+            func = _per_scenario(stage)
+        n_rows = len(df.index)
+        result, seconds, peak = measure(func, lambda: (df.copy(),), repeat)
+        records.append(_record("repurpose." + stage.func.__name__,
+                               table_rows, n_rows, seconds, peak))
+        df = result
+    return records
+
+
+def benchmark_summarise(csv_path, n_rows, repeat=3):
+    _, seconds, peak = measure(summarise_millington_succession,
+                               lambda: (csv_path,), repeat)
+    return [_record("summarise.summarise_millington_succession", n_rows,
+                    n_rows, seconds, peak)]
+
+
+def benchmark_clean(df, tmpdir, repeat=3):
+    """Benchmark scraping the table from html, as in the clean script."""
+    html_path = os.path.join(tmpdir, "table.html")
+    csv_path = os.path.join(tmpdir, "scraped.csv")
+    # The scraper expects the first row of the html table to be a header row
+    header = pd.DataFrame([df.columns], columns=df.columns)
+    pd.concat([header, df]).to_html(html_path, index=False, header=False)
+    function = "clean.millington_succession_html_to_csv"
+    try:
+        _, seconds, peak = measure(cmt.millington_succession_html_to_csv,
+                                   lambda: (html_path, csv_path), repeat)
+    except ImportError as e:
+        return [_skipped(function, len(df.index), len(df.index), str(e))]
+    return [_record(function, len(df.index), len(df.index), seconds, peak)]
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, seed=0, repeat=3):
+    """Benchmark every function at each table size.
+
+    Returns:
+        list of dict: One record per function and size, with keys
+            'function', 'table_rows' (size of the generated table),
+            'n_rows' (rows in the function's input), 'seconds' and
+            'peak_mb'. Functions which couldn't be run have None for
+            'seconds' and 'peak_mb' and give the reason in 'skipped'.
+    """
+    records = []
+    for size in sizes:
+        df = generate_millington_table_of_size(size, seed=seed)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, "millington_succession.csv")
+            df.to_csv(csv_path, index=False)
+            records += benchmark_repurpose_stages(df, repeat)
+            records += benchmark_summarise(csv_path, len(df.index), repeat)
+            records += benchmark_clean(
+                df.drop(columns=SCENARIO_COL, errors="ignore"), tmpdir, repeat)
+    return records
+
+
+def compare_to_baseline(records, baseline, tolerance=0.25):
+    """Compare benchmark results with those from a previous run.
+
+    Args:
+        records (list of dict): Results from :func:`run_benchmarks`.
+        baseline (list of dict): Earlier results in the same format.
+        tolerance (float, optional): Fractional increase in time or memory
+            above which a result is reported as a regression.
+
+    Returns:
+        list of dict: One entry per function and size present in both runs,
+            giving the ratio of new to baseline time and memory and whether
+            either exceeds `1 + tolerance`.
+    """
+    base_d = {(r["function"], r["table_rows"]): r for r in baseline}
+    comparison = []
+    for r in records:
+        base = base_d.get((r["function"], r["table_rows"]))
+        if base is None or r.get("skipped") or base.get("skipped"):
+            continue
+        time_ratio = r["seconds"] / max(base["seconds"], 1e-9)
+        mem_ratio = r["peak_mb"] / max(base["peak_mb"], 1e-9)
+        comparison.append({
+            "function": r["function"], "table_rows": r["table_rows"],
+            "time_ratio": time_ratio, "memory_ratio": mem_ratio,
+            "regression": max(time_ratio, mem_ratio) > 1 + tolerance,
+        })
+    return comparison
+
+
+def _format_records(records):
+    lines = ["{0:<55} {1:>9} {2:>10} {3:>10}".format(
+        "function", "n_rows", "seconds", "peak_mb")]
+    for r in records:
+        if r.get("skipped"):
+            lines.append("{function:<55} {n_rows:>9} skipped: {skipped}"
+                         .format(**r))
+            continue
+        lines.append("{function:<55} {n_rows:>9} {seconds:>10.4f} "
+                     "{peak_mb:>10.2f}".format(**r))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[4])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Approximate numbers of rows in test tables.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of timed runs of each function.")
+    parser.add_argument("--save", help="Write results to this JSON file.")
+    parser.add_argument("--baseline",
+                        help="Compare results with this saved JSON file.")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    # Stages print their progress, which isn't of interest here
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            results = run_benchmarks(args.sizes, seed=args.seed,
+                                     repeat=args.repeat)
+        finally:
+            sys.stdout = stdout
+    print(_format_records(results))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparison = compare_to_baseline(results, json.load(f),
+                                             args.tolerance)
+        for c in comparison:
+            print("{0:<55} {1:>9} time x{2:.2f} memory x{3:.2f}{4}".format(
+                c["function"], c["table_rows"], c["time_ratio"],
+                c["memory_ratio"], "  REGRESSION" if c["regression"] else ""))
+        if any(c["regression"] for c in comparison):
+            sys.exit(1)
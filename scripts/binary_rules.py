@@ -0,0 +1,192 @@
+"""
+binary_rules.py
+~~~~~~~~~~~~~~~
+
+Write the AgroSuccess transition rules in a binary format which can be
+memory-mapped.
+
+Parsing `agrosuccess_succession.csv` on start up is slow, and gives every
+process its own copy of the table. Files in this format are instead opened
+with :obj:`numpy.memmap`, so start up only reads the header, and processes
+reading the same file share one copy of it in the page cache.
+
+A file consists of
+
+1. a fixed 16 byte preamble: the magic bytes `MAGIC`, then the format
+   version and the length in bytes of the header, each a little-endian
+   uint32,
+2. a UTF-8 JSON header giving the `model_ID`, the number of rules, the codes
+   of each enum used (alias to code, for each column), and the name, dtype
+   and offset of each column, and
+3. the columns, each aligned to `ALIGNMENT` bytes from the start of the file
+   and stored as fixed-width little-endian integers. States and conditions
+   are stored as the codes of their enums in `constants.py`.
+
+Column offsets in the header are from the start of the column data, which
+is the first multiple of `ALIGNMENT` after the header.
+"""
+import os
+import json
+import struct
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from config import DIRS
+from constants import AgroSuccessLct as AsLct, SeedPresence
+from schema import (
+    AGROSUCCESS_CONDITION_ENUMS,
+    AGROSUCCESS_SCHEMA,
+    apply_schema,
+    read_agrosuccess_table,
+)
+from transition_lookup import TransitionLookup, enum_codes
+
+MAGIC = b"ASRULES\0"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct("<8sII")
+# column name -> (enum, or None for plain integers; little-endian dtype)
+COLUMNS = OrderedDict(
+    [("transID", (None, "<i4")), ("start", (AsLct, "<i1"))]
+    + [(col, (trans_enum, "<i1"))
+       for col, trans_enum in AGROSUCCESS_CONDITION_ENUMS.items()]
+    + [("delta_D", (AsLct, "<i1")), ("delta_T", (None, "<i2"))])
+
+
+def _aligned(n):
+    return -(-n // ALIGNMENT) * ALIGNMENT
+
+
+def _enum_table(trans_enum):
+    if trans_enum is SeedPresence:
+        return OrderedDict([("false", 0), ("true", 1)])
+    return OrderedDict((m.alias, m.value) for m in trans_enum)
+
+
+def write_rule_table(path, df, model_id):
+    """Write AgroSuccess transition table `df` to a binary rule file.
+
+    The file is written to a temporary file then moved into place, so
+    readers never see a partly written file.
+
+    Args:
+        df (:obj:`pandas.DataFrame`): Table with the columns in `COLUMNS`,
+            e.g. from :func:`schema.read_agrosuccess_table`.
+        model_id (str): `model_ID` the rules belong to.
+    """
+    arrays, columns, offset = [], [], 0
+    for col, (trans_enum, dtype) in COLUMNS.items():
+        values = df[col].to_numpy() if trans_enum is None else enum_codes(
+            df[col], trans_enum)
+        arrays.append(np.ascontiguousarray(values, dtype=dtype))
+        columns.append(OrderedDict([("name", col), ("dtype", dtype),
+                                    ("offset", offset)]))
+        offset = _aligned(offset + arrays[-1].nbytes)
+    header = json.dumps(OrderedDict([
+        ("model_ID", model_id),
+        ("n_rules", len(df.index)),
+        ("enums", OrderedDict((col, _enum_table(trans_enum))
+                              for col, (trans_enum, _) in COLUMNS.items()
+                              if trans_enum is not None)),
+        ("columns", columns),
+    ])).encode("utf-8")
+    data_start = _aligned(_PREAMBLE.size + len(header))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for column, arr in zip(columns, arrays):
+            f.write(b"\0" * (data_start + column["offset"] - f.tell()))
+            f.write(arr.tobytes())
+    os.replace(tmp_path, path)
+
+
+class RuleTable(object):
+    """Transition rules memory-mapped from a binary rule file.
+
+    Attributes:
+        header (dict): The file's header.
+        columns (OrderedDict): Read-only :obj:`numpy.memmap` of each column.
+    """
+
+    def __init__(self, path):
+        """
+        Raises:
+            ValueError: If `path` isn't a rule file of a supported version.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, header_len = _PREAMBLE.unpack(
+                f.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError("{0} is not a binary rule file".format(path))
+            if version != FORMAT_VERSION:
+                raise ValueError("Unsupported rule file version {0} in {1}"
+                                 .format(version, path))
+            self.header = json.loads(f.read(header_len).decode("utf-8"),
+                                     object_pairs_hook=OrderedDict)
+        data_start = _aligned(_PREAMBLE.size + header_len)
+        n_rules = self.header["n_rules"]
+        self.columns = OrderedDict(
+            (c["name"], np.memmap(path, dtype=np.dtype(c["dtype"]), mode="r",
+                                  offset=data_start + c["offset"],
+                                  shape=(n_rules,)) if n_rules else
+             np.empty(0, dtype=c["dtype"]))
+            for c in self.header["columns"])
+
+    @property
+    def model_id(self):
+        return self.header["model_ID"]
+
+    def __len__(self):
+        return self.header["n_rules"]
+
+    def to_lookup(self):
+        """Compile the rules into a :obj:`transition_lookup.TransitionLookup`.
+        """
+        cols = ["start"] + list(AGROSUCCESS_CONDITION_ENUMS)
+        return TransitionLookup.from_codes(
+            [self.columns[col] for col in cols], self.columns["delta_D"],
+            self.columns["delta_T"], self.columns["transID"])
+
+    def to_frame(self):
+        """Decode the rules into a table like `agrosuccess_succession.csv`.
+        """
+        data = OrderedDict()
+        for col, values in self.columns.items():
+            table = self.header["enums"].get(col)
+            if table is None:
+                data[col] = np.array(values, dtype=np.int64)
+                continue
+            aliases = {code: alias for alias, code in table.items()}
+            data[col] = [aliases[code] for code in values.tolist()]
+            if col in AGROSUCCESS_CONDITION_ENUMS and \
+                    AGROSUCCESS_CONDITION_ENUMS[col] is SeedPresence:
+                data[col] = [alias == "true" for alias in data[col]]
+        return apply_schema(pd.DataFrame(data), AGROSUCCESS_SCHEMA)
+
+
+def read_rule_table(path):
+    """Memory-map the binary rule file at `path`."""
+    return RuleTable(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[4])
+    parser.add_argument("--table", default=os.path.join(
+        DIRS["data"]["created"], "agrosuccess_succession.csv"))
+    parser.add_argument("--params", default=os.path.join(
+        DIRS["scripts"], "..", "global_parameters.json"))
+    parser.add_argument("--out", default=os.path.join(
+        DIRS["data"]["created"], "agrosuccess_succession.rules"))
+    args = parser.parse_args()
+
+    with open(args.params) as f:
+        MODEL_ID = json.load(f)["model_ID"]
+    write_rule_table(args.out, read_agrosuccess_table(args.table), MODEL_ID)
+    print("Wrote {0} rules for {1} to {2}".format(
+        len(read_rule_table(args.out)), MODEL_ID, args.out))
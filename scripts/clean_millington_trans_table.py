@@ -35,6 +35,11 @@ import logging
 import pandas as pd
 from config import DIRS, exit_if_file_missing
 from constants import MillingtonPaperLct
+from instrumentation import (
+    instrumented,
+    metrics_file_for_log,
+    set_metrics_file,
+)
 
 def convert_doc_to_html(doc_file, output_dir, overwrite=True):
     """Use Libreoffice's `soffice` command to convert .doc file to .html.
@@ -110,15 +115,18 @@ if __name__ == "__main__":
     LOG_FILE = os.path.join(
         DIRS["logs"], os.path.basename(__file__).split(".py")[0] + ".log")
     logging.basicConfig(filename=LOG_FILE, filemode='w', level=logging.INFO)
+    set_metrics_file(metrics_file_for_log(LOG_FILE))
 
     # Make reference to output file name
     OUT_FILE = os.path.join(DIRS["data"]["tmp"], "millington_succession.csv")
 
     # Convert .doc file from Millington2009 sup. materials to html file
-    html_fname = convert_doc_to_html(SRC_FILE, DIRS["data"]["tmp"])
+    with instrumented("convert_doc_to_html"):
+        html_fname = convert_doc_to_html(SRC_FILE, DIRS["data"]["tmp"])
     
     # Convert intermediate html file to csv
-    millington_succession_html_to_csv(html_fname, OUT_FILE)
+    with instrumented("millington_succession_html_to_csv"):
+        millington_succession_html_to_csv(html_fname, OUT_FILE)
 
     # remove temporary html file
     os.remove(html_fname)
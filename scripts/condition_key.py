@@ -0,0 +1,150 @@
+"""
+condition_key.py
+~~~~~~~~~~~~~~~~
+
+Pack the six environmental condition columns of a transition table into a
+single small integer column.
+
+Each condition (`succession`, `aspect`, `pine`, `oak`, `deciduous`, `water`)
+takes one of a handful of values given by an enum in `constants.py`, so all
+six fit in 7 bits. Comparing, sorting and grouping on one integer column is
+much cheaper than doing so on six object columns.
+
+Within each field a condition value is stored as its position when the
+enum's aliases are sorted alphabetically, with the first condition column in
+the most significant bits. This means sorting on the key gives the same
+order as sorting on the named condition columns (e.g. 'hydric' < 'mesic' <
+'xeric'), so switching to the key doesn't change the order of any output.
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from constants import Succession, Aspect, SeedPresence, Water
+
+KEY_COL = "cond_key"
+
+
+def seed_to_bool(alias):
+    """Value used in tables for a `SeedPresence` alias."""
+    return alias == SeedPresence.TRUE.alias
+
+
+# condition column -> (enum, function mapping alias to value used in tables)
+CONDITION_ENUMS = OrderedDict([
+    ("succession", (Succession, None)),
+    ("aspect", (Aspect, None)),
+    ("pine", (SeedPresence, seed_to_bool)),
+    ("oak", (SeedPresence, seed_to_bool)),
+    ("deciduous", (SeedPresence, seed_to_bool)),
+    ("water", (Water, None)),
+])
+COND_COLS = list(CONDITION_ENUMS.keys())
+
+
+class _Field(object):
+    """Position and value lookups for one condition in the packed key."""
+
+    def __init__(self, col, trans_enum, alias_func):
+        members = sorted(trans_enum, key=lambda m: m.alias)
+        self.col = col
+        self.width = max(len(members) - 1, 1).bit_length()
+        self.codes = pd.Index([m.value for m in members])
+        names = [m.alias for m in members]
+        if alias_func:
+            names = [alias_func(name) for name in names]
+        self.names = pd.Index(names)
+        self.shift = 0
+
+    def digits(self, values, coded):
+        """Position of each of `values` within this field."""
+        lookup = self.codes if coded else self.names
+        digits = lookup.get_indexer(values)
+        if (digits == -1).any():
+            unknown = sorted(set(np.asarray(values)[digits == -1]), key=str)
+            raise ValueError("Unknown {0} value(s) in column '{1}': {2}"
+                             .format("coded" if coded else "named",
+                                     self.col, unknown))
+        return digits
+
+
+def _make_fields():
+    fields = [_Field(col, e, f) for col, (e, f) in CONDITION_ENUMS.items()]
+    shift = 0
+    for field in reversed(fields):
+        field.shift = shift
+        shift += field.width
+    return fields, shift
+
+_FIELDS, KEY_BITS = _make_fields()
+KEY_DTYPE = np.min_scalar_type(2 ** KEY_BITS - 1)
+
+
+def pack_conditions(df, coded=False):
+    """Compute the packed condition key for every row in `df`.
+
+    Args:
+        df (:obj:`pandas.DataFrame`): Transition table containing all of
+            `COND_COLS`.
+        coded (bool, optional): True if the condition columns contain enum
+            codes (as in the Millington table), False if they contain names
+            (aliases, or bools for seed presence).
+
+    Returns:
+        :obj:`numpy.ndarray`: Array of keys with dtype `KEY_DTYPE`.
+
+    Raises:
+        ValueError: If a condition column contains an unrecognised value.
+    """
+    keys = np.zeros(len(df.index), dtype=KEY_DTYPE)
+    for field in _FIELDS:
+        digits = field.digits(df[field.col], coded).astype(KEY_DTYPE)
+        keys |= digits << KEY_DTYPE.type(field.shift)
+    return keys
+
+
+def add_condition_key(df, coded=False):
+    """Add the packed condition key to `df` as column `KEY_COL`."""
+    df[KEY_COL] = pack_conditions(df, coded=coded)
+    return df
+
+
+def ensure_condition_key(df, coded=False):
+    """Add the packed condition key to `df` unless it's already present."""
+    if KEY_COL not in df.columns:
+        df = add_condition_key(df, coded=coded)
+    return df
+
+
+def unpack_condition_key(keys, coded=False, index=None):
+    """Expand packed condition keys back into named condition columns.
+
+    Args:
+        keys (array-like): Packed condition keys.
+        coded (bool, optional): If True give enum codes, otherwise names.
+        index (:obj:`pandas.Index`, optional): Index for the result.
+
+    Returns:
+        :obj:`pandas.DataFrame`: One column per condition in `COND_COLS`.
+    """
+    keys = np.asarray(keys, dtype=KEY_DTYPE)
+    cols = OrderedDict()
+    for field in _FIELDS:
+        mask = KEY_DTYPE.type((1 << field.width) - 1)
+        digits = (keys >> KEY_DTYPE.type(field.shift)) & mask
+        lookup = field.codes if coded else field.names
+        cols[field.col] = lookup.values[digits]
+    return pd.DataFrame(cols, index=index)
+
+
+def join_on_conditions(left, right, on=None, **kwargs):
+    """Merge two transition tables on their packed condition keys.
+
+    Args:
+        left, right (:obj:`pandas.DataFrame`): Tables, each with `KEY_COL`.
+        on (list of str, optional): Additional columns to join on, e.g. the
+            start state column.
+        **kwargs: Passed to :meth:`pandas.DataFrame.merge`.
+    """
+    return left.merge(right, on=[KEY_COL] + list(on or []), **kwargs)
@@ -0,0 +1,354 @@
+"""
+cypher_views.py
+~~~~~~~~~~~~~~~
+
+Parse the Cypher files in the `views` directory.
+
+Each view file has a comment block describing it, which may include a
+`dependencies` section listing other view files (relative to the views
+directory, or `none`), followed by a JSON header giving the file's
+`priority`, then Cypher statements separated by semicolons, e.g.::
+
+    // dependencies:
+    //     abstract/LandCoverType_w.cql
+    // description:
+    //     ...
+
+    {
+      "priority": 1
+    }
+
+    MATCH ... ;
+
+This follows the format read by cymod's `CypherFile`. Views whose statements
+only merge or create a single node with literal properties, like those in
+`abstract/LandCoverType_w.cql`, can also be interpreted here without a
+database, see :func:`literal_node`.
+
+Pass a :obj:`ViewCache` to :func:`read_views` to only re-parse the files
+which have changed since the views were last read.
+"""
+import os
+import re
+import json
+import pickle
+import hashlib
+import logging
+from collections import OrderedDict
+
+VIEWS_SUFFIX = "_w"
+_COMMENT_SECTION_RE = re.compile(r"^\s*//\s*([\w ]+):\s*$")
+_COMMENT_LINE_RE = re.compile(r"^\s*//(.*)$")
+_LITERAL_NODE_RE = re.compile(
+    r"^(MERGE|CREATE)\s*\(\s*\w*\s*:\s*(\w+)\s*(\{.*\})\s*\)$", re.DOTALL)
+_PROPERTY_RE = re.compile(
+    r"""\s*(\w+)\s*:\s*("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|-?\d+\.\d*"""
+    r"""|-?\d+|true|false|null|\$\w+)\s*(?:,|$)""", re.IGNORECASE)
+
+
+def _strip_comments(text):
+    """Remove `//` comments from Cypher `text`, ignoring those in strings."""
+    out = []
+    quote = None
+    i = 0
+    while i < len(text):
+        c = text[i]
+        if quote:
+            out.append(c)
+            if c == "\\" and i + 1 < len(text):
+                out.append(text[i + 1])
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in "\"'":
+            quote = c
+            out.append(c)
+        elif text.startswith("//", i):
+            while i < len(text) and text[i] != "\n":
+                i += 1
+            continue
+        else:
+            out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def _split_statements(text):
+    """Split Cypher `text` on semicolons which aren't in strings."""
+    statements, current = [], []
+    quote = None
+    escaped = False
+    for c in text:
+        if quote:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == quote:
+                quote = None
+        elif c in "\"'":
+            quote = c
+        elif c == ";":
+            statements.append("".join(current))
+            current = []
+            continue
+        current.append(c)
+    statements.append("".join(current))
+    return [s.strip() for s in statements if s.strip()]
+
+
+def _split_header(text):
+    """Separate the leading JSON header in `text` from the Cypher after it."""
+    stripped = text.lstrip()
+    if not stripped.startswith("{"):
+        raise ValueError("View doesn't start with a JSON header")
+    depth = 0
+    for i, c in enumerate(stripped):
+        depth += {"{": 1, "}": -1}.get(c, 0)
+        if depth == 0:
+            return json.loads(stripped[:i + 1]), stripped[i + 1:]
+    raise ValueError("Unterminated JSON header")
+
+
+def parse_dependencies(text):
+    """Dependencies listed in the comment block of a view.
+
+    Returns:
+        list of str, or None: Paths of views the view depends on, relative
+            to the views directory. None if the view has no `dependencies`
+            section, an empty list if the section says `none`.
+    """
+    dependencies = None
+    for line in text.splitlines():
+        section = _COMMENT_SECTION_RE.match(line)
+        if section:
+            if dependencies is not None:
+                break
+            if section.group(1).strip().lower() == "dependencies":
+                dependencies = []
+            continue
+        comment = _COMMENT_LINE_RE.match(line)
+        if dependencies is None:
+            continue
+        if not comment:
+            break
+        entry = comment.group(1).strip()
+        if entry and not entry.startswith("="):
+            if entry.lower() != "none":
+                dependencies.append(entry)
+    return dependencies
+
+
+class CypherView(object):
+    """The parsed content of one view file."""
+
+    def __init__(self, path, name, priority, dependencies, statements):
+        """
+        Args:
+            path (str): Path to the view file.
+            name (str): Path relative to the views directory, using '/' as
+                the separator, as used to list dependencies.
+            priority (int): Priority from the file's JSON header.
+            dependencies (list of str): See :func:`parse_dependencies`.
+            statements (list of str): Cypher statements, without comments.
+        """
+        self.path = path
+        self.name = name
+        self.priority = priority
+        self.dependencies = dependencies
+        self.statements = statements
+
+    def __repr__(self):
+        return "CypherView({0!r}, priority={1})".format(self.name,
+                                                        self.priority)
+
+
+def view_name(path, views_dir):
+    """Name identifying the view at `path` within `views_dir`."""
+    return os.path.relpath(path, views_dir).replace(os.sep, "/")
+
+
+def parse_view_text(text, path, name):
+    """Parse the contents of a view file."""
+    try:
+        header, body = _split_header(_strip_comments(text))
+    except ValueError as e:
+        raise ValueError("Can't parse view {0}: {1}".format(path, e))
+    return CypherView(path, name, header.get("priority", 0),
+                      parse_dependencies(text), _split_statements(body))
+
+
+def parse_view(path, views_dir):
+    """Parse the view file at `path` in the views directory `views_dir`."""
+    with open(path) as f:
+        text = f.read()
+    return parse_view_text(text, path, view_name(path, views_dir))
+
+
+def find_view_files(views_dir, suffix=VIEWS_SUFFIX):
+    """Paths to the view files in `views_dir` with names ending in `suffix`.
+
+    Files are returned in a fixed order, sorted by their path.
+    """
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(views_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            root, ext = os.path.splitext(filename)
+            if ext == ".cql" and root.endswith(suffix):
+                paths.append(os.path.join(dirpath, filename))
+    return sorted(paths)
+
+
+class ViewCache(object):
+    """Parsed views, reused until their files change.
+
+    Entries are keyed by each file's absolute path and record its
+    modification time, size and the SHA-256 hash of its contents. A file
+    whose modification time and size are unchanged isn't read again. One
+    which has been touched is read and hashed, but only parsed again if its
+    contents have changed.
+
+    The cache can be saved to and loaded from a pickle file. Entries written
+    by a different `CACHE_VERSION` of this module are discarded.
+    """
+
+    CACHE_VERSION = 1
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str, optional): File to load the cache from, if it exists,
+                and to save it to. If not given the cache is only kept in
+                memory.
+        """
+        self.path = path
+        self.n_parsed = 0
+        self.n_reused = 0
+        self._entries = {}
+        if path and os.path.isfile(path):
+            try:
+                with open(path, "rb") as f:
+                    version, entries = pickle.load(f)
+                if version == self.CACHE_VERSION:
+                    self._entries = entries
+            except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+                logging.warning("Ignoring unreadable view cache " + path)
+
+    def view(self, path, views_dir):
+        """The parsed view at `path`, from the cache if it's unchanged."""
+        key = os.path.abspath(path)
+        name = view_name(path, views_dir)
+        stat = os.stat(path)
+        entry = self._entries.get(key)
+        if (entry is not None and entry["name"] == name
+                and entry["mtime_ns"] == stat.st_mtime_ns
+                and entry["size"] == stat.st_size):
+            self.n_reused += 1
+            return entry["view"]
+        with open(path, "rb") as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if entry is not None and entry["name"] == name \
+                and entry["sha256"] == digest:
+            self.n_reused += 1
+            view = entry["view"]
+        else:
+            self.n_parsed += 1
+            view = parse_view_text(content.decode(), path, name)
+        self._entries[key] = {"name": name, "mtime_ns": stat.st_mtime_ns,
+                              "size": stat.st_size, "sha256": digest,
+                              "view": view}
+        return view
+
+    def prune(self, paths):
+        """Forget cached files other than those in `paths`."""
+        keep = set(os.path.abspath(path) for path in paths)
+        for key in [k for k in self._entries if k not in keep]:
+            del self._entries[key]
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)),
+                    exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((self.CACHE_VERSION, self._entries), f)
+        os.replace(tmp_path, self.path)
+
+
+def read_views(views_dir, suffix=VIEWS_SUFFIX, cache=None):
+    """Parse every view in `views_dir`, ordered by priority then name.
+
+    Args:
+        cache (:obj:`ViewCache`, optional): Cache of previously parsed
+            views. Views are taken from it where their files haven't
+            changed, and it's updated with any which have and saved.
+    """
+    paths = find_view_files(views_dir, suffix)
+    if cache is None:
+        views = [parse_view(path, views_dir) for path in paths]
+    else:
+        views = [cache.view(path, views_dir) for path in paths]
+        cache.prune(paths)
+        cache.save()
+        logging.info("Parsed {0} views, {1} unchanged views read from cache"
+                     .format(cache.n_parsed, cache.n_reused))
+    return sorted(views, key=lambda v: (v.priority, v.name))
+
+
+def _literal_value(token, params):
+    if token.startswith("$"):
+        try:
+            return params[token[1:]]
+        except KeyError:
+            raise ValueError("No value given for parameter {0}".format(token))
+    if token[0] in "\"'":
+        return token[1:-1].encode().decode("unicode_escape")
+    lowered = token.lower()
+    if lowered in ("true", "false"):
+        return lowered == "true"
+    if lowered == "null":
+        return None
+    return float(token) if "." in token else int(token)
+
+
+def parse_property_map(text, params=None):
+    """Properties in a Cypher map literal such as ``{code:"Oak", num:8}``.
+
+    Values may be strings, numbers, booleans, null or parameters, whose
+    values are taken from `params`.
+
+    Raises:
+        ValueError: If the map contains anything else, e.g. expressions.
+    """
+    inner = text.strip()
+    if not (inner.startswith("{") and inner.endswith("}")):
+        raise ValueError("Not a map literal: {0}".format(text))
+    inner = inner[1:-1].strip()
+    props = OrderedDict()
+    pos = 0
+    while pos < len(inner):
+        match = _PROPERTY_RE.match(inner, pos)
+        if not match:
+            raise ValueError("Can't parse map literal: {0}".format(text))
+        props[match.group(1)] = _literal_value(match.group(2), params or {})
+        pos = match.end()
+    return props
+
+
+def literal_node(statement, params=None):
+    """Interpret a statement which merges or creates a single literal node.
+
+    Returns:
+        tuple or None: The node's label and an ordered dict of its
+            properties, or None if `statement` has any other form.
+    """
+    match = _LITERAL_NODE_RE.match(statement.strip())
+    if not match:
+        return None
+    try:
+        return match.group(2), parse_property_map(match.group(3), params)
+    except ValueError:
+        return None
@@ -0,0 +1,114 @@
+"""
+enum_translation.py
+~~~~~~~~~~~~~~~~~~~
+
+Translate whole columns of enum codes to human readable aliases, and back.
+
+Translating a transition table one cell at a time with something like
+``df[col].apply(lambda x: Enum(x).alias)`` calls the enum constructor once per
+cell. Here we instead build a small lookup table from the members of an enum
+(e.g. those in `constants.py`) once, and use it to translate an entire column
+in a single vectorised pass.
+"""
+import numpy as np
+import pandas as pd
+
+
+def _enum_lookup(trans_enum, alias_func=None):
+    """Codes and corresponding aliases for members of `trans_enum`.
+
+    Args:
+        trans_enum (:obj:`enum.EnumMeta`): Enum whose members have `value` and
+            `alias` attributes, e.g. those in `constants.py`.
+        alias_func (function, optional): Function applied to each member's
+            alias to give the value it should be translated to.
+
+    Returns:
+        tuple: A :obj:`pandas.Index` of member codes and a list of the
+            (optionally post-processed) aliases in the same order.
+    """
+    members = list(trans_enum)
+    codes = pd.Index([member.value for member in members])
+    aliases = [member.alias for member in members]
+    if alias_func:
+        aliases = [alias_func(alias) for alias in aliases]
+    return codes, aliases
+
+
+def _positions_or_raise(lookup_index, values, trans_enum, col_name, kind):
+    """Position of each value in `lookup_index`, raise if any are missing."""
+    positions = lookup_index.get_indexer(values)
+    if (positions == -1).any():
+        unknown = sorted(set(np.asarray(values)[positions == -1]), key=str)
+        raise ValueError("Unknown {0} {1} in column '{2}': {3}".format(
+            trans_enum.__name__, kind, col_name, unknown))
+    return positions
+
+
+def codes_to_aliases(values, trans_enum, alias_func=None,
+                     as_categorical=False, col_name=None):
+    """Replace each code in `values` with its alias in `trans_enum`.
+
+    Args:
+        values (array-like): Codes to translate, e.g. a
+            :obj:`pandas.Series` taken from a transition table.
+        trans_enum (:obj:`enum.EnumMeta`): Enum used for the translation.
+        alias_func (function, optional): Function applied to each member's
+            alias before it's used in the output. Applied once per enum
+            member rather than once per value.
+        as_categorical (bool, optional): If True return a
+            :obj:`pandas.Categorical` whose categories are the enum aliases.
+            Otherwise return an object :obj:`numpy.ndarray`.
+        col_name (str, optional): Name of the column being translated, used
+            in error messages.
+
+    Returns:
+        :obj:`numpy.ndarray` or :obj:`pandas.Categorical`: Translated values.
+
+    Raises:
+        ValueError: If any value in `values` is not a code in `trans_enum`.
+    """
+    codes, aliases = _enum_lookup(trans_enum, alias_func)
+    positions = _positions_or_raise(codes, values, trans_enum, col_name,
+                                    "code(s)")
+    if as_categorical:
+        return pd.Categorical.from_codes(positions, categories=aliases)
+    lookup = np.empty(len(aliases), dtype=object)
+    lookup[:] = aliases
+    return lookup[positions]
+
+
+def aliases_to_codes(values, trans_enum, col_name=None):
+    """Replace each alias in `values` with its code in `trans_enum`.
+
+    The inverse of :func:`codes_to_aliases` (without `alias_func`).
+
+    Raises:
+        ValueError: If any value in `values` is not an alias in `trans_enum`.
+    """
+    codes, aliases = _enum_lookup(trans_enum)
+    positions = _positions_or_raise(pd.Index(aliases), values, trans_enum,
+                                    col_name, "alias(es)")
+    return codes.values[positions]
+
+
+def translate_columns(df, col_enum_d, alias_func_d=None):
+    """Replace codes with aliases in several columns of a dataframe.
+
+    Args:
+        df (:obj:`pandas.DataFrame`): Dataframe containing columns to convert.
+        col_enum_d (dict): Map from column name to the enum used to translate
+            that column.
+        alias_func_d (dict, optional): Map from column name to a function to
+            apply to each enum alias for that column, see
+            :func:`codes_to_aliases`.
+
+    Returns:
+        :obj:`pandas.DataFrame`: `df`, with the translated columns.
+    """
+    alias_func_d = alias_func_d or {}
+    for col, trans_enum in col_enum_d.items():
+        df[col] = codes_to_aliases(df[col], trans_enum,
+                                   alias_func=alias_func_d.get(col),
+                                   col_name=col)
+    return df
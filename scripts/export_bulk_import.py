@@ -0,0 +1,409 @@
+"""
+export_bulk_import.py
+~~~~~~~~~~~~~~~~~~~~~
+
+Export the AgroSuccess graph as CSV files for `neo4j-admin import`.
+
+Building a new database with `neo4j-admin import` is much faster than
+running Cypher statements against a server, but only works for an empty
+database. This script writes
+
+- one `nodes_<label>.csv` file per node label,
+- a `relationships.csv` file of relationships without properties, and
+- a `relationships_<type>.csv` file for each type of relationship with
+  properties,
+
+in the import tool's header format, describing the same graph as
+`load_agrosuccess_model.py` makes. `LandCoverType`, `AgentType` and other
+nodes defined with literal properties in the `views` directory are taken
+from the views. The succession table gives the `SuccessionTrajectory` and
+`EnvironCondition` nodes, the `SOURCE`, `TARGET` and `CAUSES`
+relationships between them and the `TRANSITIONS_TO` relationships
+summarising transitions between states.
+
+View statements which do anything other than merge or create a single node
+with literal properties (e.g. the activities in `activities_w.cql`) can't be
+exported as CSV. They're written to `post_import.cql` in priority order, to
+be run against the database after importing, e.g. by piping the file into
+`cypher-shell`. The file ends by giving the model a load generation, as the
+other loaders do (see `graph_db.py`).
+
+Node IDs are made from the `model_ID` and the properties identifying each
+node, so exporting the same model twice gives the same files. Run
+:func:`verify_export` to compare the numbers of nodes and relationships in
+the files with those expected from the succession table, without a database.
+"""
+import os
+import sys
+import csv
+import json
+import hashlib
+import logging
+import argparse
+from collections import OrderedDict
+
+import pandas as pd
+
+from config import DIRS
+from cypher_views import literal_node, read_views
+from graph_db import load_generation_statement
+from succession_graph import (
+    DEFAULT_LABELS,
+    SUMMARY_REL_TYPE,
+    condition_columns,
+    read_succession_table,
+    succession_rows,
+    transition_summary_rows,
+)
+
+RELATIONSHIPS_FILE_NAME = "relationships.csv"
+POST_IMPORT_FILE_NAME = "post_import.cql"
+ID_SEP = "|"
+
+
+def node_id(model_id, label, key):
+    """Deterministic import ID of a node identified by `key`."""
+    return ID_SEP.join([str(model_id), label, str(key)])
+
+
+def _props_key(props):
+    """Key for a node without a `code` property, from all its properties."""
+    text = repr(sorted((k, repr(v)) for k, v in props.items()))
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def nodes_file_name(label):
+    return "nodes_{0}.csv".format(label)
+
+
+def relationships_file_name(rel_type):
+    """Name of the file for relationships of `rel_type` with properties."""
+    return "relationships_{0}.csv".format(rel_type)
+
+
+def relationship_files(out_dir):
+    """Paths of the relationship files in `out_dir`."""
+    return [os.path.join(out_dir, f) for f in sorted(os.listdir(out_dir))
+            if f.startswith("relationships") and f.endswith(".csv")]
+
+
+class BulkImportGraph(object):
+    """Nodes and relationships to write out for `neo4j-admin import`."""
+
+    def __init__(self, model_id):
+        self.model_id = model_id
+        # label -> OrderedDict of node ID -> properties
+        self.nodes = OrderedDict()
+        # (start ID, end ID, type) triples
+        self.relationships = []
+        # type -> list of (start ID, end ID, properties) triples
+        self.property_relationships = OrderedDict()
+
+    def has_node(self, label, key):
+        return node_id(self.model_id, label, key) in self.nodes.get(label, {})
+
+    def add_node(self, label, key, props):
+        """Add a node unless one with the same label and key exists.
+
+        As with a `MERGE`, the properties of an existing node are kept.
+
+        Returns:
+            str: The node's ID.
+        """
+        nid = node_id(self.model_id, label, key)
+        self.nodes.setdefault(label, OrderedDict()).setdefault(nid, props)
+        return nid
+
+    def add_relationship(self, start_id, end_id, rel_type, props=None):
+        if props:
+            self.property_relationships.setdefault(rel_type, []).append(
+                (start_id, end_id, props))
+        else:
+            self.relationships.append((start_id, end_id, rel_type))
+
+
+def add_view_nodes(graph, views, params):
+    """Add nodes defined by literal statements in `views` to `graph`.
+
+    Returns:
+        list of tuple: Name of the view and statement for each statement
+            which couldn't be added.
+    """
+    skipped = []
+    for view in views:
+        for statement in view.statements:
+            node = literal_node(statement, params)
+            if node is None:
+                skipped.append((view.name, statement))
+                continue
+            label, props = node
+            key = props["code"] if "code" in props else _props_key(props)
+            graph.add_node(label, key, props)
+    return skipped
+
+
+def add_succession_table(graph, df, start_col, end_col, params, labels=None):
+    """Add the nodes and relationships for transition table `df` to `graph`.
+
+    States not already in the graph are added with only their `code` and the
+    global parameters as properties, as cymod's `MERGE` statements would.
+    Conditions are identified by their `transID`.
+    """
+    labels = dict(DEFAULT_LABELS, **(labels or {}))
+    cond_cols = condition_columns(df, start_col, end_col)
+    for i, row in enumerate(succession_rows(df, start_col, end_col)):
+        start_id, end_id = [
+            graph.add_node(labels["State"], row[k], OrderedDict(
+                [("code", row[k])] + list(params.items())))
+            for k in ("start", "end")]
+        trans_key = "{0}->{1}".format(row["start"], row["end"])
+        is_new = not graph.has_node(labels["Transition"], trans_key)
+        trans_id = graph.add_node(labels["Transition"], trans_key,
+                                  OrderedDict(params))
+        if is_new:
+            graph.add_relationship(trans_id, start_id, "SOURCE")
+            graph.add_relationship(trans_id, end_id, "TARGET")
+        cond_props = OrderedDict([(c, row[c]) for c in cond_cols]
+                                 + list(params.items()))
+        cond_id = graph.add_node(labels["Condition"], row.get("transID", i),
+                                 cond_props)
+        graph.add_relationship(cond_id, trans_id, "CAUSES")
+
+
+def add_transition_summary(graph, df, start_col, end_col, params,
+                           labels=None):
+    """Add a `TRANSITIONS_TO` relationship for each transition in `df`.
+
+    Must be called after :func:`add_succession_table`, which adds the states.
+    """
+    labels = dict(DEFAULT_LABELS, **(labels or {}))
+    for row in transition_summary_rows(df, start_col, end_col):
+        start_id, end_id = [node_id(graph.model_id, labels["State"], row[k])
+                            for k in ("start", "end")]
+        graph.add_relationship(start_id, end_id, SUMMARY_REL_TYPE, OrderedDict(
+            [("min_delta_t", row["min_delta_t"]),
+             ("max_delta_t", row["max_delta_t"])] + list(params.items())))
+
+
+def _import_type(values):
+    """`neo4j-admin import` type suffix for a column of Python values."""
+    types = set(type(v) for v in values if v is not None)
+    if types == {bool}:
+        return ":boolean"
+    if types and types <= {int}:
+        return ":long"
+    if types and types <= {int, float}:
+        return ":double"
+    return ""
+
+
+def _format_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def write_nodes(path, label, nodes):
+    """Write the nodes with `label` to a CSV file with an import header.
+
+    Args:
+        nodes (dict): Mapping from node ID to a dict of its properties.
+    """
+    keys = []
+    for props in nodes.values():
+        keys += [k for k in props if k not in keys]
+    columns = [[props.get(k) for props in nodes.values()] for k in keys]
+    header = [":ID"] + [k + _import_type(col)
+                        for k, col in zip(keys, columns)] + [":LABEL"]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for nid, props in nodes.items():
+            writer.writerow([nid] + [_format_value(props.get(k))
+                                     for k in keys] + [label])
+
+
+def write_relationships(path, relationships):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([":START_ID", ":END_ID", ":TYPE"])
+        writer.writerows(relationships)
+
+
+def write_property_relationships(path, rel_type, relationships):
+    """Write relationships with properties to a CSV file with an import header.
+
+    Args:
+        relationships (list of tuple): Start ID, end ID and dict of
+            properties of each relationship.
+    """
+    keys = []
+    for _, _, props in relationships:
+        keys += [k for k in props if k not in keys]
+    header = [":START_ID", ":END_ID"] + [
+        k + _import_type([props.get(k) for _, _, props in relationships])
+        for k in keys] + [":TYPE"]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for start_id, end_id, props in relationships:
+            writer.writerow([start_id, end_id] + [_format_value(props.get(k))
+                                                  for k in keys] + [rel_type])
+
+
+def write_post_import(path, skipped, params):
+    """Write statements which couldn't be exported as CSV to a Cypher file.
+
+    The file starts by setting the global parameters, so it can be piped
+    into `cypher-shell`, and ends by marking the model as loaded.
+    """
+    with open(path, "w") as f:
+        for key, value in params.items():
+            f.write(":param {0} => {1}\n".format(key, json.dumps(value)))
+        f.write("\n")
+        for name, statement in skipped:
+            f.write("// from: {0}\n{1};\n\n".format(name, statement))
+        f.write("// mark model as loaded\n{0};\n".format(
+            load_generation_statement(params)))
+
+
+def export_graph(graph, out_dir, skipped=(), params=None):
+    """Write `graph` to files in `out_dir`.
+
+    Args:
+        skipped (list of tuple): View names and statements to write to the
+            post import Cypher file, see :func:`add_view_nodes`.
+        params (dict, optional): Global parameters used by `skipped`.
+
+    Returns:
+        list of str: Paths of the node files written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    node_files = []
+    for label, nodes in graph.nodes.items():
+        path = os.path.join(out_dir, nodes_file_name(label))
+        write_nodes(path, label, nodes)
+        node_files.append(path)
+    write_relationships(os.path.join(out_dir, RELATIONSHIPS_FILE_NAME),
+                        graph.relationships)
+    for rel_type, rels in graph.property_relationships.items():
+        write_property_relationships(
+            os.path.join(out_dir, relationships_file_name(rel_type)),
+            rel_type, rels)
+    write_post_import(os.path.join(out_dir, POST_IMPORT_FILE_NAME), skipped,
+                      params or {})
+    return node_files
+
+
+def export_model(views_dir, succession_path, params, out_dir,
+                 start_col="start", end_col="delta_D", labels=None):
+    """Export the graph for the model with global parameters `params`.
+
+    Returns:
+        list of str: Paths of the node files written.
+    """
+    graph = BulkImportGraph(params["model_ID"])
+    skipped = add_view_nodes(graph, read_views(views_dir), params)
+    df = read_succession_table(succession_path)
+    add_succession_table(graph, df, start_col, end_col, params, labels)
+    add_transition_summary(graph, df, start_col, end_col, params, labels)
+    logging.info("{0} view statements written to {1} to run after import"
+                 .format(len(skipped), POST_IMPORT_FILE_NAME))
+    return export_graph(graph, out_dir, skipped, params)
+
+
+def import_command(out_dir, node_files, database="graph.db"):
+    """`neo4j-admin import` command line for the exported files."""
+    args = ["neo4j-admin", "import", "--database=" + database]
+    args += ["--nodes=" + path for path in node_files]
+    args += ["--relationships=" + path for path in relationship_files(out_dir)]
+    return " ".join(args)
+
+
+def export_counts(out_dir):
+    """Count the nodes by label and relationships by type in exported files.
+
+    Returns:
+        tuple: Dict of node counts by label, dict of relationship counts by
+            type, and a list of problems found, e.g. duplicate node IDs or
+            relationships whose end nodes aren't in any node file.
+    """
+    node_counts, problems = {}, []
+    ids = set()
+    for filename in sorted(os.listdir(out_dir)):
+        if not (filename.startswith("nodes_") and filename.endswith(".csv")):
+            continue
+        nodes = pd.read_csv(os.path.join(out_dir, filename), dtype=str,
+                            keep_default_na=False)
+        for label, count in nodes[":LABEL"].value_counts().items():
+            node_counts[label] = node_counts.get(label, 0) + count
+        file_ids = set(nodes[":ID"])
+        if len(file_ids) < len(nodes.index) or file_ids & ids:
+            problems.append("Duplicate node IDs in " + filename)
+        ids |= file_ids
+    rels = pd.concat([pd.read_csv(path, dtype=str, keep_default_na=False,
+                                  usecols=[":START_ID", ":END_ID", ":TYPE"])
+                      for path in relationship_files(out_dir)])
+    dangling = ~rels[":START_ID"].isin(ids) | ~rels[":END_ID"].isin(ids)
+    if dangling.any():
+        problems.append("{0} relationships with missing end nodes"
+                        .format(dangling.sum()))
+    return node_counts, rels[":TYPE"].value_counts().to_dict(), problems
+
+
+def verify_export(out_dir, df, start_col="start", end_col="delta_D",
+                  labels=None):
+    """Check exported files against the succession table they came from.
+
+    Returns:
+        list of str: Description of each discrepancy. Empty if the files
+            contain the expected numbers of nodes and relationships.
+    """
+    labels = dict(DEFAULT_LABELS, **(labels or {}))
+    node_counts, rel_counts, problems = export_counts(out_dir)
+    n_trans = len(df[[start_col, end_col]].drop_duplicates().index)
+    n_states = len(set(df[start_col]) | set(df[end_col]))
+    expected = [
+        ("{0} nodes".format(labels["Condition"]),
+         node_counts.get(labels["Condition"], 0), len(df.index)),
+        ("{0} nodes".format(labels["Transition"]),
+         node_counts.get(labels["Transition"], 0), n_trans),
+        ("SOURCE relationships", rel_counts.get("SOURCE", 0), n_trans),
+        ("TARGET relationships", rel_counts.get("TARGET", 0), n_trans),
+        ("CAUSES relationships", rel_counts.get("CAUSES", 0), len(df.index)),
+        ("{0} relationships".format(SUMMARY_REL_TYPE),
+         rel_counts.get(SUMMARY_REL_TYPE, 0), n_trans),
+    ]
+    for what, actual, wanted in expected:
+        if actual != wanted:
+            problems.append("Expected {0} {1}, found {2}"
+                            .format(wanted, what, actual))
+    if node_counts.get(labels["State"], 0) < n_states:
+        problems.append("Expected at least {0} {1} nodes, found {2}".format(
+            n_states, labels["State"], node_counts.get(labels["State"], 0)))
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[4])
+    parser.add_argument("--params", default=os.path.join(
+        DIRS["scripts"], "..", "global_parameters.json"))
+    parser.add_argument("--views", default=os.path.join(
+        DIRS["scripts"], "..", "views"))
+    parser.add_argument("--table", default=os.path.join(
+        DIRS["data"]["created"], "agrosuccess_succession.csv"))
+    parser.add_argument("--out-dir", default=os.path.join(
+        DIRS["data"]["tmp"], "bulk_import"))
+    args = parser.parse_args()
+
+    with open(args.params) as f:
+        PARAMS = json.load(f)
+    NODE_FILES = export_model(args.views, args.table, PARAMS, args.out_dir)
+    PROBLEMS = verify_export(args.out_dir, read_succession_table(args.table))
+    for problem in PROBLEMS:
+        print(problem)
+    print(import_command(args.out_dir, NODE_FILES))
+    if PROBLEMS:
+        sys.exit(1)
@@ -0,0 +1,178 @@
+"""
+generate_trans_table.py
+~~~~~~~~~~~~~~~~~~~~~~~
+
+Generate synthetic transition tables shaped like the Millington 2009 table.
+
+Rows are built from the Cartesian product of every start state in
+`MillingtonPaperLct` with every combination of the condition enums in
+`constants.py`. As in the real table, holm oak with pasture only appears
+with regeneration succession and cropland only with secondary succession.
+End states are assigned by simple deterministic rules chosen so that the
+table satisfies the same invariants as the real one (e.g. nothing
+transitions to cropland, urban isn't the only route to any other state),
+so it can be passed through `repurpose_trans_rules_agrosuccess.py`.
+
+Larger tables are made by stacking scenario variants of this base table,
+identified by a `scenario` column, whose transition times are randomly
+perturbed. The data is only meant for testing and benchmarking; it isn't
+ecologically meaningful.
+"""
+import os
+import math
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from constants import (
+    Succession,
+    Aspect,
+    SeedPresence,
+    Water,
+    MillingtonPaperLct as MLct,
+)
+
+COND_ENUMS = [
+    ("succession", Succession),
+    ("aspect", Aspect),
+    ("pine", SeedPresence),
+    ("oak", SeedPresence),
+    ("deciduous", SeedPresence),
+    ("water", Water),
+]
+COLUMNS = (["start"] + [col for col, _ in COND_ENUMS]
+           + ["delta_D", "delta_T"])
+SCENARIO_COL = "scenario"
+
+
+def condition_product():
+    """Every combination of condition codes, one row per combination."""
+    rows = itertools.product(*[[m.value for m in e] for _, e in COND_ENUMS])
+    return pd.DataFrame(list(rows), columns=[col for col, _ in COND_ENUMS])
+
+
+def _end_states(start, c):
+    """End state codes and transition times for rows with given start state.
+
+    Args:
+        start (:obj:`MillingtonPaperLct`): Start state of every row.
+        c (:obj:`pandas.DataFrame`): Condition codes, one row per transition.
+
+    Returns:
+        tuple of :obj:`numpy.ndarray`: End state codes and transition times.
+    """
+    n = len(c.index)
+    pine, oak, dec = c["pine"].values, c["oak"].values, c["deciduous"].values
+    water, aspect = c["water"].values, c["aspect"].values
+    stay = np.full(n, start.value)
+    if start in (MLct.PASTURE, MLct.HOLM_OAK_W_PASTURE, MLct.CROPLAND):
+        end, time = np.full(n, MLct.SCRUBLAND.value), 3 + water
+    elif start == MLct.SCRUBLAND:
+        options = np.array([MLct.SCRUBLAND.value, MLct.PINE.value,
+                            MLct.HOLM_OAK.value, MLct.DECIDUOUS.value,
+                            MLct.TRANSITION_FOREST.value, MLct.PASTURE.value])
+        end = options[(pine + 2 * oak + dec + water + aspect) % len(options)]
+        time = 10 + water
+    elif start == MLct.BURNT:
+        end = np.where(pine == 0, MLct.SCRUBLAND.value, MLct.PINE.value)
+        time = np.full(n, 2)
+    elif start == MLct.PINE:
+        end = np.where((oak == 1) & (water > 0),
+                       MLct.TRANSITION_FOREST.value, stay)
+        time = np.full(n, 20)
+    elif start == MLct.TRANSITION_FOREST:
+        end = np.where(oak == 1, MLct.HOLM_OAK.value,
+                       np.where(dec == 1, MLct.DECIDUOUS.value, stay))
+        time = 25 + aspect
+    elif start == MLct.URBAN:
+        end = np.where(water > 0, stay, MLct.SCRUBLAND.value)
+        time = np.full(n, 1)
+    else:
+        end, time = stay, np.zeros(n)
+    time = np.where(end == start.value, 0, time)
+    return end, time
+
+
+def generate_base_table():
+    """One synthetic Millington-shaped table (a single scenario).
+
+    Returns:
+        :obj:`pandas.DataFrame`: Coded table with the same columns as
+            `millington_succession.csv`.
+    """
+    conds = condition_product()
+    tables = []
+    for start in MLct:
+        c = conds
+        if start == MLct.HOLM_OAK_W_PASTURE:
+            c = conds[conds["succession"] == Succession.REGENERATION.value]
+        elif start == MLct.CROPLAND:
+            c = conds[conds["succession"] == Succession.SECONDARY.value]
+        end, time = _end_states(start, c)
+        table = c.copy()
+        table.insert(0, "start", start.value)
+        table["delta_D"] = end
+        table["delta_T"] = time.astype(int)
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)[COLUMNS]
+
+
+def generate_millington_table(n_scenarios=1, seed=0, max_time_shift=5):
+    """Stack `n_scenarios` variants of the base table.
+
+    The first scenario is the base table itself. In the others, each
+    transition which changes state has its time shifted by a random number
+    of years in [0, `max_time_shift`].
+
+    Args:
+        n_scenarios (int, optional): Number of variants to stack.
+        seed (int, optional): Seed for the random time perturbations.
+        max_time_shift (int, optional): Largest perturbation, in years.
+
+    Returns:
+        :obj:`pandas.DataFrame`: Table with an additional `scenario` column
+            if `n_scenarios` is greater than 1.
+    """
+    base = generate_base_table()
+    if n_scenarios == 1:
+        return base
+    rng = np.random.RandomState(seed)
+    changes_state = (base["start"] != base["delta_D"]).values
+    variants = []
+    for scenario in range(n_scenarios):
+        variant = base.copy()
+        if scenario > 0:
+            shift = rng.randint(0, max_time_shift + 1, size=len(base.index))
+            variant["delta_T"] += np.where(changes_state, shift, 0)
+        variant[SCENARIO_COL] = scenario
+        variants.append(variant)
+    return pd.concat(variants, ignore_index=True)
+
+
+def generate_millington_table_of_size(n_rows, seed=0):
+    """Smallest stack of scenario variants with at least `n_rows` rows."""
+    n_base = len(generate_base_table().index)
+    return generate_millington_table(max(1, math.ceil(n_rows / n_base)),
+                                     seed=seed)
+
+
+def iter_scenarios(df):
+    """Yield the table for each scenario in a (possibly) stacked table."""
+    if SCENARIO_COL not in df.columns:
+        yield df
+        return
+    for _, scenario_df in df.groupby(SCENARIO_COL, sort=False):
+        yield scenario_df.drop(columns=SCENARIO_COL)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[4])
+    parser.add_argument("out_file", help="Path to write the csv table to.")
+    parser.add_argument("--rows", type=int, default=1,
+                        help="Minimum number of rows to generate.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    df = generate_millington_table_of_size(args.rows, seed=args.seed)
+    df.to_csv(os.path.abspath(args.out_file), index=False)
@@ -0,0 +1,125 @@
+"""
+graph_db.py
+~~~~~~~~~~~
+
+Connect to the Neo4j database and run statements against it.
+
+Cymod's `ServerGraphLoader` doesn't expose its driver, so scripts needing to
+send their own statements (e.g. batched loads) open a driver here, using the
+same credentials and default address as the container made by
+`create-container.sh`. The `neo4j` package is a dependency of cymod, and is
+only imported when a connection is made.
+
+Each loader finishes by calling :func:`mark_model_loaded`, which gives the
+model a new load generation, stored on a `ModelLoad` node with the model's
+global parameters. Refreshing the model deletes this node along with the
+model's other nodes. So other processes, e.g. ones caching query answers,
+can tell if a model has been reloaded by reading its generation with
+:func:`read_load_generation`.
+"""
+import threading
+from contextlib import contextmanager
+
+from statement_profiling import get_profiler
+
+DEFAULT_URI = "bolt://localhost:7687"
+LOAD_LABEL = "ModelLoad"
+
+
+def connect(user, password, uri=DEFAULT_URI):
+    """Open a driver for the Neo4j server at `uri`.
+
+    Returns:
+        :obj:`neo4j.Driver`: Call its `session` method to open sessions, and
+            `close` when finished.
+    """
+    from neo4j import GraphDatabase
+    return GraphDatabase.driver(uri, auth=(user, password))
+
+
+def run_statement(session, statement, parameters=None, source=None, index=0):
+    """Run `statement` in `session`, waiting for it to complete.
+
+    If a :obj:`statement_profiling.StatementProfiler` has been set, the
+    statement's cost is recorded against `source` and `index`.
+
+    Args:
+        source (str, optional): Where the statement came from, e.g. the name
+            of a view.
+        index (int, optional): Position of the statement within `source`.
+
+    Returns:
+        Summary of the statement's result, including its counters.
+    """
+    profiler = get_profiler()
+    if profiler is not None:
+        return profiler.run(session, statement, parameters or {}, source,
+                            index)
+    return session.run(statement, parameters or {}).consume()
+
+
+def refresh_graph(driver, global_params):
+    """Delete every node whose properties match all of `global_params`.
+
+    Equivalent to cymod's `ServerGraphLoader.refresh_graph`, but with the
+    values passed as parameters.
+    """
+    where = " AND ".join("n.`{0}` = ${0}".format(k) for k in global_params)
+    with driver.session() as session:
+        return run_statement(session,
+                             "MATCH (n) WHERE {0} DETACH DELETE n"
+                             .format(where), global_params)
+
+
+def _load_node(global_params):
+    return "(m:`{0}` {{{1}}})".format(LOAD_LABEL, ", ".join(
+        "`{0}`:${0}".format(k) for k in global_params))
+
+
+def load_generation_statement(global_params):
+    """Statement giving the model a new, random, load generation."""
+    return ("MERGE {0}\nSET m.generation = randomUUID(), "
+            "m.loaded_at = timestamp()".format(_load_node(global_params)))
+
+
+def mark_model_loaded(driver, global_params):
+    """Record that the model with `global_params` has been (re)loaded."""
+    with driver.session() as session:
+        return run_statement(session,
+                             load_generation_statement(global_params),
+                             global_params, source="mark_model_loaded")
+
+
+def read_load_generation(session, global_params):
+    """The model's current load generation.
+
+    Returns:
+        str: Or None if the model isn't loaded, or is being reloaded.
+    """
+    records = list(session.run(
+        "MATCH {0}\nRETURN m.generation AS generation".format(
+            _load_node(global_params)), global_params))
+    return records[0]["generation"] if records else None
+
+
+class SessionPool(object):
+    """Wrapper around a driver limiting how many sessions are open at once.
+
+    Has the same `session` method as a driver, so can be passed in its
+    place. Opening a session blocks until one of the pool's sessions is
+    closed if `max_sessions` are already open.
+    """
+
+    def __init__(self, driver, max_sessions):
+        self.driver = driver
+        self.max_sessions = max_sessions
+        self._semaphore = threading.BoundedSemaphore(max_sessions)
+
+    @contextmanager
+    def session(self, **kwargs):
+        with self._semaphore:
+            with self.driver.session(**kwargs) as session:
+                yield session
+
+    def close(self):
+        self.driver.close()
@@ -0,0 +1,295 @@
+"""
+incremental_reload.py
+~~~~~~~~~~~~~~~~~~~~~
+
+Update the succession part of a loaded model to match a new table.
+
+Rather than deleting every node with the model's `model_ID` and loading the
+whole model again, we
+
+1. identify each `Transition` by its start and end state codes, and each
+   `Condition` by its natural key, the codes of the states of the
+   transition it causes and its condition properties, then fingerprint all
+   of each condition's properties, for the new table,
+2. read the same information for the model's nodes already in the graph,
+   with one statement for conditions and one for transitions,
+3. work out which transitions and conditions must be created, updated or
+   deleted,
+4. apply only those changes, with one batched statement per kind of change,
+   and
+5. if anything changed, rebuild the `TRANSITIONS_TO` summary and give the
+   model a new load generation, see :func:`transition_queries.model_reloaded`.
+
+Conditions in the table and the graph are matched up by their natural key.
+The `transID` and transition time aren't part of it, they're properties
+which are updated in place. So inserting or removing one rule creates or
+deletes one condition, and only updates the `transID` of the rules after
+it, rather than deleting and recreating them. Reloading an unchanged table
+reads the graph but writes nothing, and leaves cached query answers in place.
+
+Only nodes made from the succession table are compared. Views are not
+reloaded, so a model whose views have changed should be refreshed and loaded
+in full.
+"""
+import hashlib
+import logging
+from collections import OrderedDict
+
+from graph_db import run_statement
+from instrumentation import instrumented
+from statement_profiling import table_source
+from transition_queries import reloading_model
+from succession_graph import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_LABELS,
+    TIME_COL,
+    condition_columns,
+    iter_batches,
+    load_transition_summary,
+    property_map,
+    quote_name,
+    succession_rows,
+)
+
+ID_COL = "transID"
+# Condition properties which are updated in place rather than identifying
+# the condition
+PAYLOAD_COLS = (ID_COL, TIME_COL)
+
+
+def condition_fingerprint(trans_key, props):
+    """Digest identifying a condition's properties and its transition."""
+    text = repr((tuple(trans_key), sorted((k, repr(v))
+                                          for k, v in props.items())))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def natural_key(trans_key, props):
+    """Key matching a condition in the table with one in the graph.
+
+    Args:
+        trans_key (tuple): (start, end) state codes of the condition's
+            transition.
+        props (dict): The condition's properties. Those in `PAYLOAD_COLS`
+            are ignored.
+    """
+    return tuple(trans_key) + tuple(sorted(
+        (k, v) for k, v in props.items() if k not in PAYLOAD_COLS))
+
+
+class ModelState(object):
+    """The transitions and conditions making up a model's succession rules.
+
+    Attributes:
+        transitions (set of tuple): (start, end) state code pairs.
+        conditions (dict): Maps each condition's :func:`natural_key` to a
+            tuple of its properties and its fingerprint.
+        node_ids (dict): For state read from the graph, maps natural keys
+            to the internal ID of each condition node.
+        orphans (list of int): Internal IDs of condition nodes which can't be
+            matched with a row in a table, i.e. duplicates or conditions not
+            linked to a transition.
+    """
+
+    def __init__(self):
+        self.transitions = set()
+        self.conditions = {}
+        self.node_ids = {}
+        self.orphans = []
+
+    def add_condition(self, trans_key, props, node_id=None):
+        key = natural_key(trans_key, props)
+        if key in self.conditions:
+            raise ValueError("Duplicate condition {0}".format(key))
+        self.conditions[key] = (props, condition_fingerprint(trans_key,
+                                                             props))
+        if node_id is not None:
+            self.node_ids[key] = node_id
+
+
+def table_state(df, start_col, end_col, global_params):
+    """The :obj:`ModelState` a transition table should produce."""
+    if ID_COL not in df.columns:
+        raise ValueError("Table must have a '{0}' column to number "
+                         "conditions".format(ID_COL))
+    state = ModelState()
+    cond_cols = condition_columns(df, start_col, end_col)
+    for row in succession_rows(df, start_col, end_col):
+        trans_key = (row["start"], row["end"])
+        props = OrderedDict([(c, row[c]) for c in cond_cols]
+                            + list(global_params.items()))
+        state.transitions.add(trans_key)
+        state.add_condition(trans_key, props)
+    return state
+
+
+def _labels(labels):
+    d = dict(DEFAULT_LABELS, **(labels or {}))
+    return {k: quote_name(v) for k, v in d.items()}
+
+
+def read_graph_state(session, global_params, labels=None):
+    """Read the :obj:`ModelState` of a model loaded in the graph.
+
+    Args:
+        session: Open Neo4j session.
+        global_params (dict): Global parameters identifying the model.
+        labels (dict, optional): Labels to use in place of those in
+            `succession_graph.DEFAULT_LABELS`.
+    """
+    labels = _labels(labels)
+    gp = property_map([], global_params)
+    state = ModelState()
+    transitions = session.run(
+        "MATCH (s:{State})<-[:SOURCE]-(t:{Transition} {gp})-[:TARGET]->"
+        "(e:{State})\nRETURN DISTINCT s.code AS start, e.code AS end"
+        .format(gp=gp, **labels), global_params)
+    for record in transitions:
+        state.transitions.add((record["start"], record["end"]))
+
+    conditions = session.run(
+        "MATCH (c:{Condition} {gp})\n"
+        "OPTIONAL MATCH (c)-[:CAUSES]->(t:{Transition} {gp})\n"
+        "OPTIONAL MATCH (s:{State})<-[:SOURCE]-(t)-[:TARGET]->(e:{State})\n"
+        "RETURN id(c) AS node_id, properties(c) AS props, "
+        "s.code AS start, e.code AS end".format(gp=gp, **labels),
+        global_params)
+    for record in conditions:
+        trans_key = (record["start"], record["end"])
+        if (record["start"] is None
+                or natural_key(trans_key, record["props"])
+                in state.conditions):
+            state.orphans.append(record["node_id"])
+            continue
+        state.add_condition(trans_key, record["props"], record["node_id"])
+    return state
+
+
+class GraphDiff(object):
+    """Changes needed to turn one :obj:`ModelState` into another."""
+
+    def __init__(self, current, desired):
+        self.create_transitions = sorted(desired.transitions
+                                         - current.transitions)
+        self.delete_transitions = sorted(current.transitions
+                                         - desired.transitions)
+        self.delete_conditions = list(current.orphans)
+        self.update_conditions = []
+        self.create_conditions = []
+        for key, (props, fp) in desired.conditions.items():
+            if key not in current.conditions:
+                self.create_conditions.append(
+                    {"start": key[0], "end": key[1], "props": dict(props)})
+            elif fp != current.conditions[key][1]:
+                self.update_conditions.append(
+                    {"node_id": current.node_ids[key], "props": dict(props)})
+        self.delete_conditions += [
+            current.node_ids[key] for key in current.conditions
+            if key not in desired.conditions]
+
+    def counts(self):
+        """Number of changes of each kind."""
+        return OrderedDict([
+            ("create_transitions", len(self.create_transitions)),
+            ("delete_conditions", len(self.delete_conditions)),
+            ("update_conditions", len(self.update_conditions)),
+            ("create_conditions", len(self.create_conditions)),
+            ("delete_transitions", len(self.delete_transitions)),
+        ])
+
+    @property
+    def is_empty(self):
+        return not any(self.counts().values())
+
+
+def diff_statements(global_params, labels=None):
+    """Statement applying each kind of change in a :obj:`GraphDiff`.
+
+    Each statement takes the changes of its kind as the `$rows` parameter.
+    Statements are given in the order they should be run.
+    """
+    fmt = dict(_labels(labels),
+               gp=property_map([], global_params),
+               start=property_map([("code", "start")], global_params),
+               end=property_map([("code", "end")], global_params))
+    match_transition = ("MATCH (s:{State} {start})<-[:SOURCE]-"
+                        "(t:{Transition} {gp})-[:TARGET]->(e:{State} {end})")
+    statements = OrderedDict([
+        ("create_transitions",
+         "UNWIND $rows AS row\n"
+         "MERGE (s:{State} {start})\n"
+         "MERGE (e:{State} {end})\n"
+         "CREATE (s)<-[:SOURCE]-(t:{Transition} {gp})-[:TARGET]->(e)"),
+        ("delete_conditions",
+         "UNWIND $rows AS row\n"
+         "MATCH (c) WHERE id(c) = row\n"
+         "DETACH DELETE c"),
+        ("update_conditions",
+         "UNWIND $rows AS row\n"
+         "MATCH (c) WHERE id(c) = row.node_id\n"
+         "SET c = row.props"),
+        ("create_conditions",
+         "UNWIND $rows AS row\n"
+         + match_transition + "\n"
+         "CREATE (c:{Condition})-[:CAUSES]->(t)\n"
+         "SET c = row.props"),
+        ("delete_transitions",
+         "UNWIND $rows AS row\n"
+         + match_transition + "\n"
+         "DETACH DELETE t"),
+    ])
+    return OrderedDict((kind, statement.format(**fmt))
+                       for kind, statement in statements.items())
+
+
+def apply_diff(driver, diff, global_params, labels=None,
+               batch_size=DEFAULT_BATCH_SIZE):
+    """Run the statements needed to apply `diff` to the graph."""
+    rows_d = {
+        "create_transitions": [{"start": s, "end": e}
+                               for s, e in diff.create_transitions],
+        "delete_conditions": diff.delete_conditions,
+        "update_conditions": diff.update_conditions,
+        "create_conditions": diff.create_conditions,
+        "delete_transitions": [{"start": s, "end": e}
+                               for s, e in diff.delete_transitions],
+    }
+    for kind, statement in diff_statements(global_params, labels).items():
+        for i, batch in enumerate(iter_batches(rows_d[kind], batch_size)):
+            with instrumented("incremental:" + kind, rows_in=len(batch)):
+                with driver.session() as session:
+                    run_statement(session, statement,
+                                  dict(global_params, rows=batch),
+                                  source=table_source("incremental:" + kind,
+                                                      i * batch_size,
+                                                      len(batch)))
+
+
+def incremental_reload(driver, df, start_col, end_col, global_params,
+                       labels=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Change the model's graph to match transition table `df`.
+
+    If the graph already matches, nothing is written. Otherwise the model's
+    `TRANSITIONS_TO` summary is rebuilt once the changes are applied, and
+    then the model is marked as reloaded.
+
+    Returns:
+        :obj:`GraphDiff`: The changes made.
+    """
+    desired = table_state(df, start_col, end_col, global_params)
+    with instrumented("incremental:read_graph_state"):
+        with driver.session() as session:
+            current = read_graph_state(session, global_params, labels)
+    if not current.transitions and not current.conditions:
+        logging.warning("No succession rules found in graph for {0}. Views "
+                        "won't be loaded by an incremental reload."
+                        .format(global_params))
+    diff = GraphDiff(current, desired)
+    logging.info("Incremental reload changes: {0}".format(
+        dict(diff.counts())))
+    if not diff.is_empty:
+        with reloading_model(driver, global_params):
+            apply_diff(driver, diff, global_params, labels, batch_size)
+            load_transition_summary(driver, df, start_col, end_col,
+                                    global_params, labels=labels)
+    return diff
@@ -0,0 +1,147 @@
+"""
+instrumentation.py
+~~~~~~~~~~~~~~~~~~
+
+Record how long each stage of a script takes and how much memory it uses.
+
+Wrap a stage in the :func:`instrumented` context manager, or decorate a
+function with :func:`instrument`, and a record containing
+
+- the stage name and a run identifier shared by all stages in a process,
+- wall and CPU time in seconds,
+- the process's peak resident set size (RSS) so far, in MB, and
+- the number of rows in the stage's input and output tables, if known,
+
+is appended as a line of JSON to a metrics file. By convention this lives
+alongside the script's log file in `DIRS["logs"]`, with the extension
+`.metrics.jsonl`, so runs can be compared over time.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import datetime
+import functools
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+RUN_ID = uuid.uuid4().hex[:12]
+_metrics_file = None
+
+
+def metrics_file_for_log(log_file):
+    """Name of the metrics file to write alongside `log_file`."""
+    return os.path.splitext(log_file)[0] + ".metrics.jsonl"
+
+
+def set_metrics_file(path):
+    """Set the file to which stage metrics are appended.
+
+    If no file is set, metrics are only written to the log.
+    """
+    global _metrics_file
+    _metrics_file = path
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, None if unknown."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS, kilobytes elsewhere
+    divisor = 2 ** 20 if sys.platform == "darwin" else 2 ** 10
+    return max_rss / divisor
+
+
+def n_rows(obj):
+    """Number of rows in a table, or None if `obj` isn't table-like."""
+    try:
+        return len(obj.index)
+    except (AttributeError, TypeError):
+        return None
+
+
+class StageMetrics(object):
+    """Mutable record of one stage's metrics, filled in by `instrumented`."""
+
+    def __init__(self, stage, rows_in=None):
+        self.stage = stage
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.extra = {}
+
+    def as_dict(self):
+        d = {"run_id": RUN_ID, "stage": self.stage,
+             "rows_in": self.rows_in, "rows_out": self.rows_out}
+        d.update(self.extra)
+        return d
+
+
+def write_metrics(record):
+    """Log `record` and append it to the metrics file as JSON."""
+    line = json.dumps(record)
+    logging.info("metrics: " + line)
+    if _metrics_file:
+        with open(_metrics_file, "a") as f:
+            f.write(line + "\n")
+
+
+@contextmanager
+def instrumented(stage, rows_in=None):
+    """Measure the code run inside the ``with`` block as stage `stage`.
+
+    Set `rows_out` (and optionally `rows_in`, or other values in `extra`) on
+    the yielded :obj:`StageMetrics` to have them recorded. Metrics are
+    written even if the block raises an exception, with `"ok": false`.
+
+    Example::
+
+        with instrumented("read", rows_in=None) as m:
+            df = pd.read_csv(path)
+            m.rows_out = len(df.index)
+    """
+    metrics = StageMetrics(stage, rows_in)
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    ok = False
+    try:
+        yield metrics
+        ok = True
+    finally:
+        record = metrics.as_dict()
+        record.update({
+            "ok": ok,
+            "timestamp": datetime.datetime.now().isoformat(),
+            "wall_s": time.perf_counter() - wall_start,
+            "cpu_s": time.process_time() - cpu_start,
+            "peak_rss_mb": peak_rss_mb(),
+        })
+        write_metrics(record)
+
+
+def instrument(stage=None):
+    """Decorator recording metrics for each call of the decorated function.
+
+    The number of rows in the function's first argument and in its return
+    value are recorded where these are tables.
+
+    Args:
+        stage (str, optional): Name to record. Defaults to function name.
+    """
+    def decorator(func):
+        name = stage or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with instrumented(name,
+                              n_rows(args[0]) if args else None) as m:
+                result = func(*args, **kwargs)
+                m.rows_out = n_rows(result)
+            return result
+        return wrapper
+    return decorator
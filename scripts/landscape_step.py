@@ -0,0 +1,100 @@
+"""
+landscape_step.py
+~~~~~~~~~~~~~~~~~
+
+Resolve the transition rule for every cell of a landscape at once.
+
+A landscape is given as NumPy arrays of the same shape, or shapes which
+broadcast together, holding each cell's land cover state and conditions as
+the codes of the enums in `constants.py` (see `transition_lookup.py`). Each
+cell's start state and conditions are combined into a single index into the
+dense arrays of a :obj:`transition_lookup.TransitionLookup`, so a grid of
+millions of cells is resolved with a handful of array operations and no
+Python loop over cells.
+
+Cells whose state and conditions have no rule in the table are marked in
+:attr:`LandscapeStep.unmatched`, and :meth:`LandscapeStep.unmatched_rules`
+lists the distinct combinations responsible.
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from constants import SeedPresence
+from transition_lookup import AXIS_ENUMS, NO_RULE, _as_index
+
+
+def _aliases(trans_enum):
+    """Alias of each member of `trans_enum`, indexed by code."""
+    if trans_enum is SeedPresence:
+        return np.array([False, True])
+    members = sorted(trans_enum, key=lambda m: m.value)
+    return np.array([m.alias for m in members], dtype=object)
+
+
+class LandscapeStep(object):
+    """Rules resolved for each cell of a landscape.
+
+    Attributes:
+        target (:obj:`numpy.ndarray`): `AgroSuccessLct` code of each cell's
+            end state, `NO_RULE` where there is no rule.
+        delta_t (:obj:`numpy.ndarray`): Each cell's transition time, `NO_RULE`
+            where there is no rule.
+        unmatched (:obj:`numpy.ndarray`): True for cells with no rule.
+    """
+
+    def __init__(self, target, delta_t, flat_index):
+        self.target = target
+        self.delta_t = delta_t
+        self.unmatched = target == NO_RULE
+        self._flat_index = flat_index
+
+    @property
+    def n_unmatched(self):
+        return int(np.count_nonzero(self.unmatched))
+
+    def unmatched_rules(self):
+        """Start states and conditions of cells with no rule.
+
+        Returns:
+            :obj:`pandas.DataFrame`: One row per distinct combination, with
+                a column of aliases for each axis of `AXIS_ENUMS` and the
+                number of 'cells' with that combination, most cells first.
+        """
+        flat, counts = np.unique(self._flat_index[self.unmatched],
+                                 return_counts=True)
+        shape = tuple(len(trans_enum) for _, trans_enum in AXIS_ENUMS)
+        codes = np.unravel_index(flat, shape)
+        data = OrderedDict((name, _aliases(trans_enum)[axis_codes])
+                           for (name, trans_enum), axis_codes
+                           in zip(AXIS_ENUMS, codes))
+        data["cells"] = counts
+        return pd.DataFrame(data, columns=list(data)).sort_values(
+            "cells", ascending=False, kind="mergesort").reset_index(drop=True)
+
+
+def evaluate_landscape(lookup, state, succession, aspect, pine, oak,
+                       deciduous, water):
+    """Find the end state and transition time of every cell in a landscape.
+
+    Args:
+        lookup (:obj:`transition_lookup.TransitionLookup`): Rules to apply.
+        state (:obj:`numpy.ndarray`): `AgroSuccessLct` code of each cell.
+        succession, aspect, pine, oak, deciduous, water: Codes of each cell's
+            conditions, as arrays broadcastable to the shape of `state` or as
+            single codes or enum members shared by every cell.
+
+    Returns:
+        :obj:`LandscapeStep`: Results with the broadcast shape of the inputs.
+
+    Raises:
+        ValueError: If a code is out of range for its enum.
+    """
+    index = [_as_index(value, len(trans_enum), name)
+             for value, (name, trans_enum)
+             in zip((state, succession, aspect, pine, oak, deciduous, water),
+                    AXIS_ENUMS)]
+    flat_index = np.ravel_multi_index(index, lookup.target.shape)
+    return LandscapeStep(lookup.target.ravel()[flat_index],
+                         lookup.delta_t.ravel()[flat_index], flat_index)
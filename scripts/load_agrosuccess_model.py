@@ -1,57 +1,215 @@
 from __future__ import print_function
 import sys
 import os
+import argparse
 import warnings; warnings.simplefilter("ignore")
 import numpy as np
 import pandas as pd
 
 from cymod import ServerGraphLoader, NodeLabels, read_params_file
 
+from config import DIRS
+from cypher_views import ViewCache, read_views
+from graph_db import connect, refresh_graph
+from incremental_reload import incremental_reload
+from instrumentation import instrument, instrumented, set_metrics_file
+from load_scheduler import (
+    DEFAULT_MAX_SESSIONS,
+    LoadSchedule,
+    summary_task,
+    table_task,
+    view_task,
+)
+from memory_graph import MemoryGraphLoader
+from provision_indexes import index_specs, provision_indexes
+from transition_queries import reloading_model
+from statement_profiling import (
+    StatementProfiler,
+    report_file_for_log,
+    set_profiler,
+)
+from succession_graph import (
+    DEFAULT_BATCH_SIZE,
+    condition_columns,
+    load_succession_batched,
+    load_transition_summary,
+    read_succession_table,
+)
+
 SUCCESSION_TABLE_PATH = "../data/created/agrosuccess_succession.csv"
 CYPHER_VIEWS_DIR = "../views"
 PARAMS_FILE = "../global_parameters.json"
-REFRESH_GRAPH = True
+VIEW_CACHE_FILE = os.path.join(DIRS["data"]["tmp"], "view_cache.pkl")
+METRICS_FILE = os.path.join(DIRS["logs"],
+                            "load_agrosuccess_model.metrics.jsonl")
+# How the model is loaded:
+# - scheduled: views and the succession table in the order given by the
+#   views' dependencies, independent views concurrently using up to
+#   --max-sessions database sessions, the table in batches
+# - batched: views with cymod, then the table in batches of --batch-size rows
+#   per statement
+# - cymod: views and then the table with cymod, one statement per row
+# - incremental: only apply changes to the succession rules of a model which
+#   has already been loaded, rather than deleting and reloading it. Views
+#   aren't reloaded
+# - memory: build the model in memory with memory_graph.MemoryGraphLoader
+#   instead of in the database, e.g. to check the views and table load without
+#   a server. Options which need a server are ignored
+MODES = ["scheduled", "batched", "cymod", "incremental", "memory"]
 
+@instrument()
 def agrosuccess_succession_df(path_to_succession_csv):
     """Read succession transition table as :obj:pd.DataFrame`.
 
     Returns:
         :obj:`pd.DataFrame`: Transition table for the AgroSuccess model.
     """
-    df = pd.read_csv(path_to_succession_csv)
-    df = df.rename(columns={"delta_T": "delta_t"})
-   
-    return df
+    return read_succession_table(path_to_succession_csv)
+
+parser = argparse.ArgumentParser(
+    description="Load the AgroSuccess model into the graph database.")
+parser.add_argument("--mode", choices=MODES, default="scheduled")
+parser.add_argument("--table", default=SUCCESSION_TABLE_PATH)
+parser.add_argument("--views", default=CYPHER_VIEWS_DIR)
+parser.add_argument("--params", default=PARAMS_FILE)
+parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+parser.add_argument("--max-sessions", type=int, default=DEFAULT_MAX_SESSIONS)
+parser.add_argument("--no-refresh", action="store_true",
+                    help="Don't delete the model's existing nodes first.")
+parser.add_argument("--no-indexes", action="store_true",
+                    help="Don't create indexes before loading.")
+# Statements committed by cymod (in 'cymod' mode, and the views in 'batched'
+# mode) aren't seen by the profiler
+parser.add_argument("--profile", action="store_true",
+                    help="Write a report of each statement's cost.")
+parser.add_argument("--profile-db-hits", action="store_true",
+                    help="Also profile statements' database hits.")
+args = parser.parse_args()
 
-if not os.path.exists(SUCCESSION_TABLE_PATH):
-    sys.exit("Succession table file " + SUCCESSION_TABLE_PATH
-             + " does not exist.")
+if not os.path.exists(args.table):
+    sys.exit("Succession table file " + args.table + " does not exist.")
 
-# Initialise database connection
-sgl = ServerGraphLoader("neo4j", "password")
+set_metrics_file(METRICS_FILE)
+if args.profile or args.profile_db_hits:
+    profiler = StatementProfiler(db_hits=args.profile_db_hits)
+    set_profiler(profiler)
 
 # Load parameters from external file
-params = read_params_file(PARAMS_FILE)
+params = read_params_file(args.params)
 
 # Specify custom node labels
-labels = NodeLabels({"State": "LandCoverType", 
-                     "Transition": "SuccessionTrajectory",
-                     "Condition" : "EnvironCondition"})
-
-# Delete existing data matching global parameters
-if REFRESH_GRAPH:
-    print("Deleting old data matching global params: ", str(params))
-    sgl.refresh_graph(params)
-
-# Load queries stored in cypher files
-print("Loading cypher queries from", CYPHER_VIEWS_DIR, "...")
-sgl.load_cypher(CYPHER_VIEWS_DIR, "_w", params)
-
-# Load tabular data
-print("Loading tabular data from", SUCCESSION_TABLE_PATH, "...")
-sgl.load_tabular(agrosuccess_succession_df(SUCCESSION_TABLE_PATH), 
-    'start', 'delta_D', labels=labels, global_params=params)
-
-# Commit queries to database
-print("Committing queries to database...")
-sgl.commit()
+label_d = {"State": "LandCoverType",
+           "Transition": "SuccessionTrajectory",
+           "Condition" : "EnvironCondition"}
+
+df = agrosuccess_succession_df(args.table)
+
+if args.mode == "memory":
+    sgl = MemoryGraphLoader()
+    if not args.no_refresh:
+        sgl.refresh_graph(params)
+    sgl.load_cypher(args.views, "_w", params)
+    sgl.load_tabular(df, 'start', 'delta_D', labels=label_d,
+                     global_params=params)
+    sgl.load_transition_summary(df, 'start', 'delta_D', labels=label_d,
+                                global_params=params)
+    print("Building model in memory...")
+    with instrumented("commit"):
+        sgl.commit()
+    node_counts, rel_counts = sgl.graph.counts()
+    for name, n in list(node_counts.items()) + list(rel_counts.items()):
+        print("  {0}: {1}".format(name, n))
+    sys.exit()
+
+driver = connect("neo4j", "password")
+try:
+    # Create indexes used when loading
+    if not args.no_indexes:
+        print("Creating indexes...")
+        specs = index_specs(
+            read_views(args.views, cache=ViewCache(VIEW_CACHE_FILE)),
+            condition_columns(df, 'start', 'delta_D'), params,
+            labels=label_d)
+        index_timings = provision_indexes(driver, specs)
+        print("  {0} indexes created in {create_s:.3f}s, online after a "
+              "further {await_s:.3f}s".format(len(specs), **index_timings))
+
+    if args.mode == "incremental":
+        # incremental_reload marks the model as reloaded itself, only if it
+        # changes anything
+        print("Updating succession rules to match", args.table, "...")
+        with instrumented("incremental_reload"):
+            diff = incremental_reload(driver, df, 'start', 'delta_D', params,
+                                      labels=label_d,
+                                      batch_size=args.batch_size)
+        for kind, n_changes in diff.counts().items():
+            print("  {0}: {1}".format(kind, n_changes))
+    else:
+        # Tell processes caching query answers that the model has changed
+        # once it's loaded, or if loading fails part way
+        with reloading_model(driver, params):
+            # Delete existing data matching global parameters
+            if not args.no_refresh:
+                print("Deleting old data matching global params: ",
+                      str(params))
+                with instrumented("refresh_graph"):
+                    refresh_graph(driver, params)
+
+            if args.mode == "scheduled":
+                print("Loading cypher queries from", args.views, "and "
+                      "tabular data from", args.table, "in dependency "
+                      "order...")
+                schedule = LoadSchedule(
+                    [view_task(view, params) for view in
+                     read_views(args.views, cache=ViewCache(VIEW_CACHE_FILE))]
+                    + [table_task(df, 'start', 'delta_D', params,
+                                  labels=label_d, batch_size=args.batch_size),
+                       summary_task(df, 'start', 'delta_D', params,
+                                    labels=label_d)])
+                with instrumented("scheduled_load"):
+                    task_timings = schedule.run(
+                        driver, max_workers=args.max_sessions)
+                for t in task_timings:
+                    print("  {name}: started at {start:.3f}s, took "
+                          "{seconds:.3f}s".format(**t))
+            else:
+                sgl = ServerGraphLoader("neo4j", "password")
+                print("Loading cypher queries from", args.views, "...")
+                with instrumented("load_cypher"):
+                    sgl.load_cypher(args.views, "_w", params)
+                if args.mode == "cymod":
+                    print("Loading tabular data from", args.table, "...")
+                    with instrumented("load_tabular"):
+                        sgl.load_tabular(df, 'start', 'delta_D',
+                                         labels=NodeLabels(label_d),
+                                         global_params=params)
+                print("Committing queries to database...")
+                with instrumented("commit"):
+                    sgl.commit()
+                if args.mode == "batched":
+                    print("Bulk loading tabular data from", args.table,
+                          "in batches of", args.batch_size, "rows...")
+                    with instrumented("load_tabular_bulk"):
+                        batch_timings = load_succession_batched(
+                            driver, df, 'start', 'delta_D', params,
+                            labels=label_d, batch_size=args.batch_size)
+                    for t in batch_timings:
+                        print("  batch {batch}: {rows} rows in "
+                              "{seconds:.3f}s".format(**t))
+
+                # The summary is loaded with the other tasks in scheduled
+                # mode
+                print("Loading summary of transitions between states...")
+                n_summary = load_transition_summary(
+                    driver, df, 'start', 'delta_D', params, labels=label_d)
+                print("  {0} TRANSITIONS_TO relationships".format(n_summary))
+finally:
+    driver.close()
+
+if args.profile or args.profile_db_hits:
+    report_file = report_file_for_log(
+        os.path.join(DIRS["logs"], "load_agrosuccess_model.log"),
+        params.get("model_ID"))
+    report = profiler.write_report(report_file, params.get("model_ID"))
+    print("Slowest statement sources, see", report_file, "for all:")
+    print(report.head(10).to_string(index=False))
@@ -0,0 +1,231 @@
+"""
+load_models.py
+~~~~~~~~~~~~~~
+
+Load several versions of the AgroSuccess model into the database at once.
+
+Each model version is given either as a JSON parameters file, like
+`global_parameters.json`, or as a `model_ID`, in which case the parameters in
+`global_parameters.json` are used with that `model_ID`, e.g.::
+
+    python load_models.py AgroSuccess-dev AgroSuccess-v2 ../params_v3.json
+
+The views and succession table are read once and shared by every version.
+Each version is refreshed and loaded as in `load_agrosuccess_model.py` with
+`--mode scheduled`. Versions are loaded concurrently, with the total number
+of open database sessions limited by `--max-sessions`. If one version fails
+to load, the error is reported and the others carry on. Indexes are created
+once before any version is loaded, see `provision_indexes.py`, unless
+`--no-indexes` is given. With `--profile`, the cost of each statement is
+recorded and a report ranking the slowest views and table batches is
+written for each version, see `statement_profiling.py`.
+"""
+from __future__ import print_function
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from config import DIRS
+from cypher_views import ViewCache, read_views
+from graph_db import SessionPool, connect, refresh_graph
+from instrumentation import (
+    instrumented,
+    metrics_file_for_log,
+    set_metrics_file,
+)
+from statement_profiling import (
+    StatementProfiler,
+    report_file_for_log,
+    set_profiler,
+)
+from load_scheduler import (
+    DEFAULT_MAX_SESSIONS,
+    LoadSchedule,
+    summary_task,
+    table_task,
+    view_task,
+)
+from transition_queries import reloading_model
+from provision_indexes import index_specs, provision_indexes
+from succession_graph import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_LABELS,
+    condition_columns,
+    read_succession_table,
+)
+
+DEFAULT_PARAMS_FILE = os.path.join(DIRS["scripts"], "..",
+                                   "global_parameters.json")
+DEFAULT_VIEWS_DIR = os.path.join(DIRS["scripts"], "..", "views")
+DEFAULT_TABLE = os.path.join(DIRS["data"]["created"],
+                             "agrosuccess_succession.csv")
+VIEW_CACHE_FILE = os.path.join(DIRS["data"]["tmp"], "view_cache.pkl")
+
+
+def read_params(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def model_params(models, base_params):
+    """Global parameters for each model given on the command line.
+
+    Args:
+        models (list of str): Paths to JSON parameter files, or model IDs.
+        base_params (dict): Parameters to use with a model ID.
+
+    Raises:
+        ValueError: If two models have the same `model_ID`.
+    """
+    params_list = []
+    for model in models:
+        if model.endswith(".json") and os.path.isfile(model):
+            params_list.append(read_params(model))
+        else:
+            params_list.append(dict(base_params, model_ID=model))
+    ids = [params.get("model_ID") for params in params_list]
+    duplicated = sorted(set(i for i in ids if ids.count(i) > 1), key=str)
+    if duplicated:
+        raise ValueError("Duplicate model_ID(s): {0}".format(duplicated))
+    return params_list
+
+
+def load_model(driver, params, views, df, start_col="start",
+               end_col="delta_D", labels=None, batch_size=DEFAULT_BATCH_SIZE,
+               max_sessions=DEFAULT_MAX_SESSIONS, refresh=True):
+    """Refresh and load one model version with a :obj:`LoadSchedule`.
+
+    Cached query answers for the model are invalidated once it's loaded, or
+    if loading fails part way, see :func:`transition_queries.reloading_model`.
+
+    Returns:
+        list of dict: Timings of each task, see :meth:`LoadSchedule.run`.
+    """
+    schedule = LoadSchedule(
+        [view_task(view, params) for view in views]
+        + [table_task(df, start_col, end_col, params, labels=labels,
+                      batch_size=batch_size),
+           summary_task(df, start_col, end_col, params, labels=labels)])
+    with reloading_model(driver, params):
+        if refresh:
+            with instrumented("refresh_graph"):
+                refresh_graph(driver, params)
+        return schedule.run(driver, max_workers=max_sessions)
+
+
+def load_models(driver, params_list, views, df,
+                max_sessions=DEFAULT_MAX_SESSIONS, max_models=None, **kwargs):
+    """Load several model versions concurrently.
+
+    Args:
+        driver (:obj:`neo4j.Driver`): Connected driver.
+        params_list (list of dict): Global parameters of each model.
+        views (list of :obj:`cypher_views.CypherView`): Views to load.
+        df (:obj:`pandas.DataFrame`): Succession table.
+        max_sessions (int, optional): Largest number of sessions open at once
+            across all models.
+        max_models (int, optional): Largest number of models loaded at once.
+            Defaults to `max_sessions`.
+        **kwargs: Passed to :func:`load_model`.
+
+    Returns:
+        :obj:`pandas.DataFrame`: For each model, its `model_ID`, whether it
+            loaded 'ok', the 'seconds' taken and any 'error' message.
+    """
+    pool = SessionPool(driver, max_sessions)
+    lock = threading.Lock()
+    n_done = [0]
+
+    def load(params):
+        model_id = params.get("model_ID")
+        start = time.perf_counter()
+        result = {"model_ID": model_id, "ok": False, "seconds": None,
+                  "error": None}
+        try:
+            with instrumented("load_model:{0}".format(model_id)):
+                load_model(pool, params, views, df,
+                           max_sessions=max_sessions, **kwargs)
+            result["ok"] = True
+        except Exception as e:
+            logging.exception("Failed to load model {0}".format(model_id))
+            result["error"] = "{0}: {1}".format(type(e).__name__, e)
+        result["seconds"] = time.perf_counter() - start
+        with lock:
+            n_done[0] += 1
+            print("[{0}/{1}] {2}: {3} in {4:.2f}s".format(
+                n_done[0], len(params_list), model_id,
+                "loaded" if result["ok"] else "FAILED", result["seconds"]))
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_models or max_sessions) as ex:
+        futures = [ex.submit(load, params) for params in params_list]
+        results = [f.result() for f in as_completed(futures)]
+    order = [params.get("model_ID") for params in params_list]
+    results.sort(key=lambda r: order.index(r["model_ID"]))
+    return pd.DataFrame(results, columns=["model_ID", "ok", "seconds",
+                                          "error"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[4])
+    parser.add_argument("models", nargs="+",
+                        help="Parameter files (.json) or model IDs.")
+    parser.add_argument("--params", default=DEFAULT_PARAMS_FILE,
+                        help="Parameters to use with model IDs.")
+    parser.add_argument("--views", default=DEFAULT_VIEWS_DIR)
+    parser.add_argument("--table", default=DEFAULT_TABLE)
+    parser.add_argument("--max-sessions", type=int,
+                        default=DEFAULT_MAX_SESSIONS)
+    parser.add_argument("--max-models", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--no-refresh", action="store_true",
+                        help="Don't delete existing nodes for each model.")
+    parser.add_argument("--no-indexes", action="store_true",
+                        help="Don't create indexes before loading.")
+    parser.add_argument("--profile", action="store_true",
+                        help="Write a report of each statement's cost.")
+    parser.add_argument("--profile-db-hits", action="store_true",
+                        help="Also profile statements' database hits.")
+    args = parser.parse_args()
+
+    LOG_FILE = os.path.join(
+        DIRS["logs"], os.path.basename(__file__).split(".py")[0] + ".log")
+    logging.basicConfig(filename=LOG_FILE, filemode='w', level=logging.INFO)
+    set_metrics_file(metrics_file_for_log(LOG_FILE))
+    if args.profile or args.profile_db_hits:
+        profiler = StatementProfiler(db_hits=args.profile_db_hits)
+        set_profiler(profiler)
+
+    PARAMS_LIST = model_params(args.models, read_params(args.params))
+    VIEWS = read_views(args.views, cache=ViewCache(VIEW_CACHE_FILE))
+    DF = read_succession_table(args.table)
+
+    driver = connect("neo4j", "password")
+    try:
+        if not args.no_indexes:
+            provision_indexes(driver, sorted(set().union(*(
+                index_specs(VIEWS, condition_columns(DF, "start", "delta_D"),
+                            params, DEFAULT_LABELS)
+                for params in PARAMS_LIST))))
+        summary = load_models(driver, PARAMS_LIST, VIEWS, DF,
+                              max_sessions=args.max_sessions,
+                              max_models=args.max_models,
+                              labels=DEFAULT_LABELS,
+                              batch_size=args.batch_size,
+                              refresh=not args.no_refresh)
+    finally:
+        driver.close()
+    print(summary.to_string(index=False))
+    if args.profile or args.profile_db_hits:
+        for model_id in summary["model_ID"]:
+            profiler.write_report(report_file_for_log(LOG_FILE, model_id),
+                                  model_id)
+    if not summary["ok"].all():
+        sys.exit(1)
@@ -0,0 +1,193 @@
+"""
+load_scheduler.py
+~~~~~~~~~~~~~~~~~
+
+Load views and tabular data in dependency order, concurrently where possible.
+
+Cymod commits all queries from Cypher files before any queries made from
+tables, so views which match nodes made from the succession table find
+nothing to match. Here each view, the load of the succession table and the
+load of the `TRANSITIONS_TO` summary of the table (which needs the states
+made by the table) are tasks in a directed acyclic graph. A task depends on
+
+- the views listed in its `dependencies` comment block, if it has one, or
+- every task with a lower priority, if it doesn't.
+
+The table task is given its own dependencies and priority, see
+`TABLE_TASK_DEPENDENCIES` and `TABLE_TASK_PRIORITY`, so views of a higher
+priority without a `dependencies` block run after it. Tasks are started as
+soon as everything they depend on has finished, on a pool of threads which
+each open their own database session. Independent tasks, e.g.
+`abstract/Agent_w.cql` and `abstract/LandCoverType_w.cql`, therefore run at
+the same time.
+"""
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from graph_db import run_statement
+from instrumentation import instrumented
+from succession_graph import (
+    DEFAULT_BATCH_SIZE,
+    SUMMARY_NAME,
+    load_succession_batched,
+    load_transition_summary,
+)
+
+TABLE_TASK_NAME = "succession_table"
+TABLE_TASK_DEPENDENCIES = ["abstract/LandCoverType_w.cql"]
+TABLE_TASK_PRIORITY = 2
+SUMMARY_TASK_PRIORITY = 3
+DEFAULT_MAX_SESSIONS = 4
+
+
+class LoadTask(object):
+    """A unit of loading work in a :obj:`LoadSchedule`."""
+
+    def __init__(self, name, run, priority=0, dependencies=None):
+        """
+        Args:
+            name (str): Unique name of the task.
+            run (function): Called with a database driver to do the work.
+            priority (int, optional): Used to order tasks which don't list
+                their dependencies.
+            dependencies (list of str, optional): Names of tasks which must
+                finish before this one starts. If None, the task depends on
+                every task with a lower priority.
+        """
+        self.name = name
+        self.run = run
+        self.priority = priority
+        self.dependencies = dependencies
+
+    def __repr__(self):
+        return "LoadTask({0!r})".format(self.name)
+
+
+def view_task(view, global_params):
+    """Task running the statements in a :obj:`cypher_views.CypherView`.
+
+    Statements are run in order in a single session.
+    """
+    def run(driver):
+        with driver.session() as session:
+            for i, statement in enumerate(view.statements):
+                run_statement(session, statement, global_params,
+                              source=view.name, index=i)
+    return LoadTask(view.name, run, view.priority, view.dependencies)
+
+
+def table_task(df, start_col, end_col, global_params, labels=None,
+               batch_size=DEFAULT_BATCH_SIZE,
+               dependencies=TABLE_TASK_DEPENDENCIES,
+               priority=TABLE_TASK_PRIORITY):
+    """Task loading the succession table with batched statements."""
+    def run(driver):
+        load_succession_batched(driver, df, start_col, end_col,
+                                global_params, labels, batch_size)
+    return LoadTask(TABLE_TASK_NAME, run, priority, dependencies)
+
+
+def summary_task(df, start_col, end_col, global_params, labels=None):
+    """Task loading the `TRANSITIONS_TO` summary after the table."""
+    def run(driver):
+        load_transition_summary(driver, df, start_col, end_col,
+                                global_params, labels)
+    return LoadTask(SUMMARY_NAME, run, SUMMARY_TASK_PRIORITY,
+                    [TABLE_TASK_NAME])
+
+
+class LoadSchedule(object):
+    """Dependency graph of :obj:`LoadTask` objects."""
+
+    def __init__(self, tasks):
+        """
+        Raises:
+            ValueError: If task names aren't unique, a task depends on an
+                unknown task, or the dependencies contain a cycle.
+        """
+        self.tasks = {}
+        for task in tasks:
+            if task.name in self.tasks:
+                raise ValueError("Duplicate task name: " + task.name)
+            self.tasks[task.name] = task
+        self.dependencies = {}
+        for task in tasks:
+            if task.dependencies is None:
+                deps = [t.name for t in tasks if t.priority < task.priority]
+            else:
+                deps = list(task.dependencies)
+                unknown = [d for d in deps if d not in self.tasks]
+                if unknown:
+                    raise ValueError("Task {0} depends on unknown task(s) {1}"
+                                     .format(task.name, unknown))
+            self.dependencies[task.name] = set(deps)
+        self.order = self._topological_order()
+
+    def _sort_key(self, name):
+        return (self.tasks[name].priority, name)
+
+    def _topological_order(self):
+        remaining = {name: set(deps)
+                     for name, deps in self.dependencies.items()}
+        order = []
+        while remaining:
+            ready = sorted([n for n, deps in remaining.items() if not deps],
+                           key=self._sort_key)
+            if not ready:
+                raise ValueError("Dependency cycle between tasks: {0}"
+                                 .format(sorted(remaining)))
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return order
+
+    def run(self, driver, max_workers=DEFAULT_MAX_SESSIONS):
+        """Run every task, each once its dependencies have finished.
+
+        If a task fails, no further tasks are started. Tasks already running
+        are allowed to finish, then the first exception raised is re-raised.
+
+        Returns:
+            list of dict: The 'name', 'start' and 'seconds' of each task run,
+                in order of completion, with 'start' measured in seconds from
+                the start of the schedule.
+        """
+        done, timings = set(), []
+        pending = list(self.order)
+        running = {}
+        t0 = time.perf_counter()
+
+        def run_task(task):
+            start = time.perf_counter()
+            with instrumented("task:" + task.name):
+                task.run(driver)
+            return {"name": task.name, "start": start - t0,
+                    "seconds": time.perf_counter() - start}
+
+        error = None
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while pending or running:
+                if error is None:
+                    for name in [n for n in pending
+                                 if self.dependencies[n] <= done]:
+                        pending.remove(name)
+                        logging.info("Starting task " + name)
+                        running[pool.submit(run_task, self.tasks[name])] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    if future.exception() is not None:
+                        logging.error("Task {0} failed: {1}".format(
+                            name, future.exception()))
+                        error = error or future.exception()
+                        continue
+                    done.add(name)
+                    timings.append(future.result())
+        if error is not None:
+            raise error
+        return timings
@@ -0,0 +1,623 @@
+"""
+memory_graph.py
+~~~~~~~~~~~~~~~
+
+Build the AgroSuccess graph in memory, without a Neo4j server.
+
+:obj:`MemoryGraphLoader` has the same loading methods as cymod's
+`ServerGraphLoader`, i.e. `refresh_graph`, `load_cypher`, `load_tabular`
+and `commit`, so can stand in for it in `load_agrosuccess_model.py` and in
+tests. As with cymod, views and tables are queued by the `load_*` methods
+and only loaded when `commit` is called.
+
+Nodes and relationships are stored in arrays. Each node has an integer label
+code and each relationship integer start and end nodes and a type code.
+Each property is a column holding a value, or None, for every node. Only the
+forms of statement used in the `views` directory are understood:
+
+- `MERGE` or `CREATE` of a single node with literal properties, e.g. in
+  `abstract/LandCoverType_w.cql`, and
+- `MATCH` of nodes by their properties, followed by `CREATE` of nodes and
+  `MERGE` of paths between the matched and created nodes, e.g. in
+  `landcover_change/AgroPastoralist/activities_w.cql`.
+
+Other statements, e.g. those using `WITH` or `WHERE`, are skipped with a
+warning and listed in :attr:`MemoryGraph.skipped`. Tables are loaded as the
+same graph as :func:`succession_graph.unwind_statement` makes, and their
+`TRANSITIONS_TO` summaries as :func:`succession_graph.load_transition_summary`
+makes them.
+"""
+import re
+import logging
+from array import array
+from collections import OrderedDict, defaultdict, namedtuple
+
+import pandas as pd
+
+from cypher_views import VIEWS_SUFFIX, parse_property_map, read_views
+from succession_graph import (
+    DEFAULT_LABELS,
+    SUMMARY_REL_TYPE,
+    condition_columns,
+    succession_rows,
+    transition_summary_rows,
+)
+
+NodePattern = namedtuple("NodePattern", ["var", "label", "props"])
+RelPattern = namedtuple("RelPattern", ["rel_type", "props", "outgoing"])
+
+_STRING_RE = re.compile(r""""(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'""")
+_CLAUSE_RE = re.compile(r"\b(MATCH|CREATE|MERGE)\b", re.IGNORECASE)
+_UNSUPPORTED_RE = re.compile(
+    r"\b(OPTIONAL|WITH|RETURN|WHERE|UNWIND|SET|DELETE|REMOVE|ON|CALL"
+    r"|FOREACH|UNION)\b", re.IGNORECASE)
+_NODE_RE = re.compile(
+    r"\(\s*(\w*)\s*(?::\s*(\w+))?\s*(\{[^}]*\})?\s*\)")
+_REL_RE = re.compile(r"(<?)-\[\s*\w*\s*:\s*(\w+)\s*(\{[^}]*\})?\s*\]-(>?)")
+
+
+def _value_key(value):
+    """Hashable key distinguishing e.g. `True` from `1`, as Cypher does."""
+    return (type(value).__name__, value)
+
+
+def _mask_strings(text):
+    """`text` with the contents of string literals replaced by spaces.
+
+    Positions in the result match those in `text`, so patterns found in it
+    can be sliced out of `text`.
+    """
+    return _STRING_RE.sub(
+        lambda m: m.group(0)[0] + " " * (len(m.group(0)) - 2)
+        + m.group(0)[0], text)
+
+
+def _split_top_level(text, masked):
+    """Split `text` at commas which aren't inside brackets."""
+    parts, depth, start = [], 0, 0
+    for i, c in enumerate(masked):
+        if c in "([{":
+            depth += 1
+        elif c in ")]}":
+            depth -= 1
+        elif c == "," and depth == 0:
+            parts.append((text[start:i], masked[start:i]))
+            start = i + 1
+    parts.append((text[start:], masked[start:]))
+    return parts
+
+
+def parse_path(text, params=None, masked=None):
+    """Parse a Cypher path pattern such as ``(a)-[:R]->(b:L {k:1})``.
+
+    Returns:
+        list: Alternating :obj:`NodePattern` and :obj:`RelPattern` tuples,
+            starting and ending with a node.
+
+    Raises:
+        ValueError: If `text` isn't a path of the supported form.
+    """
+    masked = _mask_strings(text) if masked is None else masked
+    path, pos = [], len(masked) - len(masked.lstrip())
+    while True:
+        node = _NODE_RE.match(masked, pos)
+        if not node:
+            raise ValueError("Can't parse path: {0}".format(text.strip()))
+        props = (parse_property_map(text[node.start(3):node.end(3)], params)
+                 if node.group(3) else OrderedDict())
+        path.append(NodePattern(node.group(1) or None, node.group(2), props))
+        pos = node.end()
+        while pos < len(masked) and masked[pos].isspace():
+            pos += 1
+        if pos == len(masked):
+            return path
+        rel = _REL_RE.match(masked, pos)
+        if not rel or bool(rel.group(1)) == bool(rel.group(4)):
+            raise ValueError("Can't parse path: {0}".format(text.strip()))
+        props = (parse_property_map(text[rel.start(3):rel.end(3)], params)
+                 if rel.group(3) else OrderedDict())
+        path.append(RelPattern(rel.group(2), props, bool(rel.group(4))))
+        pos = rel.end()
+        while pos < len(masked) and masked[pos].isspace():
+            pos += 1
+
+
+def parse_statement(statement, params=None):
+    """Parse a statement made of `MATCH`, `CREATE` and `MERGE` clauses.
+
+    Returns:
+        list of tuple: Each clause's keyword, in upper case, and list of
+            paths, see :func:`parse_path`.
+
+    Raises:
+        ValueError: If the statement uses anything else.
+    """
+    masked = _mask_strings(statement)
+    if _UNSUPPORTED_RE.search(masked):
+        raise ValueError("Unsupported statement: {0}".format(statement))
+    clauses = list(_CLAUSE_RE.finditer(masked))
+    if not clauses or masked[:clauses[0].start()].strip():
+        raise ValueError("Unsupported statement: {0}".format(statement))
+    parsed = []
+    for clause, following in zip(clauses, clauses[1:] + [None]):
+        end = following.start() if following else len(statement)
+        body = statement[clause.end():end]
+        paths = [parse_path(text, params, masked_text) for text, masked_text
+                 in _split_top_level(body, masked[clause.end():end])]
+        parsed.append((clause.group(1).upper(), paths))
+    return parsed
+
+
+class MemoryGraph(object):
+    """Labelled property graph stored in arrays.
+
+    Nodes and relationships are referred to by their integer index.
+    Deleting nodes renumbers those remaining.
+    """
+
+    def __init__(self):
+        self.label_names = []
+        self.type_names = []
+        # node index -> label code
+        self.node_labels = array("i")
+        # property name -> list of values, one per node
+        self.properties = OrderedDict()
+        # relationship index -> start node, end node and type code
+        self.rel_starts = array("i")
+        self.rel_ends = array("i")
+        self.rel_types = array("i")
+        # relationship index -> dict of properties, or None
+        self.rel_properties = []
+        # (view name, statement) pairs which couldn't be run
+        self.skipped = []
+        self._build_indexes()
+
+    def _build_indexes(self):
+        # (label code, property, value key) -> list of nodes
+        self._node_index = defaultdict(list)
+        # label code -> list of nodes
+        self._label_index = defaultdict(list)
+        # (start, end, type code) -> list of relationships
+        self._rel_index = defaultdict(list)
+        # node -> list of relationships starting or ending there
+        self._incoming = defaultdict(list)
+        self._outgoing = defaultdict(list)
+        for node, code in enumerate(self.node_labels):
+            self._index_node(node, code)
+        for rel in range(len(self.rel_types)):
+            self._index_relationship(rel)
+
+    def _index_node(self, node, code):
+        self._label_index[code].append(node)
+        for key, values in self.properties.items():
+            if values[node] is not None:
+                self._node_index[(code, key, _value_key(values[node]))] \
+                    .append(node)
+
+    def _index_relationship(self, rel):
+        start, end = self.rel_starts[rel], self.rel_ends[rel]
+        self._rel_index[(start, end, self.rel_types[rel])].append(rel)
+        self._outgoing[start].append(rel)
+        self._incoming[end].append(rel)
+
+    @staticmethod
+    def _code(names, name, add=False):
+        try:
+            return names.index(name)
+        except ValueError:
+            if not add:
+                return None
+            names.append(name)
+            return len(names) - 1
+
+    def __len__(self):
+        return len(self.node_labels)
+
+    @property
+    def n_relationships(self):
+        return len(self.rel_types)
+
+    def add_node(self, label, props):
+        """Create a node.
+
+        Returns:
+            int: Index of the new node.
+        """
+        node = len(self.node_labels)
+        code = self._code(self.label_names, label, add=True)
+        self.node_labels.append(code)
+        for key in props:
+            if key not in self.properties:
+                self.properties[key] = [None] * node
+        for key, values in self.properties.items():
+            values.append(props.get(key))
+        self._index_node(node, code)
+        return node
+
+    def node_label(self, node):
+        return self.label_names[self.node_labels[node]]
+
+    def node_properties(self, node):
+        """Properties of `node`, in the order they were first used."""
+        return OrderedDict((k, v[node]) for k, v in self.properties.items()
+                           if v[node] is not None)
+
+    def _has_properties(self, node, props):
+        for key, value in props.items():
+            values = self.properties.get(key)
+            if values is None or _value_key(values[node]) != _value_key(value):
+                return False
+        return True
+
+    def find_nodes(self, label=None, props=None):
+        """Nodes with `label`, if given, and all the properties in `props`.
+
+        Returns:
+            list of int: Matching nodes, in the order they were created.
+        """
+        props = props or {}
+        code = None
+        if label is not None:
+            code = self._code(self.label_names, label)
+            if code is None:
+                return []
+        if code is not None and props:
+            candidates = min((self._node_index.get(
+                (code, k, _value_key(v)), []) for k, v in props.items()),
+                key=len)
+        elif code is not None:
+            candidates = self._label_index.get(code, [])
+        else:
+            candidates = range(len(self.node_labels))
+        return [n for n in candidates if self._has_properties(n, props)]
+
+    def merge_node(self, label, props):
+        """Index of a node matching `label` and `props`, created if needed."""
+        nodes = self.find_nodes(label, props)
+        return nodes[0] if nodes else self.add_node(label, props)
+
+    def add_relationship(self, start, end, rel_type, props=None):
+        """Create a relationship between two nodes.
+
+        Returns:
+            int: Index of the new relationship.
+        """
+        rel = len(self.rel_types)
+        self.rel_starts.append(start)
+        self.rel_ends.append(end)
+        self.rel_types.append(self._code(self.type_names, rel_type, add=True))
+        self.rel_properties.append(dict(props) if props else None)
+        self._index_relationship(rel)
+        return rel
+
+    def _has_rel_properties(self, rel, props):
+        rel_props = self.rel_properties[rel] or {}
+        return all(_value_key(rel_props.get(k)) == _value_key(v)
+                   for k, v in (props or {}).items())
+
+    def find_relationships(self, start, end, rel_type, props=None):
+        """Relationships of `rel_type` from `start` to `end` with `props`."""
+        code = self._code(self.type_names, rel_type)
+        rels = self._rel_index.get((start, end, code), [])
+        return [r for r in rels if self._has_rel_properties(r, props)]
+
+    def find_relationships_of_type(self, rel_type, props=None):
+        """Every relationship of `rel_type` with all the properties `props`.
+        """
+        code = self._code(self.type_names, rel_type)
+        return [r for r, t in enumerate(self.rel_types)
+                if t == code and self._has_rel_properties(r, props)]
+
+    def merge_relationship(self, start, end, rel_type, props=None):
+        rels = self.find_relationships(start, end, rel_type, props)
+        return rels[0] if rels else self.add_relationship(start, end,
+                                                          rel_type, props)
+
+    def relationships(self, rel_type=None):
+        """(start, end, type) of each relationship, optionally of one type.
+        """
+        return [(s, e, self.type_names[t]) for s, e, t
+                in zip(self.rel_starts, self.rel_ends, self.rel_types)
+                if rel_type is None or self.type_names[t] == rel_type]
+
+    def neighbours(self, node, rel_type=None, outgoing=True):
+        """Nodes joined to `node` by relationships of `rel_type`."""
+        if outgoing:
+            rels, other = self._outgoing.get(node, []), self.rel_ends
+        else:
+            rels, other = self._incoming.get(node, []), self.rel_starts
+        return [other[r] for r in rels if rel_type is None
+                or self.type_names[self.rel_types[r]] == rel_type]
+
+    def _compact(self, keep, kept_rels):
+        """Keep only nodes `keep` and relationships `kept_rels`."""
+        new_index = {old: new for new, old in enumerate(keep)}
+        self.node_labels = array("i", (self.node_labels[n] for n in keep))
+        for key in list(self.properties):
+            values = [self.properties[key][n] for n in keep]
+            if all(v is None for v in values):
+                del self.properties[key]
+            else:
+                self.properties[key] = values
+        self.rel_starts = array("i", (new_index[self.rel_starts[r]]
+                                      for r in kept_rels))
+        self.rel_ends = array("i", (new_index[self.rel_ends[r]]
+                                    for r in kept_rels))
+        self.rel_types = array("i", (self.rel_types[r] for r in kept_rels))
+        self.rel_properties = [self.rel_properties[r] for r in kept_rels]
+        self._build_indexes()
+
+    def delete_nodes(self, nodes):
+        """Delete `nodes` and their relationships, renumbering the rest."""
+        deleted = set(nodes)
+        self._compact(
+            [n for n in range(len(self.node_labels)) if n not in deleted],
+            [r for r in range(len(self.rel_types))
+             if self.rel_starts[r] not in deleted
+             and self.rel_ends[r] not in deleted])
+        return len(deleted)
+
+    def delete_relationships(self, rels):
+        """Delete relationships `rels`, renumbering the rest."""
+        deleted = set(rels)
+        self._compact(list(range(len(self.node_labels))),
+                      [r for r in range(len(self.rel_types))
+                       if r not in deleted])
+        return len(deleted)
+
+    def refresh(self, global_params):
+        """Delete every node whose properties match all of `global_params`.
+
+        Returns:
+            int: Number of nodes deleted.
+        """
+        return self.delete_nodes(self.find_nodes(props=global_params))
+
+    def counts(self):
+        """Numbers of nodes by label and relationships by type.
+
+        Returns:
+            tuple of dict: Node counts by label and relationship counts by
+                type, as from :func:`export_bulk_import.export_counts`.
+        """
+        node_counts = OrderedDict((label, 0) for label in self.label_names)
+        for code in self.node_labels:
+            node_counts[self.label_names[code]] += 1
+        rel_counts = OrderedDict((t, 0) for t in self.type_names)
+        for code in self.rel_types:
+            rel_counts[self.type_names[code]] += 1
+        return ({k: v for k, v in node_counts.items() if v},
+                {k: v for k, v in rel_counts.items() if v})
+
+    def nodes_frame(self, label):
+        """Properties of the nodes with `label` as a :obj:`pd.DataFrame`."""
+        nodes = self.find_nodes(label)
+        keys = [k for k, v in self.properties.items()
+                if any(v[n] is not None for n in nodes)]
+        return pd.DataFrame([[self.properties[k][n] for k in keys]
+                             for n in nodes], index=nodes, columns=keys)
+
+    def _path_exists(self, path, nodes):
+        """Whether every relationship in `path` joins the given `nodes`."""
+        for i in range(1, len(path), 2):
+            rel = path[i]
+            start, end = nodes[i - 1], nodes[i + 1]
+            if not rel.outgoing:
+                start, end = end, start
+            if not self.find_relationships(start, end, rel.rel_type,
+                                           rel.props):
+                return False
+        return True
+
+    def _unbound_candidates(self, path, i, nodes):
+        """Nodes which could fill position `i` of `path`."""
+        pattern = path[i]
+        code = self._code(self.label_names, pattern.label)
+        for j, k in ((i - 1, i - 2), (i + 1, i + 2)):
+            if 0 <= k < len(path) and nodes[k] is not None:
+                # Follow the relationship back from the bound node
+                rel = path[j]
+                from_unbound = rel.outgoing == (k > i)
+                return [n for n in self.neighbours(nodes[k], rel.rel_type,
+                                                   outgoing=not from_unbound)
+                        if (pattern.label is None
+                            or self.node_labels[n] == code)
+                        and self._has_properties(n, pattern.props)]
+        return self.find_nodes(pattern.label, pattern.props)
+
+    def merge_path(self, path, bindings):
+        """Merge `path`, whose nodes other than one may be in `bindings`.
+
+        As with a Cypher `MERGE`, if the whole path exists nothing is
+        created, otherwise the unbound node, if any, and every relationship
+        are created.
+
+        Returns:
+            dict: `bindings` updated with the unbound node's variable.
+
+        Raises:
+            ValueError: If more than one node isn't bound.
+        """
+        nodes = [bindings.get(p.var) if isinstance(p, NodePattern) else None
+                 for p in path]
+        unbound = [i for i in range(0, len(path), 2) if nodes[i] is None]
+        if len(unbound) > 1:
+            raise ValueError("Can only merge paths with one new node")
+        if unbound:
+            i = unbound[0]
+            for candidate in self._unbound_candidates(path, i, nodes):
+                nodes[i] = candidate
+                if self._path_exists(path, nodes):
+                    break
+            else:
+                nodes[i] = self.add_node(path[i].label, path[i].props)
+                self._create_relationships(path, nodes)
+        elif not self._path_exists(path, nodes):
+            self._create_relationships(path, nodes)
+        if unbound and path[unbound[0]].var:
+            bindings = dict(bindings, **{path[unbound[0]].var:
+                                         nodes[unbound[0]]})
+        return bindings
+
+    def _create_relationships(self, path, nodes):
+        for i in range(1, len(path), 2):
+            rel = path[i]
+            start, end = nodes[i - 1], nodes[i + 1]
+            if not rel.outgoing:
+                start, end = end, start
+            self.add_relationship(start, end, rel.rel_type, rel.props)
+
+    def create_path(self, path, bindings):
+        """Create `path`'s unbound nodes and all its relationships."""
+        nodes = [None] * len(path)
+        for i in range(0, len(path), 2):
+            pattern = path[i]
+            if pattern.var in bindings:
+                nodes[i] = bindings[pattern.var]
+                continue
+            nodes[i] = self.add_node(pattern.label, pattern.props)
+            if pattern.var:
+                bindings = dict(bindings, **{pattern.var: nodes[i]})
+        self._create_relationships(path, nodes)
+        return bindings
+
+    def run_statement(self, statement, params=None):
+        """Run a statement of the form described in the module docstring.
+
+        Returns:
+            int: Number of rows matched by the statement.
+
+        Raises:
+            ValueError: If the statement isn't of a supported form.
+        """
+        rows = [{}]
+        for keyword, paths in parse_statement(statement, params):
+            for path in paths:
+                if keyword == "MATCH":
+                    if len(path) != 1:
+                        raise ValueError("Can only match nodes: {0}"
+                                         .format(statement))
+                    pattern = path[0]
+                    rows = [dict(row, **{pattern.var: node})
+                            if pattern.var else row for row in rows
+                            for node in self.find_nodes(pattern.label,
+                                                        pattern.props)
+                            if row.get(pattern.var, node) == node]
+                elif keyword == "CREATE":
+                    rows = [self.create_path(path, row) for row in rows]
+                else:
+                    rows = [self.merge_path(path, row) for row in rows]
+        return len(rows)
+
+
+class MemoryGraphLoader(object):
+    """In memory stand-in for cymod's `ServerGraphLoader`.
+
+    The loaded graph is in the :attr:`graph` attribute.
+    """
+
+    def __init__(self, graph=None):
+        self.graph = MemoryGraph() if graph is None else graph
+        self._queue = []
+
+    def refresh_graph(self, global_params):
+        """Delete every node whose properties match all of `global_params`.
+        """
+        n_deleted = self.graph.refresh(global_params)
+        logging.info("Deleted {0} nodes from memory graph".format(n_deleted))
+
+    def load_cypher(self, root_dir, cypher_file_suffix=VIEWS_SUFFIX,
+                    global_params=None, views=None):
+        """Queue the views in `root_dir` to be loaded on commit.
+
+        Args:
+            views (list of :obj:`cypher_views.CypherView`, optional):
+                Already parsed views, used instead of reading `root_dir`.
+        """
+        if views is None:
+            views = read_views(root_dir, cypher_file_suffix)
+        self._queue.append(("cypher", views, global_params or {}))
+
+    def load_tabular(self, df, start_state_col, end_state_col, labels=None,
+                     global_params=None):
+        """Queue a transition table to be loaded on commit.
+
+        Args:
+            labels (dict, optional): Labels to use for the 'State',
+                'Transition' and 'Condition' nodes. Defaults to
+                `succession_graph.DEFAULT_LABELS`.
+        """
+        self._queue.append(("tabular", (df, start_state_col, end_state_col,
+                                        labels), global_params or {}))
+
+    def load_transition_summary(self, df, start_state_col, end_state_col,
+                                labels=None, global_params=None):
+        """Queue the `TRANSITIONS_TO` summary of a table to load on commit.
+
+        Existing `TRANSITIONS_TO` relationships of the model are replaced.
+        """
+        self._queue.append(("summary", (df, start_state_col, end_state_col,
+                                        labels), global_params or {}))
+
+    def commit(self):
+        """Load everything queued, in the order it was queued."""
+        for kind, data, params in self._queue:
+            if kind == "cypher":
+                self._run_views(data, params)
+            elif kind == "tabular":
+                self._load_table(*data, global_params=params)
+            else:
+                self._load_summary(*data, global_params=params)
+        self._queue = []
+
+    def _run_views(self, views, params):
+        for view in views:
+            for statement in view.statements:
+                try:
+                    self.graph.run_statement(statement, params)
+                except ValueError as e:
+                    logging.warning("Skipped statement in {0}: {1}".format(
+                        view.name, str(e).splitlines()[0]))
+                    self.graph.skipped.append((view.name, statement))
+
+    def _load_table(self, df, start_col, end_col, labels=None,
+                    global_params=None):
+        labels = dict(DEFAULT_LABELS, **(labels or {}))
+        gp = list((global_params or {}).items())
+        cond_cols = condition_columns(df, start_col, end_col)
+        trans_path = [NodePattern("start", None, {}),
+                      RelPattern("SOURCE", {}, False),
+                      NodePattern("trans", labels["Transition"],
+                                  OrderedDict(gp)),
+                      RelPattern("TARGET", {}, True),
+                      NodePattern("end", None, {})]
+        graph = self.graph
+        for row in succession_rows(df, start_col, end_col):
+            bindings = {k: graph.merge_node(labels["State"], OrderedDict(
+                [("code", row[k])] + gp)) for k in ("start", "end")}
+            bindings = graph.merge_path(trans_path, bindings)
+            graph.merge_path([
+                NodePattern("cond", labels["Condition"], OrderedDict(
+                    [(c, row[c]) for c in cond_cols] + gp)),
+                RelPattern("CAUSES", {}, True),
+                NodePattern("trans", None, {})], bindings)
+
+    def _load_summary(self, df, start_col, end_col, labels=None,
+                      global_params=None):
+        labels = dict(DEFAULT_LABELS, **(labels or {}))
+        gp = list((global_params or {}).items())
+        graph = self.graph
+        states = set(graph.find_nodes(labels["State"], OrderedDict(gp)))
+        graph.delete_relationships(
+            r for r in graph.find_relationships_of_type(SUMMARY_REL_TYPE,
+                                                        OrderedDict(gp))
+            if graph.rel_starts[r] in states)
+        for row in transition_summary_rows(df, start_col, end_col):
+            props = OrderedDict([("min_delta_t", row["min_delta_t"]),
+                                 ("max_delta_t", row["max_delta_t"])] + gp)
+            for start in graph.find_nodes(labels["State"], OrderedDict(
+                    [("code", row["start"])] + gp)):
+                for end in graph.find_nodes(labels["State"], OrderedDict(
+                        [("code", row["end"])] + gp)):
+                    graph.add_relationship(start, end, SUMMARY_REL_TYPE,
+                                           props)
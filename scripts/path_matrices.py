@@ -0,0 +1,316 @@
+"""
+path_matrices.py
+~~~~~~~~~~~~~~~~
+
+Least and greatest times to get from one land cover type to another through
+any chain of transitions.
+
+Variable length path queries against the graph, e.g. "how long does it take
+to get from Burnt to Oak?", enumerate every path and so are slow. Here the
+AgroSuccess transition table is instead turned into matrices of transition
+times between the `AgroSuccessLct` states, indexed by their codes, from
+which
+
+- the least total time along any path between each pair of states is found
+  with the min-plus Floyd-Warshall algorithm,
+- the greatest total time along any path visiting no state twice is found
+  with the max-plus version of the same algorithm, which is exact when there
+  are no cycles between states. Graphs with cycles, of which there are none
+  in the AgroSuccess table, fall back to a search over subsets of states, and
+- which states can be reached from each other is found with Warshall's
+  algorithm.
+
+Matrices are computed either for transitions under any conditions, where the
+least and greatest times of the rules between two states are used, or for
+each combination of conditions (see `transition_lookup.py`), holding the
+conditions fixed along the whole path. Every combination is computed in the
+same array operations.
+
+Self-transitions are ignored. Each state reaches itself in no time, and
+unreachable pairs of states hold `NO_PATH`.
+
+:func:`cached_path_matrices` keeps the results in a `.npz` file next to the
+transition table, recomputing them when the table changes.
+"""
+import os
+import hashlib
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from config import DIRS
+from constants import AgroSuccessLct as AsLct
+from schema import AGROSUCCESS_CONDITION_ENUMS, read_agrosuccess_table
+from transition_lookup import (
+    AXIS_ENUMS,
+    NO_RULE,
+    TransitionLookup,
+    _as_index,
+    enum_codes,
+)
+
+NO_PATH = NO_RULE
+CACHE_VERSION = 1
+MATRICES = ["min_delta_t", "max_delta_t", "reachable"]
+N_STATES = len(AsLct)
+
+
+def edge_times(df, start_col="start", end_col="delta_D", time_col="delta_T",
+               by_conditions=False):
+    """Least and greatest time of a direct transition between each pair.
+
+    Returns:
+        tuple of :obj:`numpy.ndarray`: Least times, with `inf` where there's
+            no transition, and greatest times, with `-inf`. Each has a pair
+            of state axes (start, end) of size `N_STATES`, preceded by an
+            axis for each condition if `by_conditions`.
+    """
+    if by_conditions:
+        lookup = TransitionLookup.from_table(df, start_col, end_col,
+                                             time_col)
+        target = np.moveaxis(lookup.target, 0, -1)
+        delta_t = np.moveaxis(lookup.delta_t, 0, -1)
+        shape = target.shape + (N_STATES,)
+        *cond_index, start = np.nonzero(target != NO_RULE)
+        end = target[tuple(cond_index) + (start,)]
+        times = delta_t[tuple(cond_index) + (start,)]
+        cond_index = tuple(cond_index)
+    else:
+        shape = (N_STATES, N_STATES)
+        start = enum_codes(df[start_col], AsLct)
+        end = enum_codes(df[end_col], AsLct)
+        times = df[time_col].to_numpy()
+        cond_index = ()
+    keep = start != end
+    index = tuple(i[keep] for i in cond_index) + (start[keep], end[keep])
+    min_t = np.full(shape, np.inf)
+    max_t = np.full(shape, -np.inf)
+    np.minimum.at(min_t, index, times[keep])
+    np.maximum.at(max_t, index, times[keep])
+    return min_t, max_t
+
+
+def _with_zero_diagonal(times):
+    times = times.copy()
+    diagonal = np.arange(times.shape[-1])
+    times[..., diagonal, diagonal] = 0
+    return times
+
+
+def shortest_path_times(min_t):
+    """Least total time along any path, `inf` if there's none.
+
+    Args:
+        min_t (:obj:`numpy.ndarray`): Direct transition times, `inf` where
+            there's no transition, with state axes last.
+    """
+    dist = _with_zero_diagonal(min_t)
+    for k in range(dist.shape[-1]):
+        dist = np.minimum(dist, dist[..., :, k, None] + dist[..., None, k, :])
+    return dist
+
+
+def reachability(times):
+    """Whether each state can be reached from each other by any path.
+
+    Args:
+        times (:obj:`numpy.ndarray`): Direct transition times, infinite where
+            there's no transition, with state axes last.
+    """
+    reach = np.isfinite(times)
+    for k in range(reach.shape[-1]):
+        reach = reach | (reach[..., :, k, None] & reach[..., None, k, :])
+    return reach
+
+
+def _longest_simple_paths(max_t):
+    """Greatest time along paths visiting no state twice, in a single graph.
+
+    Keeps the greatest time of paths from each start state ending at each
+    state after visiting each subset of states, so takes time exponential in
+    the number of states. Only used for graphs with cycles.
+    """
+    n = max_t.shape[-1]
+    longest = np.full((n, n), -np.inf)
+    states = np.arange(n)
+    for source in range(n):
+        best = np.full((1 << n, n), -np.inf)
+        best[1 << source, source] = 0
+        for mask in range(1 << n):
+            if not mask & (1 << source) or np.isneginf(best[mask]).all():
+                continue
+            step = (best[mask][:, None] + max_t).max(axis=0)
+            new = states[((mask >> states) & 1 == 0) & np.isfinite(step)]
+            best[mask | (1 << new), new] = np.maximum(
+                best[mask | (1 << new), new], step[new])
+        longest[source] = best.max(axis=0)
+    return longest
+
+
+def longest_path_times(max_t):
+    """Greatest total time along any path visiting no state twice.
+
+    Args:
+        max_t (:obj:`numpy.ndarray`): Direct transition times, `-inf` where
+            there's no transition, with state axes last.
+
+    Returns:
+        :obj:`numpy.ndarray`: Times, `-inf` where there's no path.
+    """
+    dist = _with_zero_diagonal(max_t)
+    for k in range(dist.shape[-1]):
+        dist = np.maximum(dist, dist[..., :, k, None] + dist[..., None, k, :])
+    # Max-plus closure overcounts around cycles, so recompute graphs with any
+    reach = reachability(max_t)
+    diagonal = np.arange(max_t.shape[-1])
+    cyclic = reach[..., diagonal, diagonal].any(axis=-1)
+    for index in np.ndindex(cyclic.shape):
+        if cyclic[index]:
+            dist[index] = _longest_simple_paths(max_t[index])
+    return dist
+
+
+def _as_codes(times):
+    return np.where(np.isfinite(times), times, NO_PATH).astype(np.int32)
+
+
+class PathMatrices(object):
+    """Least and greatest path times and reachability between states.
+
+    Each array has a pair of state axes (start, end) indexed by
+    `AgroSuccessLct` code, preceded by an axis for each of `condition_axes`.
+
+    Attributes:
+        min_delta_t (:obj:`numpy.ndarray`): Least total transition time,
+            `NO_PATH` where there's no path.
+        max_delta_t (:obj:`numpy.ndarray`): Greatest total transition time
+            along a path visiting no state twice, `NO_PATH` where there's no
+            path.
+        reachable (:obj:`numpy.ndarray`): Whether there's a path.
+        condition_axes (list of str): Names of the condition axes, if any.
+    """
+
+    def __init__(self, min_delta_t, max_delta_t, reachable,
+                 condition_axes=()):
+        self.min_delta_t = min_delta_t
+        self.max_delta_t = max_delta_t
+        self.reachable = reachable
+        self.condition_axes = list(condition_axes)
+
+    @classmethod
+    def from_table(cls, df, start_col="start", end_col="delta_D",
+                   time_col="delta_T", by_conditions=False):
+        """Compute the matrices for an AgroSuccess transition table.
+
+        Args:
+            by_conditions (bool, optional): If True, compute matrices for
+                each combination of conditions.
+        """
+        min_t, max_t = edge_times(df, start_col, end_col, time_col,
+                                  by_conditions)
+        return cls(_as_codes(shortest_path_times(min_t)),
+                   _as_codes(longest_path_times(max_t)),
+                   reachability(min_t) | np.eye(N_STATES, dtype=bool),
+                   list(AGROSUCCESS_CONDITION_ENUMS) if by_conditions else ())
+
+    def frame(self, matrix, **conditions):
+        """One of the matrices as a table labelled with state aliases.
+
+        Args:
+            matrix (str): One of `MATRICES`.
+            **conditions: Code or enum member of each condition, required
+                if the matrices are by conditions.
+
+        Returns:
+            :obj:`pandas.DataFrame`: Start states as rows, end states as
+                columns.
+        """
+        if set(conditions) != set(self.condition_axes):
+            raise TypeError("Expected conditions {0}, got {1}".format(
+                self.condition_axes, sorted(conditions)))
+        index = tuple(_as_index(conditions[name], len(trans_enum), name)
+                      for name, trans_enum in AXIS_ENUMS[1:]
+                      if name in conditions)
+        aliases = [s.alias for s in sorted(AsLct, key=lambda s: s.value)]
+        return pd.DataFrame(getattr(self, matrix)[index], index=aliases,
+                            columns=aliases)
+
+    def save(self, path, table_hash):
+        """Write the matrices to a `.npz` file, atomically.
+
+        Args:
+            table_hash (str): Hash of the table they were computed from.
+        """
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, version=CACHE_VERSION, table_hash=table_hash,
+                 condition_axes=np.array(self.condition_axes, dtype=str),
+                 **{name: getattr(self, name) for name in MATRICES})
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, table_hash=None):
+        """Read matrices written by :meth:`save`.
+
+        Returns:
+            :obj:`PathMatrices`: Or None if the file is from another version
+                or, if `table_hash` is given, computed from another table.
+        """
+        with np.load(path) as data:
+            if int(data["version"]) != CACHE_VERSION or (
+                    table_hash is not None
+                    and str(data["table_hash"]) != table_hash):
+                return None
+            return cls(*[data[name] for name in MATRICES],
+                       condition_axes=data["condition_axes"].tolist())
+
+
+def cache_file_for_table(table_path, by_conditions=False):
+    """Path of the cached matrices for the table at `table_path`."""
+    return "{0}.paths{1}.npz".format(os.path.splitext(table_path)[0],
+                                     "_by_conditions" if by_conditions else "")
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cached_path_matrices(table_path, by_conditions=False):
+    """Path matrices for the table at `table_path`, computed at most once.
+
+    Matrices are cached next to the table, see :func:`cache_file_for_table`,
+    and recomputed if the table's contents change.
+
+    Returns:
+        :obj:`PathMatrices`
+    """
+    cache_path = cache_file_for_table(table_path, by_conditions)
+    table_hash = hash_file(table_path)
+    if os.path.isfile(cache_path):
+        matrices = PathMatrices.load(cache_path, table_hash)
+        if matrices is not None:
+            return matrices
+    matrices = PathMatrices.from_table(read_agrosuccess_table(table_path),
+                                       by_conditions=by_conditions)
+    matrices.save(cache_path, table_hash)
+    return matrices
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[4])
+    parser.add_argument("--table", default=os.path.join(
+        DIRS["data"]["created"], "agrosuccess_succession.csv"))
+    args = parser.parse_args()
+
+    matrices = cached_path_matrices(args.table)
+    for name in MATRICES:
+        print(name)
+        print(matrices.frame(name).to_string())
+        print()
+    cached_path_matrices(args.table, by_conditions=True)
+    print("Matrices for each combination of conditions cached in",
+          cache_file_for_table(args.table, by_conditions=True))
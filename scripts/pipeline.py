@@ -0,0 +1,165 @@
+"""
+pipeline.py
+~~~~~~~~~~~
+
+Run a sequence of dataframe transformations, caching each one's output.
+
+Each stage is registered once with a name, a function taking a
+:obj:`pandas.DataFrame` as its first argument and returning a new one, and
+any further keyword arguments to pass to that function. When a cache
+directory is given the output of every stage is pickled there, keyed by a
+hash of
+
+- the stage's input (the hash of the pipeline's input data for the first
+  stage, the previous stage's key thereafter),
+- the source code of the stage's function, and
+- the stage's name and parameters.
+
+On a rerun we find the latest stage whose key is already in the cache, load
+its output, and only execute the stages after it. Note only the source of the
+stage function itself is hashed, not that of helper functions it calls.
+Delete the cache directory if a helper's behaviour changes.
+"""
+import os
+import hashlib
+import inspect
+import logging
+
+import pandas as pd
+
+from instrumentation import instrumented, n_rows
+
+
+def hash_dataframe(df):
+    """Hex digest identifying the contents of a :obj:`pandas.DataFrame`."""
+    h = hashlib.sha256()
+    h.update(repr(list(df.columns)).encode())
+    h.update(repr([str(t) for t in df.dtypes]).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    return h.hexdigest()
+
+
+def _func_source(func):
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return getattr(func, "__qualname__", repr(func))
+
+
+class Stage(object):
+    """A named step in a :obj:`Pipeline`."""
+
+    def __init__(self, name, func, params=None):
+        """
+        Args:
+            name (str): Name of the stage, unique within its pipeline.
+            func (function): Called as ``func(df, **params)``.
+            params (dict, optional): Keyword arguments passed to `func`.
+        """
+        self.name = name
+        self.func = func
+        self.params = params or {}
+
+    def key(self, input_key):
+        """Cache key for this stage's output given the key of its input."""
+        h = hashlib.sha256()
+        h.update(input_key.encode())
+        h.update(self.name.encode())
+        h.update(_func_source(self.func).encode())
+        h.update(repr(sorted(self.params.items())).encode())
+        return h.hexdigest()
+
+    def __call__(self, df):
+        return self.func(df, **self.params)
+
+    def __repr__(self):
+        return "Stage({0!r})".format(self.name)
+
+
+class Pipeline(object):
+    """Ordered collection of :obj:`Stage` objects with an on-disk cache."""
+
+    def __init__(self, cache_dir=None):
+        """
+        Args:
+            cache_dir (str, optional): Directory in which to cache stage
+                outputs. If not given nothing is cached.
+        """
+        self.cache_dir = cache_dir
+        self._stages = []
+        self.executed = []
+
+    @property
+    def stages(self):
+        return list(self._stages)
+
+    def register(self, name, func, **params):
+        """Append a stage to the pipeline.
+
+        Returns:
+            :obj:`Pipeline`: This pipeline, so calls can be chained.
+        """
+        if name in [stage.name for stage in self._stages]:
+            raise ValueError("Pipeline already has a stage called '{0}'"
+                             .format(name))
+        self._stages.append(Stage(name, func, params))
+        return self
+
+    def stage_keys(self, df):
+        """Cache key for the output of each stage given input `df`."""
+        keys = []
+        key = hash_dataframe(df)
+        for stage in self._stages:
+            key = stage.key(key)
+            keys.append(key)
+        return keys
+
+    def _cache_path(self, key):
+        return os.path.join(self.cache_dir, key + ".pkl")
+
+    def _in_cache(self, key):
+        return bool(self.cache_dir) and os.path.isfile(self._cache_path(key))
+
+    def _write_cache(self, key, df):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self._cache_path(key) + ".tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, self._cache_path(key))
+
+    def run(self, df):
+        """Pass `df` through every stage, reusing cached outputs.
+
+        The names of stages actually executed (rather than loaded from the
+        cache or skipped) are recorded in the `executed` attribute. Timing and
+        memory metrics for each stage, and each cache lookup, are recorded
+        using :func:`instrumentation.instrumented`.
+
+        Returns:
+            :obj:`pandas.DataFrame`: Output of the final stage.
+        """
+        self.executed = []
+        keys = self.stage_keys(df) if self.cache_dir else []
+        first = 0
+        for i in reversed(range(len(keys))):
+            if self._in_cache(keys[i]):
+                name = self._stages[i].name
+                with instrumented("cache:" + name) as m:
+                    df = pd.read_pickle(self._cache_path(keys[i]))
+                    m.rows_out = n_rows(df)
+                logging.info("Loaded output of stage '{0}' from cache"
+                             .format(name))
+                first = i + 1
+                break
+
+        for i in range(first, len(self._stages)):
+            stage = self._stages[i]
+            logging.info("Running stage '{0}'".format(stage.name))
+            with instrumented(stage.name, rows_in=n_rows(df)) as m:
+                df = stage(df)
+                m.rows_out = n_rows(df)
+            self.executed.append(stage.name)
+            if keys:
+                self._write_cache(keys[i], df)
+        return df
@@ -0,0 +1,124 @@
+"""
+provision_indexes.py
+~~~~~~~~~~~~~~~~~~~~
+
+Create the indexes used when loading a model, before loading it.
+
+Without indexes, every `MATCH` or `MERGE` on e.g.
+``(:LandCoverType {code:"Oak", model_ID:$model_ID})`` scans every node with
+the label. The properties to index are found by looking for node patterns
+with property maps, like the one above, in
+
+- the views (apart from statements creating a single literal node, whose
+  patterns don't need to be matched against existing nodes), and
+- the statements made by `succession_graph.py` from the succession table,
+  i.e. `code` and the global parameters for states, the global parameters
+  for transitions, and all condition properties for conditions.
+
+A composite index is created for each distinct label and set of properties.
+Composite uniqueness constraints (node keys) are only available in Neo4j
+Enterprise Edition, so indexes are used rather than constraints. We then wait
+for the indexes to come online before loading. Creating an index which
+already exists does nothing.
+"""
+import re
+import time
+import logging
+
+from cypher_views import literal_node
+from graph_db import run_statement
+from instrumentation import instrumented
+from succession_graph import DEFAULT_LABELS, quote_name
+
+INDEX_TIMEOUT_S = 300
+_NODE_PATTERN_RE = re.compile(r"\(\s*\w*\s*:\s*(\w+)\s*\{([^}]*)\}\s*\)")
+_MAP_KEY_RE = re.compile(r"(?:^|,)\s*(\w+)\s*:")
+_CLAUSE_RE = re.compile(
+    r"\b(OPTIONAL\s+MATCH|MATCH|MERGE|CREATE|WITH|RETURN|UNWIND|WHERE|SET"
+    r"|DETACH\s+DELETE|DELETE|REMOVE|ON\s+CREATE|ON\s+MATCH)\b",
+    re.IGNORECASE)
+_MATCHING_CLAUSES = ("MATCH", "MERGE")
+
+
+def pattern_keys(statement):
+    """Label and property names of node patterns matched on.
+
+    Only patterns in `MATCH` and `MERGE` clauses are included, not those in
+    `CREATE` clauses.
+
+    Returns:
+        list of tuple: Label and sorted tuple of property names of each
+            pattern such as ``(n:Label {a:1, b:$b})`` in `statement`.
+    """
+    parts = _CLAUSE_RE.split(statement)
+    keys = []
+    # parts alternates between text and the clause keyword preceding it
+    for keyword, text in zip(parts[1::2], parts[2::2]):
+        clause = " ".join(keyword.upper().split())
+        if not clause.endswith(_MATCHING_CLAUSES) or clause == "ON MATCH":
+            continue
+        keys += [(label, tuple(sorted(_MAP_KEY_RE.findall(props))))
+                 for label, props in _NODE_PATTERN_RE.findall(text)]
+    return keys
+
+
+def view_index_specs(views, params):
+    """Properties matched on by each label in `views`."""
+    specs = []
+    for view in views:
+        for statement in view.statements:
+            if literal_node(statement, params) is not None:
+                continue
+            specs += pattern_keys(statement)
+    return specs
+
+
+def table_index_specs(condition_cols, global_params, labels=None):
+    """Properties matched on when loading the succession table."""
+    labels = dict(DEFAULT_LABELS, **(labels or {}))
+    gp = list(global_params)
+    return [
+        (labels["State"], tuple(sorted(["code"] + gp))),
+        (labels["Transition"], tuple(sorted(gp))),
+        (labels["Condition"], tuple(sorted(list(condition_cols) + gp))),
+    ]
+
+
+def index_specs(views, condition_cols, global_params, labels=None):
+    """Sorted, de-duplicated specs for the views and succession table."""
+    specs = (view_index_specs(views, global_params)
+             + table_index_specs(condition_cols, global_params, labels))
+    return sorted(set(spec for spec in specs if spec[1]))
+
+
+def index_statement(label, props):
+    """Neo4j 3.5 statement creating an index on `label`'s `props`."""
+    return "CREATE INDEX ON :{0}({1})".format(
+        quote_name(label), ", ".join(quote_name(p) for p in props))
+
+
+def provision_indexes(driver, specs, timeout=INDEX_TIMEOUT_S):
+    """Create an index for each spec and wait until they're all online.
+
+    Returns:
+        dict: Seconds spent creating the indexes under 'create_s' and
+            waiting for them under 'await_s'.
+    """
+    start = time.perf_counter()
+    with instrumented("create_indexes") as m:
+        m.extra["n_indexes"] = len(specs)
+        with driver.session() as session:
+            for label, props in specs:
+                logging.info("Creating index on :{0}({1})".format(
+                    label, ", ".join(props)))
+                run_statement(session, index_statement(label, props))
+    created = time.perf_counter()
+    with instrumented("await_indexes"):
+        with driver.session() as session:
+            run_statement(session, "CALL db.awaitIndexes($timeout)",
+                          {"timeout": timeout})
+    timings = {"create_s": created - start,
+               "await_s": time.perf_counter() - created}
+    logging.info("Indexes online after {0:.3f}s creating and {1:.3f}s "
+                 "waiting".format(timings["create_s"], timings["await_s"]))
+    return timings
@@ -0,0 +1,231 @@
+"""
+repurpose_scenarios.py
+~~~~~~~~~~~~~~~~~~~~~~
+
+Repurpose the Millington table for several model variants in parallel.
+
+Each scenario is a variant of the conversion made in
+`repurpose_trans_rules_agrosuccess.py`, with its own state mapping, crop types
+or dropped states. Scenarios are read from a JSON file containing a list of
+objects like::
+
+    [
+        {"name": "default"},
+        {"name": "wheat_only", "crop_types": ["WHEAT"]},
+        {"name": "swap_oak_types",
+         "state_map": {"PINE": "PINE", "TRANSITION_FOREST": "TRANS_FOREST",
+                       "DECIDUOUS": "OAK", "HOLM_OAK": "DECIDUOUS",
+                       "WATER_QUARRY": "WATER_QUARRY", "BURNT": "BURNT"}}
+    ]
+
+where states are given as `MillingtonPaperLct` member names in the keys of
+`state_map` and in `dropped_states`, and as `AgroSuccessLct` member names in
+the values of `state_map` and in `crop_types`. Options which aren't given take
+their defaults from `repurpose_trans_rules_agrosuccess.py`. A `state_map`
+must be 1:1 and can't involve the states renamed or made by other stages, see
+`assert_valid_state_map`, otherwise the scenario fails.
+
+The source table is read and translated once, in the parent process, and
+passed to each worker in a process pool when the worker starts, so it isn't
+re-read or re-sent for every scenario. Each scenario writes its own
+`agrosuccess_succession_<name>.csv`, and a summary of each scenario's runtime
+and outcome is written to `agrosuccess_scenarios_summary.csv`.
+"""
+import os
+import re
+import json
+import time
+import logging
+import argparse
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from config import DIRS, exit_if_file_missing
+from constants import (
+    AgroSuccessLct as AsLct,
+    MillingtonPaperLct as MLct,
+)
+from instrumentation import (
+    instrumented,
+    metrics_file_for_log,
+    n_rows,
+    set_metrics_file,
+)
+from repurpose_trans_rules_agrosuccess import (
+    make_repurpose_pipeline,
+    translate_millington_trans_table,
+)
+from schema import read_millington_table, write_agrosuccess_table
+
+START_COL = "start"
+END_COL = "delta_D"
+SUMMARY_FILE_NAME = "agrosuccess_scenarios_summary.csv"
+
+# Translated source table, set in each worker by `_init_worker`
+_source_df = None
+_worker_config = {}
+
+
+def _members(enum, names, scenario_name):
+    try:
+        return [enum[name] for name in names]
+    except KeyError as e:
+        raise ValueError("Unknown {0} member {1} in scenario '{2}'"
+                         .format(enum.__name__, e, scenario_name))
+
+
+def parse_scenario(spec):
+    """Convert a scenario definition from JSON into pipeline options.
+
+    Args:
+        spec (dict): Scenario definition, see module docstring.
+
+    Returns:
+        dict: Scenario name under 'name' and keyword arguments for
+            :func:`make_repurpose_pipeline` under 'options'.
+    """
+    name = spec.get("name")
+    if not name or not re.match(r"^[\w\-]+$", name):
+        raise ValueError("Scenario names must be non-empty and contain only "
+                         "letters, digits, '_' or '-', got {0!r}".format(name))
+    unknown = set(spec) - {"name", "state_map", "crop_types",
+                           "dropped_states"}
+    if unknown:
+        raise ValueError("Unknown option(s) {0} in scenario '{1}'"
+                         .format(sorted(unknown), name))
+    options = {}
+    if "state_map" in spec:
+        keys = _members(MLct, spec["state_map"].keys(), name)
+        values = _members(AsLct, spec["state_map"].values(), name)
+        options["state_map"] = dict(zip(keys, values))
+    if "crop_types" in spec:
+        options["crop_types"] = _members(AsLct, spec["crop_types"], name)
+    if "dropped_states" in spec:
+        options["dropped_states"] = _members(MLct, spec["dropped_states"],
+                                             name)
+    return {"name": name, "options": options}
+
+
+def read_scenarios(path):
+    """Read and check the list of scenario definitions in JSON file `path`."""
+    with open(path) as f:
+        specs = json.load(f)
+    scenarios = [parse_scenario(spec) for spec in specs]
+    names = [s["name"] for s in scenarios]
+    duplicated = sorted(set(n for n in names if names.count(n) > 1))
+    if duplicated:
+        raise ValueError("Duplicate scenario names: {0}".format(duplicated))
+    return scenarios
+
+
+def scenario_out_file(out_dir, name):
+    return os.path.join(out_dir, "agrosuccess_succession_{0}.csv".format(name))
+
+
+def _init_worker(source_df, out_dir, cache_dir, metrics_file):
+    global _source_df, _worker_config
+    warnings.simplefilter("ignore")
+    _source_df = source_df
+    _worker_config = {"out_dir": out_dir, "cache_dir": cache_dir}
+    set_metrics_file(metrics_file)
+
+
+def run_scenario(scenario):
+    """Repurpose the worker's shared source table for one scenario.
+
+    Exceptions are caught so one failing scenario doesn't stop the others.
+
+    Returns:
+        dict: Summary with the scenario's 'name', 'ok', 'seconds', 'rows'
+            written, output 'file' and any 'error' message.
+    """
+    name = scenario["name"]
+    out_file = scenario_out_file(_worker_config["out_dir"], name)
+    summary = {"name": name, "ok": False, "seconds": None, "rows": None,
+               "file": out_file, "error": None}
+    start = time.perf_counter()
+    try:
+        with instrumented("scenario:" + name, n_rows(_source_df)) as m:
+            pipeline = make_repurpose_pipeline(
+                START_COL, END_COL, cache_dir=_worker_config["cache_dir"],
+                translated=True, **scenario["options"])
+            as_df = pipeline.run(_source_df.copy())
+            write_agrosuccess_table(as_df, out_file)
+            m.rows_out = n_rows(as_df)
+        summary.update({"ok": True, "rows": n_rows(as_df)})
+    except Exception as e:
+        logging.exception("Scenario '{0}' failed".format(name))
+        summary["error"] = "{0}: {1}".format(type(e).__name__, e)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def run_scenarios(source_df, scenarios, out_dir, cache_dir=None,
+                  max_workers=None, metrics_file=None):
+    """Repurpose `source_df` for each scenario using a pool of processes.
+
+    Args:
+        source_df (:obj:`pandas.DataFrame`): Millington table, as returned by
+            :func:`translate_millington_trans_table`.
+        scenarios (list of dict): Scenarios from :func:`read_scenarios`.
+        out_dir (str): Directory to write each scenario's table to.
+        cache_dir (str, optional): Pipeline cache directory shared by all
+            scenarios. Stages' cache keys include their options, so scenarios
+            only share cached outputs where they're identical.
+        max_workers (int, optional): Number of worker processes. Defaults to
+            the number of processors.
+        metrics_file (str, optional): File each worker appends metrics to.
+
+    Returns:
+        :obj:`pandas.DataFrame`: One row of :func:`run_scenario` summary per
+            scenario, in the order given.
+    """
+    with ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_worker,
+            initargs=(source_df, out_dir, cache_dir, metrics_file)) as pool:
+        summaries = list(pool.map(run_scenario, scenarios))
+    return pd.DataFrame(summaries, columns=["name", "ok", "seconds", "rows",
+                                            "file", "error"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[4])
+    parser.add_argument("scenarios_file",
+                        help="JSON file containing scenario definitions.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of worker processes.")
+    parser.add_argument("--out-dir", default=DIRS["data"]["created"])
+    args = parser.parse_args()
+
+    SRC_FILE = os.path.join(
+        DIRS["data"]["tmp"], "millington_succession.csv")
+    exit_if_file_missing(SRC_FILE)
+    SCENARIOS = read_scenarios(args.scenarios_file)
+
+    # set up logging
+    LOG_FILE = os.path.join(
+        DIRS["logs"], os.path.basename(__file__).split(".py")[0] + ".log")
+    logging.basicConfig(filename=LOG_FILE, filemode='w', level=logging.INFO)
+    METRICS_FILE = metrics_file_for_log(LOG_FILE)
+    set_metrics_file(METRICS_FILE)
+
+    warnings.simplefilter("ignore")
+    with instrumented("read_millington_table") as m:
+        m_df = translate_millington_trans_table(
+            read_millington_table(SRC_FILE))
+        m.rows_out = n_rows(m_df)
+
+    CACHE_DIR = os.path.join(DIRS["data"]["tmp"], "repurpose_cache")
+    summary_df = run_scenarios(m_df, SCENARIOS, args.out_dir,
+                               cache_dir=CACHE_DIR,
+                               max_workers=args.workers,
+                               metrics_file=METRICS_FILE)
+    summary_df.to_csv(os.path.join(args.out_dir, SUMMARY_FILE_NAME),
+                      index=False)
+    logging.info("Scenario summary:\n" + summary_df.to_string())
+    print(summary_df[["name", "ok", "seconds", "rows"]].to_string(index=False))
+    if not summary_df["ok"].all():
+        failed = summary_df.loc[~summary_df["ok"], ["name", "error"]]
+        print(failed.to_string(index=False))
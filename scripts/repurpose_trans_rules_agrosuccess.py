@@ -19,6 +19,7 @@ The objectives of this script are are:
 import os
 import sys
 import logging
+import tempfile
 import warnings
 
 import pandas as pd
@@ -32,6 +33,38 @@ from constants import (
     MillingtonPaperLct as MLct,
     AgroSuccessLct as AsLct,
 )
+from condition_key import (
+    KEY_COL,
+    add_condition_key,
+    ensure_condition_key,
+    seed_to_bool,
+)
+from enum_translation import (
+    codes_to_aliases,
+    aliases_to_codes,
+    translate_columns,
+)
+from instrumentation import (
+    instrumented,
+    metrics_file_for_log,
+    n_rows,
+    set_metrics_file,
+)
+from pipeline import Pipeline
+from schema import (
+    REPURPOSING_SCHEMA,
+    apply_schema,
+    read_millington_table,
+    write_agrosuccess_table,
+)
+from state_adjacency import StateAdjacencyIndex
+from trans_table_filters import (
+    drop_rows,
+    drop_states,
+    drop_self_transitions,
+    drop_transitions,
+    self_transition_mask,
+)
 
 # ------------------- Replace codes with human readable names------------------
 def get_translator(trans_enum):
@@ -47,29 +80,79 @@ def get_translator(trans_enum):
                 enum member name after it's been used to replace a codes in
                 the column.
         """
-        df.loc[:,col_name] = df[col_name].apply(lambda x: trans_enum(x).alias)
-        if post_proc_func:
-            df.loc[:,col_name] = df[col_name].apply(post_proc_func)
+        df[col_name] = codes_to_aliases(df[col_name], trans_enum,
+                                        alias_func=post_proc_func,
+                                        col_name=col_name)
         return df
     return code_translator
 
 def millington_trans_table_codes_to_names(df):
     """Replace state/condition codes in Millington trans table with names."""
-    for state_col in ["start", "delta_D"]:
-        df.loc[:,state_col] = df[state_col].apply(lambda x: MLct(x).alias)
-
-    for seed_col in ["pine", "oak", "deciduous"]:
-        df.loc[:,seed_col] = df[seed_col].apply(
-            lambda x: True if SeedPresence(x).alias=="true" else False)
+    col_enum_d = {
+        "start": MLct,
+        "delta_D": MLct,
+        "succession": Succession,
+        "aspect": Aspect,
+        "pine": SeedPresence,
+        "oak": SeedPresence,
+        "deciduous": SeedPresence,
+        "water": Water,
+    }
+    alias_func_d = {seed_col: seed_to_bool
+                    for seed_col in ["pine", "oak", "deciduous"]}
+    return translate_columns(df, col_enum_d, alias_func_d)
 
-    cond_enum_d = {"succession": Succession, "aspect": Aspect, "water": Water}
-    for cond, e in cond_enum_d.items():
-        df.loc[:,cond] = df[cond].apply(lambda x: e(x).alias)
+def translate_millington_trans_table(df):
+    """Replace codes with names and add the packed condition key.
 
-    return df
+    The named columns are converted to `schema.REPURPOSING_SCHEMA`, so the
+    rest of the pipeline works on categoricals rather than object columns.
+    """
+    df = millington_trans_table_codes_to_names(df)
+    return add_condition_key(apply_schema(df, REPURPOSING_SCHEMA))
 
 # -------------- Convert 1:1 mapped state names to AgroSuccess-----------------
-def convert_millington_names_to_agrosuccess(df, start_col, end_col):
+STATE_MAP = {
+    MLct.PINE: AsLct.PINE,
+    MLct.TRANSITION_FOREST: AsLct.TRANS_FOREST,
+    MLct.DECIDUOUS: AsLct.DECIDUOUS,
+    MLct.HOLM_OAK: AsLct.OAK,
+    MLct.WATER_QUARRY: AsLct.WATER_QUARRY,
+    MLct.BURNT: AsLct.BURNT,
+}
+
+# States which other stages rename, and the states they rename them to
+SEPARATELY_HANDLED_MLCTS = [MLct.PASTURE, MLct.SCRUBLAND, MLct.CROPLAND]
+SEPARATELY_MADE_AS_LCTS = [AsLct.WHEAT, AsLct.DAL, AsLct.SHRUBLAND]
+
+def assert_valid_state_map(map_dict):
+    """Check a mapping from Millington to AgroSuccess states can be applied.
+
+    The mapping must be 1:1, so that no two Millington states are merged
+    into one, and mustn't involve the states renamed by other stages.
+    """
+    assert all(isinstance(k, MLct) for k in map_dict.keys()), \
+        "Keys of state map should be MillingtonPaperLct members"
+    assert all(isinstance(v, AsLct) for v in map_dict.values()), \
+        "Values of state map should be AgroSuccessLct members"
+
+    targets = list(map_dict.values())
+    duplicated = sorted({lct.name for lct in targets
+                         if targets.count(lct) > 1})
+    assert not duplicated, \
+        "States mapped to by more than one state: {0}".format(duplicated)
+
+    handled = [lct.name for lct in map_dict.keys()
+               if lct in SEPARATELY_HANDLED_MLCTS]
+    assert not handled, \
+        "LCTs in Millington renamed by other stages: {0}".format(handled)
+
+    made = [lct.name for lct in targets if lct in SEPARATELY_MADE_AS_LCTS]
+    assert not made, \
+        "LCTs in AgroSuccess made by other stages: {0}".format(made)
+
+def convert_millington_names_to_agrosuccess(df, start_col, end_col,
+                                            state_map=None):
     """Apply 1:1 mappings to rename states to match AgroSuccess conventions.
 
     Note that we don't map `URBAN` or `HOLM_OAK_W_PASTURE` from the Millington
@@ -77,76 +160,36 @@ def convert_millington_names_to_agrosuccess(df, start_col, end_col):
     `drop_holm_oak_w_pasture_and_urban`. Likewise `PASTURE` and `SCRUBLAND` are
     handled in `remove_transitions_bw_pasture_and_scrubland`. Finally
     `CROPLAND` is handled separately in `replace_cropland_with_new_crop_types`.
-    """
-    map_dict = {
-        MLct.PINE: AsLct.PINE,
-        MLct.TRANSITION_FOREST: AsLct.TRANS_FOREST,
-        MLct.DECIDUOUS: AsLct.DECIDUOUS,
-        MLct.HOLM_OAK: AsLct.OAK,
-        MLct.WATER_QUARRY: AsLct.WATER_QUARRY,
-        MLct.BURNT: AsLct.BURNT,
-    }
-
-    unmapped_m_lcts = [lct.name for lct in MLct
-                       if lct not in map_dict.keys()]
-    expected_unmapped_lcts = ["PASTURE", "SCRUBLAND", "HOLM_OAK_W_PASTURE",
-                              "CROPLAND", "URBAN"]
-    assert unmapped_m_lcts == expected_unmapped_lcts,\
-        "LCTs in Millington, not used in AgroSuccess"
 
-    unmapped_as_lcts = [lct.name for lct in AsLct
-                        if lct not in map_dict.values()]
-    assert unmapped_as_lcts == ['WHEAT', 'DAL', 'SHRUBLAND'],\
-        "LCTs in AgroSuccess, not used in Millington"
+    Args:
+        state_map (dict, optional): Mapping from `MillingtonPaperLct` to
+            `AgroSuccessLct` members to use instead of `STATE_MAP`, e.g. for
+            a model variant. Checked with `assert_valid_state_map`.
+    """
+    map_dict = STATE_MAP if state_map is None else state_map
+    assert_valid_state_map(map_dict)
 
     for col in [start_col, end_col]:
         for k, v in map_dict.items():
-            df.loc[:,col] = df[col].replace(k.alias, v.alias)
+            df[col] = df[col].replace(k.alias, v.alias)
     return df
 
 # --------------------- Drop URBAN and HOLM_OAK_W_PASTURE ---------------------
 def state_is_exclusive_source_of_other_state(trans_df, state_name, start_col,
-        end_col):
-    """True if at least one state is only accessible from `state_name`."""
-    def tgt_states(df, src_lct_name):
-        """Get the states which can originate from `src_lct_name`.
+        end_col, adjacency=None):
+    """True if at least one state is only accessible from `state_name`.
 
-        Exclude the `src_lct_name` state itself.
+    Args:
+        adjacency (:obj:`StateAdjacencyIndex`, optional): Index already built
+            from `trans_df`. If not given one is built here.
+    """
+    if adjacency is None:
+        adjacency = StateAdjacencyIndex(trans_df, start_col, end_col)
+    if not adjacency.has_start_state(state_name):
+        warnings.warn("No start state called '{0}'".format(state_name))
+        return False
 
-        Returns:
-            list: Names of states which have `src_lct_name` as their source.
-        """
-        all_trans = df.groupby(by=[start_col, end_col]).size().reset_index()
-        if len(all_trans[all_trans[start_col] == src_lct_name]) == 0:
-            warnings.warn("No start state called '{0}'".format(src_lct_name))
-            return []
-        else:
-            tgt_trans = all_trans[(all_trans[start_col] == src_lct_name)
-                                  & (all_trans[end_col] != src_lct_name)]
-            return list(tgt_trans[end_col].values)
-
-    def src_states(df, tgt_lct_name):
-        """Get the states which `tgt_lct_name` can transition from.
-
-        Exclude the `tgt_lct_name` state itself.
-
-        Returns:
-            list: Names of states which can transition to `tgt_lct_name`.
-        """
-        start_col = "start"
-        end_col = "delta_D"
-        all_trans = df.groupby(by=[start_col, end_col]).size().reset_index()
-        src_trans = all_trans[(all_trans[end_col] == tgt_lct_name)
-                              & (all_trans[start_col] != tgt_lct_name)]
-        return list(src_trans[start_col].values)
-
-    states_from_state_name = tgt_states(trans_df, state_name)
-    exclusive_source_for = []
-    for other_state in states_from_state_name:
-        other_state_sources = src_states(trans_df, other_state)
-        other_state_sources.remove(state_name)
-        if len(other_state_sources) < 1:
-            exclusive_source_for.append(other_state)
+    exclusive_source_for = adjacency.exclusive_targets(state_name)
     if exclusive_source_for:
         print("{0} is the only source for states: {1}".format(
             state_name, ", ".join(exclusive_source_for)))
@@ -154,7 +197,48 @@ def state_is_exclusive_source_of_other_state(trans_df, state_name, start_col,
     else:
         return False
 
-def drop_holm_oak_w_pasture_and_urban(df, start_col, end_col):
+DROPPED_MLCTS = [MLct.HOLM_OAK_W_PASTURE, MLct.URBAN]
+
+def assert_dropped_states_not_exclusive_sources(df, start_col, end_col,
+                                                dropped_states=None):
+    """Check dropping states won't leave other states inaccessible.
+
+    States are considered in turn, as if each previous state had already been
+    removed from `df`. Only the distinct start and end state pairs in `df` are
+    used, so `df` may be a table of those pairs rather than the full table.
+
+    Args:
+        dropped_states (list, optional): `MillingtonPaperLct` members to
+            check. Defaults to `DROPPED_MLCTS`.
+    """
+    if dropped_states is None:
+        dropped_states = DROPPED_MLCTS
+    adjacency = StateAdjacencyIndex(df, start_col, end_col)
+    for state in [lct.alias for lct in dropped_states]:
+        assert state_is_exclusive_source_of_other_state(df, state, start_col,
+                    end_col, adjacency=adjacency) == False
+        adjacency.remove_state(state)
+
+def drop_unused_states(df, start_col, end_col, dropped_states=None):
+    """Drop rows involving each of `dropped_states` without any checks.
+
+    Args:
+        dropped_states (list, optional): `MillingtonPaperLct` members to
+            drop. Defaults to `DROPPED_MLCTS`.
+
+    Returns:
+        tuple: The filtered :obj:`pandas.DataFrame` and a dict mapping each
+            dropped state to the number of rows removed for it.
+    """
+    if dropped_states is None:
+        dropped_states = DROPPED_MLCTS
+    n_dropped_d = {}
+    for state in [lct.alias for lct in dropped_states]:
+        df, n_dropped_d[state] = drop_states(df, [state], start_col, end_col)
+    return df, n_dropped_d
+
+def drop_holm_oak_w_pasture_and_urban(df, start_col, end_col,
+                                      dropped_states=None):
     """Remove rows with excluded land cover types as start or end state.
 
     The `URBAN` and `HOLM_OAK_W_PASTURE` land cover types used in Millington
@@ -162,33 +246,32 @@ def drop_holm_oak_w_pasture_and_urban(df, start_col, end_col):
     ensure model integrity I will check that there are no land cover types
     which *only* come about by transition *from* `URBAN` or
     `HOLM_OAK_W_PASTURE`.
-    """
-    def row_excludes_lct(row, lct_name):
-        """Return True if row doesn't have lct as start or end state."""
-        start_col = "start"
-        end_col = "delta_D"
-        if row[start_col] == lct_name or row[end_col] == lct_name:
-            return False
-        else:
-            return True
 
+    Args:
+        dropped_states (list, optional): `MillingtonPaperLct` members to drop
+            instead of those in `DROPPED_MLCTS`, e.g. for a model variant.
+    """
     # Confirm removing these states won't leave any other states in the model
-    # inaccessbile, and remove it.
-    for state in [MLct.HOLM_OAK_W_PASTURE.alias, MLct.URBAN.alias]:
-        assert state_is_exclusive_source_of_other_state(df, state, start_col,
-                    end_col) == False
-        no_rows = len(df.index)
-        df = df[df.apply(lambda x: row_excludes_lct(x, state), axis=1)]
-        assert len(df.index) < no_rows
+    # inaccessbile, and remove them.
+    assert_dropped_states_not_exclusive_sources(df, start_col, end_col,
+                                                dropped_states)
+    df, n_dropped_d = drop_unused_states(df, start_col, end_col,
+                                         dropped_states)
+    assert all(n > 0 for n in n_dropped_d.values())
     return df
 
 # ------------ Replace 'cropland' with 'wheat' and 'DAL' --------
-def replace_cropland_with_new_crop_types(df, start_col, end_col):
+NEW_CROP_TYPES = [AsLct.WHEAT, AsLct.DAL]
+
+def replace_cropland_with_new_crop_types(df, start_col, end_col,
+                                         crop_types=None):
     """Replace Millington's cropland state with wheat and DAL.
 
     Args:
         df (:obj:`pandas.DataFrame`): Original transition table containing
             'cropland' as a land cover state.
+        crop_types (list, optional): `AgroSuccessLct` members to replace
+            cropland with instead of those in `NEW_CROP_TYPES`.
 
     Returns:
         df: A new dataframe where rows representing transitions involving
@@ -204,22 +287,25 @@ def replace_cropland_with_new_crop_types(df, start_col, end_col):
     # Rows from old table where cropland is the transition's starting state
     from_cropland = df[df[start_col] == MLct.CROPLAND.alias]
 
+    if crop_types is None:
+        crop_types = NEW_CROP_TYPES
     new_crop_dfs = []
-    for crop in [AsLct.WHEAT.alias, AsLct.DAL.alias]:
+    for crop in [lct.alias for lct in crop_types]:
         new_crop = from_cropland.copy()
-        new_crop.loc[:,start_col] = crop
+        new_crop[start_col] = pd.Series(crop, index=new_crop.index,
+                                        dtype=from_cropland[start_col].dtype)
         new_crop_dfs.append(new_crop)
 
-    new_df = df.copy()
     # remove old cropland rows
-    new_df = new_df[new_df[start_col] != MLct.CROPLAND.alias]
+    new_df, _ = drop_rows(df, df[start_col].values == MLct.CROPLAND.alias,
+                          "start state is cropland")
     new_df = pd.concat([new_df] + new_crop_dfs)
 
     assert len(new_df.index) == (
         len(df.index) - len(from_cropland.index)
-        + 2 * len(from_cropland.index)), "Each transition rule starting with "\
-        + "'cropland' should be replaced by one each from 'wheat' "\
-        + "and 'DAL' but the resulting numbers of rows don't tally."
+        + len(crop_types) * len(from_cropland.index)), "Each transition rule "\
+        + "starting with 'cropland' should be replaced by one each from "\
+        + "the new crop types but the resulting numbers of rows don't tally."
 
     return new_df
 
@@ -231,21 +317,21 @@ def remove_transitions_bw_pasture_and_scrubland(df, start_col, end_col):
     These two land cover types to subsequently removed and replaced with
     'shrubland' type.
     """
-    scrub_to_pasture = ((df[start_col] == MLct.PASTURE.alias)
-                        & (df[end_col] == MLct.SCRUBLAND.alias))
-    pasture_to_scrub = ((df[start_col] == MLct.SCRUBLAND.alias)
-                        & (df[end_col] == MLct.PASTURE.alias))
-    return df[~scrub_to_pasture & ~pasture_to_scrub]
+    df, _ = drop_transitions(df, [
+        (MLct.PASTURE.alias, MLct.SCRUBLAND.alias),
+        (MLct.SCRUBLAND.alias, MLct.PASTURE.alias),
+    ], start_col, end_col)
+    return df
 
 def duplicates_start_with_pasture_or_scrubland(df, start_col, end_col):
     """DataFrame with duplicated transitions.
 
     All have 'pasture' or 'shrubland' as their start state.
     """
-    cond_cols = ["succession", "aspect", "pine", "oak", "deciduous", "water"]
+    df = ensure_condition_key(df)
     rel_start_df = df[(df[start_col] == MLct.PASTURE.alias)
                     | (df[start_col] == MLct.SCRUBLAND.alias)]
-    duplicate_check_cols = cond_cols + [end_col]
+    duplicate_check_cols = [KEY_COL, end_col]
     duplicates = rel_start_df[rel_start_df.duplicated(duplicate_check_cols,
         keep=False)]
     duplicates = duplicates.sort_values(duplicate_check_cols)
@@ -256,27 +342,21 @@ def duplicates_end_with_pasture_or_scrubland(df, start_col, end_col):
 
     All have 'pasture' or 'shrubland' as their end state.
     """
-    cond_cols = ["succession", "aspect", "pine", "oak", "deciduous", "water"]
+    df = ensure_condition_key(df)
     rel_start_df = df[(df[end_col] == MLct.PASTURE.alias)
                         | (df[end_col] == MLct.SCRUBLAND.alias)]
-    duplicate_check_cols = cond_cols + [start_col]
+    duplicate_check_cols = [KEY_COL, start_col]
     duplicates = rel_start_df[rel_start_df.duplicated(duplicate_check_cols,
         keep=False)]
     duplicates = duplicates.sort_values(duplicate_check_cols)
     return duplicates
 
-def replace_pasture_scrubland_with_shrubland(df, start_col, end_col):
-    """Merge pasture and scrubland state transitions into 'shrubland'.
+def assert_no_pasture_scrubland_duplicates(df, start_col, end_col):
+    """Check merging pasture and scrubland won't cause duplicate transitions.
 
-    1. Remove transitions /between/ scrubland and pasture and vice versa.
-    2. Check there are no duplicate transitions which would be caused by an
-       identical set of conditions leading from or to both pasture and
-       scrubland being merged.
-    3. Rename all instances of either 'scrubland' or 'pasture' to 'shrubland'
-    4. Check for duplicates again.
+    `df` should already have had transitions between pasture and scrubland
+    removed.
     """
-    df = remove_transitions_bw_pasture_and_scrubland(df, start_col, end_col)
-
     duplicates_start = duplicates_start_with_pasture_or_scrubland(df,
                             start_col, end_col)
     assert len(duplicates_start.index) == 0, "No duplicates expected."
@@ -285,15 +365,34 @@ def replace_pasture_scrubland_with_shrubland(df, start_col, end_col):
                             start_col, end_col)
     assert len(duplicates_end.index) == 0, "No duplicates expected."
 
+def rename_pasture_scrubland_to_shrubland(df, start_col, end_col):
+    """Rename all instances of 'scrubland' or 'pasture' to 'shrubland'."""
+    df = df.copy(deep=False)
     for col in [start_col, end_col]:
         for lct in [MLct.SCRUBLAND.alias, MLct.PASTURE.alias]:
-            df.loc[:,col] = df[col].replace(lct, AsLct.SHRUBLAND.alias)
+            df[col] = df[col].replace(lct, AsLct.SHRUBLAND.alias)
+    return df
+
+def assert_no_duplicate_transitions(df, start_col, end_col):
+    """Check no two rows share start state, end state and conditions."""
+    df = ensure_condition_key(df)
+    assert len(df[df.duplicated([KEY_COL, start_col, end_col])].index) == 0,\
+        "There should be no duplicated rows."
 
-    cond_cols = ["succession", "aspect", "pine", "oak", "deciduous", "water"]
-    cond_cols += [start_col, end_col]
-    assert len(df[df.duplicated(cond_cols)].index) == 0, "There should be "\
-        + "no duplicated rows."
+def replace_pasture_scrubland_with_shrubland(df, start_col, end_col):
+    """Merge pasture and scrubland state transitions into 'shrubland'.
 
+    1. Remove transitions /between/ scrubland and pasture and vice versa.
+    2. Check there are no duplicate transitions which would be caused by an
+       identical set of conditions leading from or to both pasture and
+       scrubland being merged.
+    3. Rename all instances of either 'scrubland' or 'pasture' to 'shrubland'
+    4. Check for duplicates again.
+    """
+    df = remove_transitions_bw_pasture_and_scrubland(df, start_col, end_col)
+    assert_no_pasture_scrubland_duplicates(df, start_col, end_col)
+    df = rename_pasture_scrubland_to_shrubland(df, start_col, end_col)
+    assert_no_duplicate_transitions(df, start_col, end_col)
     return df
 
 # ----- Remove transitions starting and ending with same state ----------------
@@ -308,28 +407,197 @@ def remove_end_same_as_start_transitions(df, start_col, end_col):
     AgroSuccess will handle 'no transition' rules differently, so these dummy
     transitions should be excluded.
     """
-    def start_different_to_end(row):
-        if row[start_col] == row[end_col]:
-            return False
-        else:
-            return True
-
-    return df[df.apply(start_different_to_end, axis=1)]
+    df, _ = drop_self_transitions(df, start_col, end_col)
+    return df
 
 # ----------------------- Sort and reindex transition table -------------------
 def sort_and_reindex_trans_table(df, start_col, end_col):
+    """Sort by start state, end state then conditions, and number rows.
+
+    The packed condition key is used to sort on conditions, and is dropped
+    from the returned table.
+    """
+    df = ensure_condition_key(df)
     coded_to_named_d = {"tmp_code_start": start_col, "tmp_code_end": end_col}
     for k, v in coded_to_named_d.items():
-        df.loc[:,k] = df[v].apply(lambda x: AsLct.from_alias(x).value)
+        df.loc[:,k] = aliases_to_codes(df[v], AsLct, col_name=v)
 
-    cond_cols = ["succession", "aspect", "pine", "oak", "deciduous", "water"]
-    s_cols = ["tmp_code_start", "tmp_code_end"] + cond_cols
+    s_cols = ["tmp_code_start", "tmp_code_end", KEY_COL]
     df = df.sort_values(by=s_cols)
     df = df.reset_index()
     df.index.name = "transID"
-    df = df.drop(["index"] + list(coded_to_named_d.keys()), axis=1)
+    df = df.drop(["index", KEY_COL] + list(coded_to_named_d.keys()), axis=1)
     return df
 
+# ------------------------------ Full pipeline --------------------------------
+def make_repurpose_pipeline(start_col, end_col, cache_dir=None,
+                            translated=False, state_map=None,
+                            dropped_states=None, crop_types=None):
+    """Pipeline converting the Millington table to the AgroSuccess table.
+
+    Args:
+        start_col (str): Name of the start state column.
+        end_col (str): Name of the end state column.
+        cache_dir (str, optional): Directory used to cache the output of each
+            stage, see :obj:`pipeline.Pipeline`.
+        translated (bool, optional): If True the pipeline's input will have
+            already been passed through `translate_millington_trans_table`,
+            so the translate stage is omitted.
+        state_map (dict, optional): See
+            `convert_millington_names_to_agrosuccess`.
+        dropped_states (list, optional): See
+            `drop_holm_oak_w_pasture_and_urban`.
+        crop_types (list, optional): See
+            `replace_cropland_with_new_crop_types`.
+    """
+    cols = {"start_col": start_col, "end_col": end_col}
+    pipeline = Pipeline(cache_dir)
+    if not translated:
+        pipeline.register("translate", translate_millington_trans_table)
+    # Only pass variant options which are set, so the default pipeline's
+    # cache keys don't depend on them
+    def variant(**kwargs):
+        d = dict(cols)
+        d.update({k: v for k, v in kwargs.items() if v is not None})
+        return d
+    return (
+        pipeline
+        .register("map_names", convert_millington_names_to_agrosuccess,
+                  **variant(state_map=state_map))
+        .register("drop_states", drop_holm_oak_w_pasture_and_urban,
+                  **variant(dropped_states=dropped_states))
+        .register("replace_cropland", replace_cropland_with_new_crop_types,
+                  **variant(crop_types=crop_types))
+        .register("merge_shrubland", replace_pasture_scrubland_with_shrubland,
+                  **cols)
+        .register("drop_self_transitions",
+                  remove_end_same_as_start_transitions, **cols)
+        .register("sort", sort_and_reindex_trans_table, **cols)
+    )
+
+# ----------------------------- Streaming pipeline ----------------------------
+def _spill(df, bucket_dir, prefix, start_col, end_col):
+    """Append the rows of `df` to one csv file per start and end state pair.
+
+    Returns:
+        set: Names of the files appended to, relative to `bucket_dir`.
+    """
+    names = set()
+    for (start, end), rows in df.groupby([start_col, end_col], sort=False,
+                                         observed=True):
+        name = "{0}_{1}_{2}.csv".format(
+            prefix, AsLct.from_alias(start).value, AsLct.from_alias(end).value)
+        path = os.path.join(bucket_dir, name)
+        rows.to_csv(path, mode="a", index=False,
+                    header=not os.path.exists(path))
+        names.add(name)
+    return names
+
+def _repurpose_chunk(chunk, start_col, end_col, totals, bucket_dir):
+    """Apply the row-local stages of the pipeline to one chunk of the table.
+
+    The rows output, and the self-transitions dropped after merging pasture
+    and scrubland, are appended to files in `bucket_dir` split by start and
+    end state, see :func:`_spill`. The start and end state pairs seen before
+    any states are dropped, and the number of rows dropped for each dropped
+    state, are added to `totals`.
+
+    Returns:
+        int: Number of rows output.
+    """
+    chunk = translate_millington_trans_table(chunk)
+    chunk = convert_millington_names_to_agrosuccess(chunk, start_col, end_col)
+    totals["state_pairs"].update(zip(chunk[start_col], chunk[end_col]))
+
+    chunk, n_dropped_d = drop_unused_states(chunk, start_col, end_col)
+    for state, n in n_dropped_d.items():
+        totals["n_dropped"][state] = totals["n_dropped"].get(state, 0) + n
+
+    chunk = replace_cropland_with_new_crop_types(chunk, start_col, end_col)
+    chunk = remove_transitions_bw_pasture_and_scrubland(chunk, start_col,
+                                                        end_col)
+    chunk = rename_pasture_scrubland_to_shrubland(chunk, start_col, end_col)
+    is_self = self_transition_mask(chunk, start_col, end_col)
+    totals["self_buckets"] |= _spill(
+        chunk.loc[is_self, [KEY_COL, start_col, end_col]], bucket_dir, "self",
+        start_col, end_col)
+    chunk = chunk[~is_self]
+    totals["buckets"] |= _spill(chunk, bucket_dir, "rows", start_col, end_col)
+    return n_rows(chunk)
+
+def _bucket_order(name):
+    """Sort key of a bucket file: its start then end state code."""
+    return tuple(int(code) for code in name[:-len(".csv")].split("_")[1:])
+
+def repurpose_in_chunks(src_file, out_file, start_col, end_col, chunksize,
+                        tmp_dir=None):
+    """Convert the Millington table to the AgroSuccess table chunk by chunk.
+
+    Only `chunksize` rows of the source table are read into memory at a
+    time. Stages which act on each row independently are applied to each
+    chunk as it's read, and the rows output are appended to a temporary file
+    for their start and end states. Only the set of start and end state
+    pairs and the numbers of rows dropped are kept in memory, for the checks
+    that dropped states aren't the exclusive source of any other state.
+
+    Rows which share start and end states and conditions are in the same
+    temporary file, so each file is then read in turn, in order of start and
+    end state, checked for duplicate transitions (which would also be caused
+    by merging pasture and scrubland), sorted on conditions, numbered and
+    appended to `out_file`. Peak memory is therefore that of a chunk or of
+    the rules for one pair of states, whichever is larger. The file written
+    is identical to that written from the pipeline returned by
+    :func:`make_repurpose_pipeline`.
+
+    Args:
+        src_file (str): Path to the Millington transition table csv file.
+        out_file (str): Path to write the AgroSuccess table to.
+        start_col (str): Name of the start state column.
+        end_col (str): Name of the end state column.
+        chunksize (int): Number of rows of `src_file` to process at a time.
+        tmp_dir (str, optional): Directory in which to make the temporary
+            files. Defaults to the system's temporary directory.
+
+    Returns:
+        int: Number of rows written.
+    """
+    totals = {"state_pairs": set(), "n_dropped": {}, "buckets": set(),
+              "self_buckets": set()}
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as bucket_dir:
+        for i, chunk in enumerate(read_millington_table(src_file,
+                                                        chunksize=chunksize)):
+            with instrumented("chunk", rows_in=n_rows(chunk)) as m:
+                m.rows_out = _repurpose_chunk(chunk, start_col, end_col,
+                                              totals, bucket_dir)
+                m.extra["chunk"] = i
+
+        with instrumented("global_checks"):
+            assert_dropped_states_not_exclusive_sources(
+                pd.DataFrame(sorted(totals["state_pairs"]),
+                             columns=[start_col, end_col]),
+                start_col, end_col)
+            for lct in DROPPED_MLCTS:
+                assert totals["n_dropped"].get(lct.alias, 0) > 0
+            for name in totals["self_buckets"]:
+                assert_no_duplicate_transitions(
+                    pd.read_csv(os.path.join(bucket_dir, name)),
+                    start_col, end_col)
+
+        n_written = 0
+        with instrumented("sort_and_write") as m:
+            for name in sorted(totals["buckets"], key=_bucket_order):
+                df = pd.read_csv(os.path.join(bucket_dir, name))
+                assert_no_duplicate_transitions(df, start_col, end_col)
+                df = df.sort_values(KEY_COL, kind="mergesort").drop(
+                    columns=KEY_COL)
+                df.index = pd.RangeIndex(n_written, n_written + n_rows(df),
+                                         name="transID")
+                write_agrosuccess_table(df, out_file, mode="a" if n_written
+                                        else "w", header=not n_written)
+                n_written += n_rows(df)
+            m.rows_out = n_written
+    return n_written
+
 
 if __name__ == "__main__":
     # I've done my best to remove instances of setting with copy but this warning
@@ -349,6 +617,7 @@ if __name__ == "__main__":
     LOG_FILE = os.path.join(
         DIRS["logs"], os.path.basename(__file__).split(".py")[0] + ".log")
     logging.basicConfig(filename=LOG_FILE, filemode='w', level=logging.INFO)
+    set_metrics_file(metrics_file_for_log(LOG_FILE))
 
     # Make reference to output file name
     OUT_FILE = os.path.join(
@@ -357,14 +626,22 @@ if __name__ == "__main__":
     # Process Millington transition table
     START_COL = "start"
     END_COL = "delta_D"
-    m_df = pd.read_csv(SRC_FILE)
-    m_df = millington_trans_table_codes_to_names(m_df)
-    as_df = m_df.copy()
-    as_df = convert_millington_names_to_agrosuccess(as_df, START_COL, END_COL)
-    as_df = drop_holm_oak_w_pasture_and_urban(as_df, START_COL, END_COL)
-    as_df = replace_cropland_with_new_crop_types(as_df, START_COL, END_COL)
-    as_df = replace_pasture_scrubland_with_shrubland(as_df, START_COL, END_COL)
-    as_df = remove_end_same_as_start_transitions(as_df, START_COL, END_COL)
-    as_df = sort_and_reindex_trans_table(as_df, START_COL, END_COL)
-    as_df.to_csv(OUT_FILE)
+    # Set to a number of rows to process the source table in chunks of that
+    # size, for tables too large to comfortably fit in memory.
+    CHUNKSIZE = None
+    if CHUNKSIZE:
+        repurpose_in_chunks(SRC_FILE, OUT_FILE, START_COL, END_COL,
+                            CHUNKSIZE)
+    else:
+        CACHE_DIR = os.path.join(DIRS["data"]["tmp"], "repurpose_cache")
+        pipeline = make_repurpose_pipeline(START_COL, END_COL,
+                                           cache_dir=CACHE_DIR)
+        with instrumented("read_millington_table") as m:
+            m_df = read_millington_table(SRC_FILE)
+            m.rows_out = n_rows(m_df)
+        as_df = pipeline.run(m_df)
+        logging.info("Stages executed: {0}".format(
+            ", ".join(pipeline.executed)))
+        with instrumented("write_agrosuccess_table", rows_in=n_rows(as_df)):
+            write_agrosuccess_table(as_df, OUT_FILE)
 
@@ -0,0 +1,165 @@
+"""
+schema.py
+~~~~~~~~~
+
+Compact column types for the Millington and AgroSuccess transition tables.
+
+Left to its own devices pandas reads state and condition names as object
+columns, storing a pointer to a Python string for every cell, and reads small
+integer codes as int64. The schemas here are derived from the enums in
+`constants.py`, so that
+
+- in the Millington table (which uses numerical codes) every state and
+  condition column is an int8, and
+- in the AgroSuccess table (which uses names) state and multi-valued
+  condition columns are categoricals whose categories are the enum aliases,
+  and seed presence columns are bools.
+
+Both use an int16 for the transition time. Categorical columns are written
+out as their human readable names.
+
+`REPURPOSING_SCHEMA` is used for the named table while it's converted from
+one to the other, so it's held in compact columns from the moment the codes
+are translated. Its state categories include both the Millington and the
+AgroSuccess names, as states are renamed part way through.
+"""
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from constants import (
+    Succession,
+    Aspect,
+    SeedPresence,
+    Water,
+    MillingtonPaperLct as MLct,
+    AgroSuccessLct as AsLct,
+)
+
+TIME_DTYPE = np.int16
+
+# column name -> enum giving the column's domain, in table order
+_MILLINGTON_ENUMS = OrderedDict([
+    ("start", MLct),
+    ("succession", Succession),
+    ("aspect", Aspect),
+    ("pine", SeedPresence),
+    ("oak", SeedPresence),
+    ("deciduous", SeedPresence),
+    ("water", Water),
+    ("delta_D", MLct),
+])
+
+_AGROSUCCESS_ENUMS = OrderedDict(
+    [("start", AsLct)] + list(_MILLINGTON_ENUMS.items())[1:-1]
+    + [("delta_D", AsLct)])
+
+# condition column name -> enum giving the column's domain, in table order
+AGROSUCCESS_CONDITION_ENUMS = OrderedDict(
+    list(_AGROSUCCESS_ENUMS.items())[1:-1])
+
+
+def enum_category_dtype(trans_enum):
+    """Categorical dtype whose categories are the aliases of `trans_enum`."""
+    return pd.CategoricalDtype([member.alias for member in trans_enum])
+
+
+def _named_dtype(trans_enum):
+    if trans_enum is SeedPresence:
+        return np.dtype(bool)
+    return enum_category_dtype(trans_enum)
+
+
+MILLINGTON_SCHEMA = OrderedDict(
+    [(col, np.dtype(np.int8)) for col in _MILLINGTON_ENUMS]
+    + [("delta_T", np.dtype(TIME_DTYPE))])
+
+AGROSUCCESS_SCHEMA = OrderedDict(
+    [(col, _named_dtype(e)) for col, e in _AGROSUCCESS_ENUMS.items()]
+    + [("delta_T", np.dtype(TIME_DTYPE))])
+
+_STATE_NAMES = list(OrderedDict.fromkeys(
+    [member.alias for member in MLct] + [member.alias for member in AsLct]))
+
+REPURPOSING_SCHEMA = OrderedDict(
+    (col, pd.CategoricalDtype(_STATE_NAMES) if col in ("start", "delta_D")
+     else dtype) for col, dtype in AGROSUCCESS_SCHEMA.items())
+
+
+def _check_codes(df, col_enum_d):
+    for col, trans_enum in col_enum_d.items():
+        codes = [member.value for member in trans_enum]
+        unknown = ~df[col].isin(codes)
+        if unknown.any():
+            raise ValueError("Unknown {0} code(s) in column '{1}': {2}".format(
+                trans_enum.__name__, col, sorted(set(df.loc[unknown, col]))))
+
+
+def _check_categories(df, schema):
+    for col, dtype in schema.items():
+        if isinstance(dtype, pd.CategoricalDtype) and df[col].isna().any():
+            raise ValueError("Values in column '{0}' not in categories {1}"
+                             .format(col, list(dtype.categories)))
+
+
+def apply_schema(df, schema):
+    """Copy of `df` with its columns converted to the dtypes in `schema`.
+
+    Columns of `df` not in `schema` are left as they are. `df` itself is not
+    changed.
+
+    Raises:
+        KeyError: If a column in `schema` is missing from `df`.
+        ValueError: If a value doesn't belong to its column's categories.
+    """
+    missing = [col for col in schema if col not in df.columns]
+    if missing:
+        raise KeyError("Columns missing from table: {0}".format(missing))
+    df = df.copy(deep=False)
+    for col, dtype in schema.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            unknown = ~df[col].isin(dtype.categories) & df[col].notna()
+            if unknown.any():
+                raise ValueError("Unknown value(s) in column '{0}': {1}"
+                                 .format(col, sorted(set(df.loc[unknown, col]),
+                                                     key=str)))
+        df[col] = df[col].astype(dtype)
+    return df
+
+
+def read_millington_table(path, **kwargs):
+    """Read the coded Millington table using `MILLINGTON_SCHEMA`.
+
+    Additional keyword arguments are passed to :func:`pandas.read_csv`, e.g.
+    `chunksize`.
+
+    Raises:
+        ValueError: If a column contains a code not in the column's enum.
+    """
+    reader = pd.read_csv(path, dtype=MILLINGTON_SCHEMA, **kwargs)
+    if isinstance(reader, pd.DataFrame):
+        _check_codes(reader, _MILLINGTON_ENUMS)
+        return reader
+
+    def checked_chunks():
+        for chunk in reader:
+            _check_codes(chunk, _MILLINGTON_ENUMS)
+            yield chunk
+    return checked_chunks()
+
+
+def read_agrosuccess_table(path, **kwargs):
+    """Read the named AgroSuccess table using `AGROSUCCESS_SCHEMA`.
+
+    Raises:
+        ValueError: If a column contains a name not in the column's enum.
+    """
+    df = pd.read_csv(path, dtype=AGROSUCCESS_SCHEMA, **kwargs)
+    _check_categories(df, AGROSUCCESS_SCHEMA)
+    return df
+
+
+def write_agrosuccess_table(df, path, **kwargs):
+    """Write the AgroSuccess table after converting it to its schema."""
+    apply_schema(df, AGROSUCCESS_SCHEMA).to_csv(path, **kwargs)
@@ -0,0 +1,125 @@
+"""
+state_adjacency.py
+~~~~~~~~~~~~~~~~~~
+
+Adjacency index over the states in a land cover transition table.
+
+The index is built with a single pass over the table's distinct
+(start state, end state) pairs. Afterwards questions such as "which states
+can only be reached from this state?" or "which states can't be reached from
+any other state?" are answered from in-memory sets without touching the
+table again.
+
+Self-transitions (start state equal to end state) are ignored throughout, as
+they don't make any state reachable from another.
+"""
+from collections import defaultdict
+
+
+class StateAdjacencyIndex(object):
+    """In- and out-edges between states in a transition table."""
+
+    def __init__(self, df, start_col, end_col):
+        """Build the index from a transition table.
+
+        Args:
+            df (:obj:`pandas.DataFrame`): Transition table.
+            start_col (str): Name of the column containing start states.
+            end_col (str): Name of the column containing end states.
+        """
+        self._out_edges = defaultdict(set)
+        self._in_edges = defaultdict(set)
+        self._self_transitions = set()
+        pairs = df[[start_col, end_col]].drop_duplicates()
+        self._states = set(pairs[start_col]) | set(pairs[end_col])
+        self._start_states = set(pairs[start_col])
+        for start, end in zip(pairs[start_col].values, pairs[end_col].values):
+            if start != end:
+                self._out_edges[start].add(end)
+                self._in_edges[end].add(start)
+            else:
+                self._self_transitions.add(start)
+
+    @property
+    def states(self):
+        """All states appearing as a start or end state."""
+        return set(self._states)
+
+    def has_start_state(self, state):
+        """True if any transition in the table starts from `state`."""
+        return state in self._start_states
+
+    def targets(self, state):
+        """States which can be reached directly from `state`."""
+        return set(self._out_edges.get(state, ()))
+
+    def sources(self, state):
+        """States from which `state` can be reached directly."""
+        return set(self._in_edges.get(state, ()))
+
+    def in_degree(self, state):
+        """Number of other states from which `state` can be reached."""
+        return len(self._in_edges.get(state, ()))
+
+    def out_degree(self, state):
+        """Number of other states which can be reached from `state`."""
+        return len(self._out_edges.get(state, ()))
+
+    def exclusive_targets(self, state):
+        """States which can *only* be reached from `state`.
+
+        Returns:
+            list: Sorted names of states whose only source is `state`.
+        """
+        return sorted(tgt for tgt in self._out_edges.get(state, ())
+                      if self._in_edges[tgt] == {state})
+
+    def is_exclusive_source(self, state):
+        """True if at least one state is only accessible from `state`."""
+        return len(self.exclusive_targets(state)) > 0
+
+    def exclusive_sources(self):
+        """Map each state to the states which can only be reached from it.
+
+        States which aren't the exclusive source of any other state are
+        omitted.
+        """
+        result = {}
+        for state in sorted(self._states, key=str):
+            exclusive = self.exclusive_targets(state)
+            if exclusive:
+                result[state] = exclusive
+        return result
+
+    def orphan_states(self):
+        """States which can't be reached from any other state.
+
+        Returns:
+            list: Sorted names of states with an in-degree of zero.
+        """
+        return sorted((s for s in self._states if self.in_degree(s) == 0),
+                      key=str)
+
+    def remove_state(self, state):
+        """Remove `state` and all transitions to or from it from the index.
+
+        Mirrors dropping all rows with `state` as start or end state from the
+        underlying table, without needing to rebuild the index. States left
+        without transitions to other states, or to themselves, are no longer
+        start states, and states left in no transitions at all are removed.
+        """
+        targets = self._out_edges.pop(state, set())
+        sources = self._in_edges.pop(state, set())
+        for tgt in targets:
+            self._in_edges[tgt].discard(state)
+        for src in sources:
+            self._out_edges[src].discard(state)
+        self._states.discard(state)
+        self._start_states.discard(state)
+        self._self_transitions.discard(state)
+        for other in targets | sources:
+            if (not self._out_edges.get(other)
+                    and other not in self._self_transitions):
+                self._start_states.discard(other)
+                if not self._in_edges.get(other):
+                    self._states.discard(other)
@@ -0,0 +1,170 @@
+"""
+statement_profiling.py
+~~~~~~~~~~~~~~~~~~~~~~
+
+Profile each statement sent to the database while loading a model.
+
+Stage metrics from `instrumentation.py` show how long the whole load takes,
+but not which statements are slow. When a :obj:`StatementProfiler` is set
+with :func:`set_profiler`, every statement run by
+:func:`graph_db.run_statement` is recorded with
+
+- its source, e.g. the view it came from or the rows of the succession table
+  in its batch, and its position within that source,
+- the `model_ID` parameter it was run with,
+- the time taken to run it and consume its result,
+- the numbers of nodes, relationships and properties it created or set, and
+- optionally, the total database hits reported when it's run with `PROFILE`.
+
+Running statements with `PROFILE` makes them slower, so database hits are
+only collected when asked for, and only for statements given a source
+(statements such as `CREATE INDEX` can't be profiled).
+
+:meth:`StatementProfiler.report` ranks the sources of a model's statements by
+the total time they took.
+"""
+import os
+import re
+import time
+import threading
+
+import pandas as pd
+
+RECORD_COLUMNS = ["model_ID", "source", "index", "seconds", "nodes_created",
+                  "relationships_created", "properties_set", "db_hits"]
+REPORT_COLUMNS = ["source", "statements", "seconds", "max_seconds",
+                  "nodes_created", "relationships_created", "properties_set",
+                  "db_hits"]
+COUNTERS = ["nodes_created", "relationships_created", "properties_set"]
+_profiler = None
+
+
+def set_profiler(profiler):
+    """Set the profiler recording statements, or None to stop profiling."""
+    global _profiler
+    _profiler = profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+def report_file_for_log(log_file, model_id):
+    """Name of the profile report for `model_id` to write by `log_file`."""
+    return "{0}.profile_{1}.csv".format(os.path.splitext(log_file)[0],
+                                        re.sub(r"[^\w.-]", "_", str(model_id)))
+
+
+def table_source(table_name, first_row, n_rows):
+    """Source name for a batch of `n_rows` rows from a table."""
+    return "{0} rows {1}-{2}".format(table_name, first_row,
+                                     first_row + n_rows - 1)
+
+
+def _plan_value(plan, key, attr):
+    """Value from a plan given as a dict or an object, depending on driver."""
+    if isinstance(plan, dict):
+        return plan.get(key)
+    return getattr(plan, attr, None)
+
+
+def total_db_hits(plan):
+    """Database hits of a profiled plan and all its children."""
+    if plan is None:
+        return None
+    hits = _plan_value(plan, "dbHits", "db_hits") or 0
+    for child in _plan_value(plan, "children", "children") or []:
+        hits += total_db_hits(child)
+    return hits
+
+
+def summary_counters(summary):
+    """Counters of a result summary, zero where not available."""
+    counters = getattr(summary, "counters", None)
+    return {k: getattr(counters, k, 0) or 0 for k in COUNTERS}
+
+
+class StatementProfiler(object):
+    """Records the cost of each statement run. Safe to share across threads.
+    """
+
+    def __init__(self, db_hits=False):
+        """
+        Args:
+            db_hits (bool, optional): If True, run statements with a source
+                prefixed with `PROFILE` and record their database hits.
+        """
+        self.db_hits = db_hits
+        self.records = []
+        self._lock = threading.Lock()
+
+    def run(self, session, statement, parameters, source=None, index=0):
+        """Run `statement` in `session`, recording its cost.
+
+        Args:
+            source (str, optional): Where the statement came from. Defaults
+                to its first line.
+            index (int, optional): Position of the statement in `source`.
+
+        Returns:
+            Summary of the statement's result.
+        """
+        profile = self.db_hits and source is not None
+        if source is None:
+            source = statement.strip().splitlines()[0][:80]
+        start = time.perf_counter()
+        summary = session.run(("PROFILE " if profile else "") + statement,
+                              parameters).consume()
+        record = {"model_ID": parameters.get("model_ID"), "source": source,
+                  "index": index, "seconds": time.perf_counter() - start,
+                  "db_hits": None}
+        record.update(summary_counters(summary))
+        if profile:
+            record["db_hits"] = total_db_hits(getattr(summary, "profile",
+                                                      None))
+        with self._lock:
+            self.records.append(record)
+        return summary
+
+    def statements(self, model_id=None):
+        """Record of each statement as a :obj:`pandas.DataFrame`.
+
+        Args:
+            model_id (str, optional): Only include statements run with this
+                `model_ID` parameter.
+        """
+        with self._lock:
+            records = list(self.records)
+        df = pd.DataFrame(records, columns=RECORD_COLUMNS)
+        if model_id is not None:
+            df = df[df["model_ID"] == model_id]
+        return df.reset_index(drop=True)
+
+    def report(self, model_id=None):
+        """Sources of statements ranked by the total time they took.
+
+        Returns:
+            :obj:`pandas.DataFrame`: For each source, the number of
+                'statements', their total and largest 'seconds', total
+                counters and total 'db_hits', slowest first.
+        """
+        df = self.statements(model_id)
+        grouped = df.groupby("source", sort=False)
+        report = pd.DataFrame({
+            "statements": grouped.size(),
+            "seconds": grouped["seconds"].sum(),
+            "max_seconds": grouped["seconds"].max(),
+        })
+        for col in COUNTERS:
+            report[col] = grouped[col].sum()
+        # Keep db_hits missing where no statement was profiled
+        report["db_hits"] = grouped["db_hits"].sum(min_count=1)
+        report = report.reset_index().reindex(columns=REPORT_COLUMNS)
+        return report.sort_values("seconds", ascending=False,
+                                  kind="mergesort").reset_index(drop=True)
+
+    def write_report(self, path, model_id=None):
+        """Write :meth:`report` to a CSV file at `path`."""
+        report = self.report(model_id)
+        report.to_csv(path, index=False)
+        return report
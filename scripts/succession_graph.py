@@ -0,0 +1,248 @@
+"""
+succession_graph.py
+~~~~~~~~~~~~~~~~~~~
+
+Load the AgroSuccess succession table into Neo4j in batches.
+
+Cymod's `ServerGraphLoader.load_tabular` turns each row of the transition
+table into its own statement, so loading the table takes one round trip to
+the database per row. Here rows are instead sent as a list parameter to a
+statement of the form ``UNWIND $rows AS row MERGE ...``, one statement per
+batch of rows.
+
+The statement makes the same graph as `load_tabular`: for each row
+
+- the start and end states are merged as `State` nodes with properties
+  `code` and the global parameters,
+- a `Transition` node with the global parameters as properties is merged with
+  `SOURCE` and `TARGET` relationships to the start and end states, and
+- a `Condition` node whose properties are every other column in the table
+  and the global parameters is merged with a `CAUSES` relationship to the
+  transition,
+
+where the labels are those given in `DEFAULT_LABELS` unless overridden.
+
+:func:`load_transition_summary` adds a `TRANSITIONS_TO` relationship between
+each pair of states with a transition, with the least and greatest
+transition times as properties. These are aggregated from the table with
+pandas, see :func:`summarise_millington_table.summarise_transitions`, and
+written in a single batched statement.
+"""
+import time
+import logging
+
+from graph_db import run_statement
+from instrumentation import instrumented
+from schema import read_agrosuccess_table
+from statement_profiling import table_source
+from summarise_millington_table import summarise_transitions
+
+DEFAULT_LABELS = {
+    "State": "LandCoverType",
+    "Transition": "SuccessionTrajectory",
+    "Condition": "EnvironCondition",
+}
+DEFAULT_BATCH_SIZE = 1000
+ROWS_PARAM = "rows"
+TABLE_NAME = "succession_table"
+TIME_COL = "delta_t"
+SUMMARY_REL_TYPE = "TRANSITIONS_TO"
+SUMMARY_NAME = "transition_summary"
+
+
+def quote_name(name):
+    """Quote `name` for use as a Cypher label or property key."""
+    return "`" + name.replace("`", "``") + "`"
+
+
+def property_map(row_props, global_params):
+    """Cypher map literal of properties taken from `row` and parameters.
+
+    Args:
+        row_props (list of tuple): Pairs of property name and the key of
+            `row` holding its value.
+        global_params (dict): Parameters whose values are passed to the
+            statement as parameters of the same name.
+    """
+    items = ["{0}:row.{1}".format(quote_name(k), quote_name(r))
+             for k, r in row_props]
+    items += ["{0}:${0}".format(quote_name(k)) for k in global_params]
+    return "{" + ", ".join(items) + "}"
+
+
+def read_succession_table(path):
+    """Read the AgroSuccess table with columns named as in the graph.
+
+    The transition time column `delta_T` is renamed `delta_t`, the name of
+    the corresponding `Condition` node property.
+    """
+    return read_agrosuccess_table(path).rename(columns={"delta_T": "delta_t"})
+
+
+def condition_columns(df, start_col, end_col):
+    """Columns of `df` which become properties of each condition node."""
+    return [col for col in df.columns if col not in (start_col, end_col)]
+
+
+def unwind_statement(condition_cols, global_params, labels=None):
+    """Statement merging the graph for each row in the `$rows` parameter.
+
+    Args:
+        condition_cols (list of str): Keys of each row used as condition
+            properties. Each row also has keys 'start' and 'end' giving the
+            codes of its start and end states.
+        global_params (dict): Parameters to add as properties to every node.
+            Their values are passed as statement parameters.
+        labels (dict, optional): Labels to use for the 'State', 'Transition'
+            and 'Condition' nodes. Defaults to `DEFAULT_LABELS`.
+    """
+    if ROWS_PARAM in global_params:
+        raise ValueError("Global parameter name '{0}' is reserved for the "
+                         "rows of each batch".format(ROWS_PARAM))
+    labels = dict(DEFAULT_LABELS, **(labels or {}))
+    state, trans, cond = [quote_name(labels[k])
+                          for k in ("State", "Transition", "Condition")]
+    return "\n".join([
+        "UNWIND ${0} AS row".format(ROWS_PARAM),
+        "MERGE (start:{0} {1})".format(
+            state, property_map([("code", "start")], global_params)),
+        "MERGE (end:{0} {1})".format(
+            state, property_map([("code", "end")], global_params)),
+        "MERGE (start)<-[:SOURCE]-(trans:{0} {1})-[:TARGET]->(end)".format(
+            trans, property_map([], global_params)),
+        "MERGE (cond:{0} {1})-[:CAUSES]->(trans)".format(
+            cond, property_map([(c, c) for c in condition_cols],
+                                global_params)),
+    ])
+
+
+def succession_rows(df, start_col, end_col):
+    """Rows of the transition table as dicts of Python values.
+
+    The start and end states are given under the keys 'start' and 'end'.
+    Other columns keep their names.
+    """
+    cols = condition_columns(df, start_col, end_col)
+    columns = [df[start_col].tolist(), df[end_col].tolist()]
+    columns += [df[col].tolist() for col in cols]
+    keys = ["start", "end"] + cols
+    return [dict(zip(keys, values)) for values in zip(*columns)]
+
+
+def iter_batches(rows, batch_size):
+    """Yield consecutive slices of `rows` of at most `batch_size` items."""
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive, got {0}"
+                         .format(batch_size))
+    for i in range(0, len(rows), batch_size):
+        yield rows[i:i + batch_size]
+
+
+def load_succession_batched(driver, df, start_col, end_col, global_params,
+                            labels=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Merge the transition table `df` into the graph in batches.
+
+    Each batch is sent in its own session as a single statement. The time
+    each batch takes is recorded using :func:`instrumentation.instrumented`.
+
+    Args:
+        driver (:obj:`neo4j.Driver`): Driver connected to the database, see
+            :func:`graph_db.connect`.
+        df (:obj:`pandas.DataFrame`): Transition table, e.g. as returned by
+            `agrosuccess_succession_df` in `load_agrosuccess_model.py`.
+        start_col (str): Name of the start state column.
+        end_col (str): Name of the end state column.
+        global_params (dict): Parameters such as `model_ID` to add as
+            properties to every node.
+        labels (dict, optional): See :func:`unwind_statement`.
+        batch_size (int, optional): Number of rows in each statement.
+
+    Returns:
+        list of dict: For each batch, its index under 'batch', number of
+            'rows' and 'seconds' taken.
+    """
+    statement = unwind_statement(
+        condition_columns(df, start_col, end_col), global_params, labels)
+    rows = succession_rows(df, start_col, end_col)
+    timings = []
+    for i, batch in enumerate(iter_batches(rows, batch_size)):
+        start = time.perf_counter()
+        with instrumented("load_tabular_batch", rows_in=len(batch)) as m:
+            m.extra["batch"] = i
+            with driver.session() as session:
+                run_statement(session, statement,
+                              dict(global_params, **{ROWS_PARAM: batch}),
+                              source=table_source(TABLE_NAME,
+                                                  i * batch_size, len(batch)))
+        seconds = time.perf_counter() - start
+        timings.append({"batch": i, "rows": len(batch), "seconds": seconds})
+        logging.info("Loaded batch {0} ({1} rows) in {2:.3f}s"
+                     .format(i, len(batch), seconds))
+    return timings
+
+
+def transition_summary_rows(df, start_col, end_col):
+    """Least and greatest transition times between each pair of states.
+
+    Returns:
+        list of dict: For each pair of states with a transition, its 'start'
+            and 'end' states and 'min_delta_t' and 'max_delta_t'.
+    """
+    summary = summarise_transitions(df, start_col, end_col, TIME_COL,
+                                    drop_self_transitions=False)
+    return [{"start": start, "end": end, "min_delta_t": int(lo),
+             "max_delta_t": int(hi)} for (start, end), lo, hi in zip(
+                 summary.index, summary["min_" + TIME_COL],
+                 summary["max_" + TIME_COL])]
+
+
+def summary_statements(global_params, labels=None):
+    """Statements replacing the model's `TRANSITIONS_TO` relationships.
+
+    Returns:
+        tuple of str: Statement deleting existing relationships, and
+            statement creating one for each row in the `$rows` parameter.
+    """
+    if ROWS_PARAM in global_params:
+        raise ValueError("Global parameter name '{0}' is reserved for the "
+                         "rows of each batch".format(ROWS_PARAM))
+    labels = dict(DEFAULT_LABELS, **(labels or {}))
+    state = quote_name(labels["State"])
+    rel_type = quote_name(SUMMARY_REL_TYPE)
+    delete = "MATCH (:{0} {1})-[tr:{2} {1}]->() DELETE tr".format(
+        state, property_map([], global_params), rel_type)
+    create = "\n".join([
+        "UNWIND ${0} AS row".format(ROWS_PARAM),
+        "MATCH (src:{0} {1}), (tgt:{0} {2})".format(
+            state, property_map([("code", "start")], global_params),
+            property_map([("code", "end")], global_params)),
+        "CREATE (src)-[:{0} {1}]->(tgt)".format(rel_type, property_map(
+            [("min_delta_t", "min_delta_t"), ("max_delta_t", "max_delta_t")],
+            global_params)),
+    ])
+    return delete, create
+
+
+def load_transition_summary(driver, df, start_col, end_col, global_params,
+                            labels=None):
+    """Replace the model's `TRANSITIONS_TO` relationships using table `df`.
+
+    The states must already be in the graph. Any existing `TRANSITIONS_TO`
+    relationships between them are deleted first, so the summary can be
+    reloaded after the table changes.
+
+    Returns:
+        int: Number of relationships created.
+    """
+    rows = transition_summary_rows(df, start_col, end_col)
+    delete, create = summary_statements(global_params, labels)
+    with instrumented("load_transition_summary", rows_in=len(df.index)) as m:
+        with driver.session() as session:
+            run_statement(session, delete, global_params, source=SUMMARY_NAME)
+            run_statement(session, create,
+                          dict(global_params, **{ROWS_PARAM: rows}),
+                          source=SUMMARY_NAME, index=1)
+        m.rows_out = len(rows)
+    logging.info("Loaded {0} {1} relationships".format(len(rows),
+                                                       SUMMARY_REL_TYPE))
+    return len(rows)
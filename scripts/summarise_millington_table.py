@@ -3,26 +3,77 @@ import os
 import pandas as pd
 
 from config import DIRS
+from schema import read_agrosuccess_table, read_millington_table
 
 
-def summarise_millington_succession():
+def summarise_transitions(df, start_col='start', end_col='delta_D',
+                          time_col='delta_T', drop_self_transitions=True):
+    """Range in transition times for each pair of start and end states.
+
+    Args:
+        df (:obj:`pd.DataFrame`): Transition table.
+        start_col (str, optional): Name of the start state column.
+        end_col (str, optional): Name of the end state column.
+        time_col (str, optional): Name of the transition time column.
+        drop_self_transitions (bool, optional): If True, leave out rules
+            whose start and end states are the same.
+
+    Returns:
+        :obj:`pd.DataFrame`: Indexed by start and end state, with columns
+            'min_<time_col>' and 'max_<time_col>'. Only pairs of states with
+            a rule are included.
+    """
+    if drop_self_transitions:
+        df = df[df[start_col] != df[end_col]]
+    return (
+        df.groupby(by=[start_col, end_col], observed=True)
+        .agg(**{'min_' + time_col: pd.NamedAgg(column=time_col,
+                                               aggfunc='min'),
+                'max_' + time_col: pd.NamedAgg(column=time_col,
+                                               aggfunc='max')})
+    )
+
+
+def summarise_millington_succession(path=None):
     """Summary table of possible transitions between land-cover states.
 
     Shows which start and end states are possible, and what the range in time
     periods for these transitions to occur under different environmental
     conditions are.
+
+    Args:
+        path (str, optional): Path to the Millington transition table. Defaults
+            to `millington_succession.csv` in the tmp data directory.
     """
-    return (
-        pd.read_csv(os.path.join(DIRS['data']['tmp'],
-                                 'millington_succession.csv'))
-        .pipe(lambda df: df[df['start'] != df['delta_D']])
-        .groupby(by=['start', 'delta_D'])
-        .agg(min_delta_T=pd.NamedAgg(column='delta_T', aggfunc='min'),
-             max_delta_T=pd.NamedAgg(column='delta_T', aggfunc='max'))
-    )
+    if path is None:
+        path = os.path.join(DIRS['data']['tmp'], 'millington_succession.csv')
+    return summarise_transitions(read_millington_table(path))
+
+
+def summarise_agrosuccess_succession(path=None):
+    """Summary table of transitions in the AgroSuccess transition table.
+
+    As :func:`summarise_millington_succession`, except that rules whose start
+    and end states are the same are kept, as in the `TRANSITIONS_TO`
+    relationships in the AgroSuccess graph.
+
+    Args:
+        path (str, optional): Path to the AgroSuccess transition table.
+            Defaults to `agrosuccess_succession.csv` in the created data
+            directory.
+    """
+    if path is None:
+        path = os.path.join(DIRS['data']['created'],
+                            'agrosuccess_succession.csv')
+    return summarise_transitions(read_agrosuccess_table(path),
+                                 drop_self_transitions=False)
 
 
 if __name__ == '__main__':
     summary_file = os.path.join(DIRS['data']['tmp'],
                                 'millington_summary_table.csv')
     summarise_millington_succession().to_csv(summary_file, header=True)
+    agrosuccess_summary_file = os.path.join(DIRS['data']['tmp'],
+                                            'agrosuccess_summary_table.csv')
+    summarise_agrosuccess_succession().to_csv(agrosuccess_summary_file,
+                                              header=True)
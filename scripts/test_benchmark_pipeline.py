@@ -0,0 +1,44 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from benchmark_pipeline import (
+    _format_records,
+    compare_to_baseline,
+    run_benchmarks,
+)
+from repurpose_trans_rules_agrosuccess import make_repurpose_pipeline
+
+
+class BenchmarkPipelineTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with redirect_stdout(io.StringIO()):
+            cls.records = run_benchmarks([100], repeat=1)
+
+    def test_one_record_per_function(self):
+        stages = ["repurpose." + stage.func.__name__ for stage
+                  in make_repurpose_pipeline("start", "delta_D").stages]
+        self.assertEqual([r["function"] for r in self.records],
+                         stages + ["summarise.summarise_millington_succession",
+                                   "clean.millington_succession_html_to_csv"])
+        for r in self.records:
+            self.assertGreaterEqual(r["table_rows"], 100)
+            self.assertGreater(r["n_rows"], 0)
+            if r.get("skipped"):
+                self.assertIn(r["function"], _format_records([r]))
+                self.assertIn("skipped", _format_records([r]))
+            else:
+                self.assertGreaterEqual(r["seconds"], 0)
+                self.assertGreater(r["peak_mb"], 0)
+
+    def test_compare_to_baseline(self):
+        slower = [dict(r, seconds=r["seconds"] * 2) for r in self.records
+                  if not r.get("skipped")]
+        comparison = compare_to_baseline(slower, self.records)
+        self.assertEqual(len(comparison), len(slower))
+        self.assertTrue(all(c["regression"] for c in comparison))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import struct
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from binary_rules import (
+    ALIGNMENT,
+    FORMAT_VERSION,
+    MAGIC,
+    read_rule_table,
+    write_rule_table,
+)
+from transition_lookup import TransitionLookup
+from test_transition_lookup import agrosuccess_table
+
+
+class BinaryRulesTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.df = agrosuccess_table()
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "rules.bin")
+        write_rule_table(self.path, self.df, "m")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_round_trip(self):
+        table = read_rule_table(self.path)
+        self.assertEqual(table.model_id, "m")
+        self.assertEqual(len(table), len(self.df.index))
+        pd.testing.assert_frame_equal(table.to_frame(), self.df)
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_columns_memory_mapped_and_aligned(self):
+        table = read_rule_table(self.path)
+        for col in table.columns.values():
+            self.assertIsInstance(col, np.memmap)
+            self.assertFalse(col.flags.writeable)
+            self.assertEqual(col.offset % ALIGNMENT, 0)
+        self.assertEqual(table.columns["delta_T"].dtype, np.dtype("<i2"))
+
+    def test_lookup_matches_table(self):
+        from_file = read_rule_table(self.path).to_lookup()
+        from_table = TransitionLookup.from_table(self.df)
+        for attr in ["target", "delta_t", "rule_id"]:
+            np.testing.assert_array_equal(getattr(from_file, attr),
+                                          getattr(from_table, attr))
+
+    def test_rejects_other_files(self):
+        with open(self.path, "r+b") as f:
+            f.write(b"NOTRULES")
+        with self.assertRaises(ValueError):
+            read_rule_table(self.path)
+        with open(self.path, "r+b") as f:
+            f.write(struct.pack("<8sI", MAGIC, FORMAT_VERSION + 1))
+        with self.assertRaises(ValueError):
+            read_rule_table(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
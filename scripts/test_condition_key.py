@@ -0,0 +1,63 @@
+import itertools
+import unittest
+
+import pandas as pd
+
+from condition_key import (
+    COND_COLS,
+    KEY_BITS,
+    KEY_COL,
+    add_condition_key,
+    join_on_conditions,
+    pack_conditions,
+    unpack_condition_key,
+)
+
+
+def all_named_conditions():
+    rows = itertools.product(["regeneration", "secondary"], ["north", "south"],
+                             [False, True], [False, True], [False, True],
+                             ["xeric", "mesic", "hydric"])
+    return pd.DataFrame(list(rows), columns=COND_COLS)
+
+
+class ConditionKeyTestCase(unittest.TestCase):
+    def setUp(self):
+        self.df = all_named_conditions()
+
+    def test_keys_fit_in_seven_bits_and_are_unique(self):
+        keys = pack_conditions(self.df)
+        self.assertEqual(KEY_BITS, 7)
+        self.assertEqual(len(set(keys)), len(self.df.index))
+        self.assertLess(keys.max(), 2 ** 7)
+
+    def test_round_trip_named(self):
+        unpacked = unpack_condition_key(pack_conditions(self.df))
+        pd.testing.assert_frame_equal(unpacked, self.df, check_dtype=False)
+
+    def test_round_trip_coded(self):
+        coded = unpack_condition_key(pack_conditions(self.df), coded=True)
+        self.assertEqual(list(pack_conditions(coded, coded=True)),
+                         list(pack_conditions(self.df)))
+
+    def test_key_order_matches_named_column_order(self):
+        shuffled = self.df.sample(frac=1, random_state=1)
+        by_cols = shuffled.sort_values(COND_COLS).index
+        by_key = (add_condition_key(shuffled.copy())
+                  .sort_values(KEY_COL).index)
+        self.assertEqual(list(by_cols), list(by_key))
+
+    def test_unknown_value_raises(self):
+        df = self.df.head(2).copy()
+        df["water"] = ["xeric", "damp"]
+        with self.assertRaisesRegex(ValueError, "'water'"):
+            pack_conditions(df)
+
+    def test_join_on_conditions(self):
+        left = add_condition_key(self.df.head(4).copy())
+        right = add_condition_key(self.df.iloc[2:6].copy())
+        self.assertEqual(len(join_on_conditions(left, right[[KEY_COL]])), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
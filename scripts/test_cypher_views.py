@@ -0,0 +1,120 @@
+import os
+import tempfile
+import unittest
+
+from cypher_views import (
+    ViewCache,
+    literal_node,
+    parse_dependencies,
+    parse_property_map,
+    parse_view_text,
+    read_views,
+)
+
+VIEW_TEXT = """//=====================================
+// file: a/b_w.cql
+// dependencies:
+//     abstract/Agent_w.cql
+//     abstract/LandCoverType_w.cql
+// external parameters:
+//     model_ID
+//=====================================
+
+{
+  "priority": 2
+}
+
+// 1. A node; with a comment
+MERGE (:LandCoverType {description:"Water/ Quarry; wet", code:"WaterQuarry",
+                       num:0, model_ID:$model_ID, mature:false});
+
+// 2. Something else
+MATCH (n:LandCoverType {model_ID:$model_ID}) RETURN n;
+"""
+
+
+class CypherViewsTestCase(unittest.TestCase):
+    def test_parse_view_text(self):
+        view = parse_view_text(VIEW_TEXT, "x", "a/b_w.cql")
+        self.assertEqual(view.priority, 2)
+        self.assertEqual(view.dependencies, ["abstract/Agent_w.cql",
+                                             "abstract/LandCoverType_w.cql"])
+        self.assertEqual(len(view.statements), 2)
+        self.assertTrue(view.statements[1].startswith("MATCH"))
+
+    def test_dependencies(self):
+        self.assertEqual(parse_dependencies(
+            "// dependencies:\n//     none\n// description:\n"), [])
+        self.assertIsNone(parse_dependencies("{}"))
+
+    def test_literal_node(self):
+        statements = parse_view_text(VIEW_TEXT, "x", "y").statements
+        label, props = literal_node(statements[0], {"model_ID": "m"})
+        self.assertEqual(label, "LandCoverType")
+        self.assertEqual(dict(props), {
+            "description": "Water/ Quarry; wet", "code": "WaterQuarry",
+            "num": 0, "model_ID": "m", "mature": False})
+        self.assertIsNone(literal_node(statements[1], {"model_ID": "m"}))
+        with self.assertRaises(ValueError):
+            parse_property_map("{a: 1 + 2}")
+
+    def test_read_views_in_priority_order(self):
+        with tempfile.TemporaryDirectory() as views_dir:
+            os.makedirs(os.path.join(views_dir, "a"))
+            for name, priority in [("a/z_w.cql", 0), ("b_w.cql", 1),
+                                   ("c.cql", 0)]:
+                with open(os.path.join(views_dir, name), "w") as f:
+                    f.write('{"priority": %d}\nRETURN 1;' % priority)
+            self.assertEqual([v.name for v in read_views(views_dir)],
+                             ["a/z_w.cql", "b_w.cql"])
+
+
+class ViewCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.views_dir = os.path.join(self.tmpdir.name, "views")
+        self.cache_file = os.path.join(self.tmpdir.name, "cache.pkl")
+        os.makedirs(self.views_dir)
+        for name in ["a_w.cql", "b_w.cql"]:
+            self.write(name, "RETURN 1;")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, body, mtime=None):
+        path = os.path.join(self.views_dir, name)
+        with open(path, "w") as f:
+            f.write('{"priority": 0}\n' + body)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def read(self):
+        cache = ViewCache(self.cache_file)
+        return read_views(self.views_dir, cache=cache), cache
+
+    def test_only_changed_files_parsed(self):
+        views, cache = self.read()
+        self.assertEqual((cache.n_parsed, cache.n_reused), (2, 0))
+        _, cache = self.read()
+        self.assertEqual((cache.n_parsed, cache.n_reused), (0, 2))
+
+        # Touched but unchanged file is hashed, not re-parsed
+        self.write("a_w.cql", "RETURN 1;", mtime=1e9)
+        _, cache = self.read()
+        self.assertEqual((cache.n_parsed, cache.n_reused), (0, 2))
+
+        self.write("b_w.cql", "RETURN 2; RETURN 3;", mtime=2e9)
+        views, cache = self.read()
+        self.assertEqual((cache.n_parsed, cache.n_reused), (1, 1))
+        self.assertEqual(views[1].statements, ["RETURN 2", "RETURN 3"])
+
+    def test_removed_files_pruned(self):
+        self.read()
+        os.remove(os.path.join(self.views_dir, "b_w.cql"))
+        views, cache = self.read()
+        self.assertEqual([v.name for v in views], ["a_w.cql"])
+        self.assertEqual(len(cache._entries), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+import pandas as pd
+
+from constants import (
+    SeedPresence,
+    Water,
+    MillingtonPaperLct as MLct,
+    AgroSuccessLct as AsLct,
+)
+from enum_translation import (
+    codes_to_aliases,
+    aliases_to_codes,
+    translate_columns,
+)
+
+
+class CodesToAliasesTestCase(unittest.TestCase):
+    def test_matches_elementwise_enum_lookup(self):
+        codes = pd.Series([11, 1, 3, 3, 10, 7])
+        expected = [MLct(x).alias for x in codes]
+        self.assertEqual(list(codes_to_aliases(codes, MLct)), expected)
+
+    def test_alias_func_applied(self):
+        codes = pd.Series([0, 1, 1])
+        result = codes_to_aliases(codes, SeedPresence,
+                                  alias_func=lambda x: x == "true")
+        self.assertEqual(list(result), [False, True, True])
+
+    def test_categorical_output(self):
+        result = codes_to_aliases(pd.Series([2, 0]), Water,
+                                  as_categorical=True)
+        self.assertIsInstance(result, pd.Categorical)
+        self.assertEqual(list(result), ["hydric", "xeric"])
+        self.assertEqual(list(result.categories), ["xeric", "mesic", "hydric"])
+
+    def test_unknown_code_raises(self):
+        with self.assertRaisesRegex(ValueError, r"Water code\(s\) in column "
+                                    r"'water': \[3, 7\]"):
+            codes_to_aliases(pd.Series([0, 7, 3, 7]), Water, col_name="water")
+
+
+class AliasesToCodesTestCase(unittest.TestCase):
+    def test_agrosuccess_aliases(self):
+        aliases = pd.Series(["Oak", "WaterQuarry", "DAL"])
+        self.assertEqual(list(aliases_to_codes(aliases, AsLct)), [8, 0, 3])
+
+    def test_unknown_alias_raises(self):
+        with self.assertRaises(ValueError):
+            aliases_to_codes(pd.Series(["Oak", "oak"]), AsLct)
+
+
+class TranslateColumnsTestCase(unittest.TestCase):
+    def test_translates_only_given_columns(self):
+        df = pd.DataFrame({"start": [1, 2], "water": [0, 2],
+                           "delta_T": [5, 6]})
+        df = translate_columns(df, {"start": MLct, "water": Water})
+        self.assertEqual(list(df["start"]), ["pine", "transition_forest"])
+        self.assertEqual(list(df["water"]), ["xeric", "hydric"])
+        self.assertEqual(list(df["delta_T"]), [5, 6])
+
+
+if __name__ == "__main__":
+    unittest.main()
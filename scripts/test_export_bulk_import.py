@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+from config import DIRS
+from export_bulk_import import (
+    export_counts,
+    export_model,
+    verify_export,
+)
+from generate_trans_table import generate_base_table
+from repurpose_trans_rules_agrosuccess import make_repurpose_pipeline
+from schema import write_agrosuccess_table
+from succession_graph import read_succession_table
+
+VIEWS_DIR = os.path.join(DIRS["scripts"], "..", "views")
+
+
+class ExportBulkImportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.table = os.path.join(self.tmpdir.name, "as.csv")
+        df = make_repurpose_pipeline("start", "delta_D").run(
+            generate_base_table())
+        write_agrosuccess_table(df, self.table)
+        self.out_dir = os.path.join(self.tmpdir.name, "out")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read(self, name):
+        with open(os.path.join(self.out_dir, name)) as f:
+            return f.read()
+
+    def test_export_verifies_and_is_deterministic(self):
+        params = {"model_ID": "test"}
+        export_model(VIEWS_DIR, self.table, params, self.out_dir)
+        df = read_succession_table(self.table)
+        self.assertEqual(verify_export(self.out_dir, df), [])
+        node_counts, rel_counts, _ = export_counts(self.out_dir)
+        # States are those defined in views, not duplicated by the table
+        self.assertEqual(node_counts["LandCoverType"], 9)
+        self.assertEqual(node_counts["AgentType"], 1)
+        self.assertTrue(self.read("nodes_EnvironCondition.csv").startswith(
+            ":ID,transID:long,succession,aspect,pine:boolean"))
+        post_import = self.read("post_import.cql")
+        self.assertIn("activities_w.cql", post_import)
+        self.assertTrue(post_import.rstrip().endswith(
+            "SET m.generation = randomUUID(), m.loaded_at = timestamp();"))
+        self.assertTrue(self.read("relationships_TRANSITIONS_TO.csv")
+                        .startswith(":START_ID,:END_ID,min_delta_t:long,"
+                                    "max_delta_t:long,model_ID,:TYPE"))
+
+        first = self.read("relationships.csv")
+        export_model(VIEWS_DIR, self.table, params, self.out_dir)
+        self.assertEqual(self.read("relationships.csv"), first)
+
+    def test_verify_detects_missing_rows(self):
+        export_model(VIEWS_DIR, self.table, {"model_ID": "test"},
+                     self.out_dir)
+        df = read_succession_table(self.table)
+        problems = verify_export(self.out_dir, df.iloc[:-1])
+        self.assertTrue(any("EnvironCondition" in p for p in problems))
+
+
+if __name__ == "__main__":
+    unittest.main()
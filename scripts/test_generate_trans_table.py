@@ -0,0 +1,42 @@
+import unittest
+
+from constants import MillingtonPaperLct as MLct, Succession
+from generate_trans_table import (
+    COLUMNS,
+    SCENARIO_COL,
+    generate_base_table,
+    generate_millington_table_of_size,
+    iter_scenarios,
+)
+from schema import MILLINGTON_SCHEMA, apply_schema
+
+
+class GenerateTransTableTestCase(unittest.TestCase):
+    def test_base_table_matches_millington_schema(self):
+        df = generate_base_table()
+        self.assertEqual(list(df.columns), COLUMNS)
+        self.assertEqual(list(df.columns), list(MILLINGTON_SCHEMA))
+        df = apply_schema(df, MILLINGTON_SCHEMA)
+        codes = {lct.value for lct in MLct}
+        self.assertTrue(set(df["start"]) <= codes)
+        self.assertTrue(set(df["delta_D"]) <= codes)
+        self.assertFalse((df["delta_D"] == MLct.CROPLAND.value).any())
+        from_cropland = df[df["start"] == MLct.CROPLAND.value]
+        self.assertTrue((from_cropland["succession"]
+                         == Succession.SECONDARY.value).all())
+        self.assertFalse(df.duplicated(COLUMNS[:-2]).any())
+
+    def test_table_of_size_stacks_scenarios(self):
+        n_base = len(generate_base_table().index)
+        df = generate_millington_table_of_size(n_base + 1, seed=1)
+        self.assertEqual(len(df.index), 2 * n_base)
+        self.assertEqual(list(df.columns), COLUMNS + [SCENARIO_COL])
+        scenarios = list(iter_scenarios(df))
+        self.assertEqual(len(scenarios), 2)
+        self.assertEqual(list(scenarios[1].columns), COLUMNS)
+        self.assertTrue((scenarios[1]["delta_T"].values
+                         >= scenarios[0]["delta_T"].values).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
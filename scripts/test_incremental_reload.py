@@ -0,0 +1,162 @@
+import unittest
+
+import pandas as pd
+
+from incremental_reload import (
+    GraphDiff,
+    ModelState,
+    apply_diff,
+    incremental_reload,
+    read_graph_state,
+    table_state,
+)
+from test_succession_graph import (
+    RecordingDriver,
+    RecordingSession,
+    succession_df,
+)
+
+PARAMS = {"model_ID": "m"}
+
+
+class FakeSession(RecordingSession):
+    """Session returning canned records for `read_graph_state`.
+
+    Other statements, i.e. writes, are recorded in `log`.
+    """
+
+    def __init__(self, state, log=None):
+        super(FakeSession, self).__init__([] if log is None else log)
+        self.state = state
+
+    def run(self, statement, parameters=None):
+        if "properties(c)" in statement:
+            return [{"node_id": 100 + i, "props": dict(props),
+                     "start": key[0], "end": key[1]}
+                    for i, (key, (props, _))
+                    in enumerate(self.state.conditions.items())]
+        if "RETURN DISTINCT s.code" in statement:
+            return [{"start": s, "end": e}
+                    for s, e in self.state.transitions]
+        return super(FakeSession, self).run(statement, parameters)
+
+
+class FakeDriver(RecordingDriver):
+    """Driver for a graph loaded from table `df`."""
+
+    def __init__(self, df):
+        super(FakeDriver, self).__init__()
+        self.state = table_state(df, "start", "delta_D", PARAMS)
+
+    def session(self):
+        return FakeSession(self.state, self.log)
+
+
+def graph_state(df):
+    """State read back from a graph loaded from `df`."""
+    return read_graph_state(FakeSession(table_state(df, "start", "delta_D",
+                                                    PARAMS)), PARAMS)
+
+
+class IncrementalReloadTestCase(unittest.TestCase):
+    def setUp(self):
+        self.df = succession_df()
+        self.current = graph_state(self.df)
+
+    def diff(self, df):
+        return GraphDiff(self.current,
+                         table_state(df, "start", "delta_D", PARAMS))
+
+    def test_unchanged_table_is_empty_diff(self):
+        diff = self.diff(self.df)
+        self.assertTrue(diff.is_empty)
+        driver = RecordingDriver()
+        apply_diff(driver, diff, PARAMS)
+        self.assertEqual(driver.log, [])
+
+    def test_changed_time_updates_one_condition(self):
+        df = self.df.copy()
+        df.loc[1, "delta_t"] = 5
+        diff = self.diff(df)
+        self.assertEqual([u["node_id"] for u in diff.update_conditions],
+                         [101])
+        self.assertEqual(diff.update_conditions[0]["props"]["delta_t"], 5)
+        self.assertEqual(sum(diff.counts().values()), 1)
+
+    def test_added_removed_and_updated_conditions(self):
+        df = self.df.copy()
+        df["delta_D"] = df["delta_D"].cat.add_categories(["Wheat"])
+        df.loc[0, "delta_D"] = "Wheat"
+        df.loc[2, "transID"] = 3
+        diff = self.diff(df)
+        self.assertEqual(diff.create_transitions, [("Burnt", "Wheat")])
+        self.assertEqual(diff.delete_transitions, [("Burnt", "Pine")])
+        self.assertEqual(diff.delete_conditions, [100])
+        self.assertEqual([c["end"] for c in diff.create_conditions],
+                         ["Wheat"])
+        self.assertEqual([(u["node_id"], u["props"]["transID"])
+                          for u in diff.update_conditions], [(102, 3)])
+
+        driver = RecordingDriver()
+        apply_diff(driver, diff, PARAMS)
+        self.assertEqual(len(driver.log), 5)
+        self.assertTrue(driver.log[0][0].startswith("UNWIND $rows"))
+
+    def test_inserted_row_creates_one_condition(self):
+        row = pd.DataFrame({"transID": [1], "start": ["Burnt"],
+                            "succession": ["regeneration"], "pine": [False],
+                            "delta_D": ["Pine"], "delta_t": [4]})
+        df = pd.concat([self.df.iloc[:1], row, self.df.iloc[1:]],
+                       ignore_index=True)
+        df["transID"] = range(len(df.index))
+        diff = self.diff(df)
+        self.assertEqual(len(diff.create_conditions), 1)
+        self.assertEqual(diff.create_conditions[0]["props"]["delta_t"], 4)
+        self.assertEqual(diff.create_transitions, [])
+        self.assertEqual(diff.delete_conditions, [])
+        # Later rules are only renumbered
+        self.assertEqual([(u["node_id"], u["props"]["transID"])
+                          for u in diff.update_conditions],
+                         [(101, 2), (102, 3)])
+
+        driver = RecordingDriver()
+        apply_diff(driver, diff, PARAMS)
+        creates = [params["rows"] for statement, params in driver.log
+                   if "CREATE (c:" in statement]
+        self.assertEqual([len(rows) for rows in creates], [1])
+
+    def test_reloading_unchanged_table_writes_nothing(self):
+        driver = FakeDriver(self.df)
+        diff = incremental_reload(driver, self.df, "start", "delta_D",
+                                  PARAMS)
+        self.assertTrue(diff.is_empty)
+        self.assertEqual(driver.log, [])
+
+    def test_summary_rebuilt_before_model_marked_reloaded(self):
+        driver = FakeDriver(self.df)
+        df = self.df.copy()
+        df.loc[1, "delta_t"] = 5
+        incremental_reload(driver, df, "start", "delta_D", PARAMS)
+        statements = [statement for statement, _ in driver.log]
+        marks = [i for i, statement in enumerate(statements)
+                 if "ModelLoad" in statement]
+        summary = [i for i, statement in enumerate(statements)
+                   if "TRANSITIONS_TO" in statement]
+        self.assertEqual(len(marks), 1)
+        self.assertTrue(summary)
+        self.assertLess(max(summary), marks[0])
+
+    def test_orphans_deleted(self):
+        state = ModelState()
+        state.orphans.append(7)
+        diff = GraphDiff(state, ModelState())
+        self.assertEqual(diff.delete_conditions, [7])
+
+    def test_requires_trans_id(self):
+        with self.assertRaises(ValueError):
+            table_state(self.df.drop(columns="transID"), "start", "delta_D",
+                        PARAMS)
+
+
+if __name__ == "__main__":
+    unittest.main()
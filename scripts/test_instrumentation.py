@@ -0,0 +1,67 @@
+import os
+import json
+import tempfile
+import unittest
+
+import pandas as pd
+
+import instrumentation
+from instrumentation import (
+    instrument,
+    instrumented,
+    metrics_file_for_log,
+    set_metrics_file,
+)
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = metrics_file_for_log(
+            os.path.join(self.tmpdir.name, "script.log"))
+        set_metrics_file(self.path)
+
+    def tearDown(self):
+        set_metrics_file(None)
+        self.tmpdir.cleanup()
+
+    def records(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_metrics_file_next_to_log(self):
+        self.assertEqual(os.path.basename(self.path),
+                         "script.metrics.jsonl")
+
+    def test_decorator_records_row_counts(self):
+        @instrument("halve")
+        def halve(df):
+            return df.iloc[:len(df.index) // 2]
+
+        halve(pd.DataFrame({"x": range(10)}))
+        record, = self.records()
+        self.assertEqual(record["stage"], "halve")
+        self.assertEqual((record["rows_in"], record["rows_out"]), (10, 5))
+        self.assertEqual(record["run_id"], instrumentation.RUN_ID)
+        for key in ["wall_s", "cpu_s", "peak_rss_mb"]:
+            self.assertIn(key, record)
+        self.assertTrue(record["ok"])
+
+    def test_path_argument_has_no_row_count(self):
+        @instrument("read")
+        def read(path):
+            return pd.DataFrame({"x": range(3)})
+
+        read("table.csv")
+        record, = self.records()
+        self.assertEqual((record["rows_in"], record["rows_out"]), (None, 3))
+
+    def test_failure_recorded(self):
+        with self.assertRaises(RuntimeError):
+            with instrumented("broken"):
+                raise RuntimeError()
+        self.assertFalse(self.records()[0]["ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
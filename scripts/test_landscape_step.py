@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+
+from constants import AgroSuccessLct as AsLct, Aspect, Succession, Water
+from landscape_step import evaluate_landscape
+from schema import AGROSUCCESS_CONDITION_ENUMS
+from transition_lookup import NO_RULE, TransitionLookup, enum_codes
+from test_transition_lookup import agrosuccess_table
+
+
+class LandscapeStepTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        df = agrosuccess_table()
+        cls.df = df
+        cls.lookup = TransitionLookup.from_table(df)
+        cls.codes = [enum_codes(df["start"], AsLct)] + [
+            enum_codes(df[col], trans_enum)
+            for col, trans_enum in AGROSUCCESS_CONDITION_ENUMS.items()]
+
+    def test_every_rule_found_in_grid(self):
+        grid = [np.tile(codes, 3).reshape(3, -1) for codes in self.codes]
+        step = evaluate_landscape(self.lookup, *grid)
+        self.assertEqual(step.target.shape, grid[0].shape)
+        self.assertEqual(step.n_unmatched, 0)
+        np.testing.assert_array_equal(
+            step.target[1], enum_codes(self.df["delta_D"], AsLct))
+        np.testing.assert_array_equal(step.delta_t[2], self.df["delta_T"])
+        self.assertTrue(step.unmatched_rules().empty)
+
+    def test_unmatched_cells_reported(self):
+        lookup = TransitionLookup.from_table(self.df.iloc[1:])
+        missing = self.df.iloc[0]
+        grid = [codes[:2] for codes in self.codes]
+        grid = [np.stack([g, g[::-1], g]) for g in grid]
+        step = evaluate_landscape(lookup, *grid)
+        np.testing.assert_array_equal(step.unmatched,
+                                      [[True, False], [False, True],
+                                       [True, False]])
+        self.assertTrue((step.target[step.unmatched] == NO_RULE).all())
+        report = step.unmatched_rules()
+        self.assertEqual(len(report.index), 1)
+        self.assertEqual(report.loc[0, "cells"], 3)
+        for col in ["start"] + list(AGROSUCCESS_CONDITION_ENUMS):
+            self.assertEqual(report.loc[0, col], missing[col])
+
+    def test_shared_conditions_broadcast(self):
+        state = np.full((4, 5), AsLct.PINE.value, dtype=np.int8)
+        step = evaluate_landscape(self.lookup, state, Succession.REGENERATION,
+                                  Aspect.NORTH, 1, 0, 0, Water.MESIC)
+        self.assertEqual(step.target.shape, (4, 5))
+        expected = self.lookup.lookup(AsLct.PINE, Succession.REGENERATION,
+                                      Aspect.NORTH, 1, 0, 0, Water.MESIC)
+        self.assertTrue((step.target == expected.target).all())
+
+    def test_rejects_out_of_range_codes(self):
+        with self.assertRaises(ValueError):
+            evaluate_landscape(self.lookup, np.array([9]), 0, 0, 0, 0, 0, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
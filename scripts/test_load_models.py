@@ -0,0 +1,81 @@
+import os
+import threading
+import unittest
+
+from config import DIRS
+from cypher_views import read_views
+from graph_db import SessionPool
+from load_models import load_models, model_params
+from test_succession_graph import (
+    RecordingDriver,
+    RecordingSession,
+    succession_df,
+)
+
+VIEWS_DIR = os.path.join(DIRS["scripts"], "..", "views")
+
+
+class CountingDriver(RecordingDriver):
+    """Records the most sessions open at once, fails for model 'bad'."""
+
+    def __init__(self):
+        super(CountingDriver, self).__init__()
+        self.lock = threading.Lock()
+        self.open = self.max_open = 0
+
+    def session(self):
+        driver = self
+
+        class Session(RecordingSession):
+            def __enter__(self):
+                with driver.lock:
+                    driver.open += 1
+                    driver.max_open = max(driver.max_open, driver.open)
+                return self
+
+            def __exit__(self, *exc):
+                with driver.lock:
+                    driver.open -= 1
+                return False
+
+            def run(self, statement, parameters=None):
+                if (parameters or {}).get("model_ID") == "bad":
+                    raise RuntimeError("bad model")
+                return super(Session, self).run(statement, parameters)
+
+        return Session(self.log)
+
+
+class LoadModelsTestCase(unittest.TestCase):
+    def test_model_params(self):
+        params = model_params(["a", "b"], {"model_ID": "x", "k": 1})
+        self.assertEqual(params, [{"model_ID": "a", "k": 1},
+                                  {"model_ID": "b", "k": 1}])
+        with self.assertRaises(ValueError):
+            model_params(["a", "a"], {})
+
+    def test_failures_isolated_and_sessions_bounded(self):
+        driver = CountingDriver()
+        summary = load_models(driver, model_params(["a", "bad", "c"], {}),
+                              read_views(VIEWS_DIR), succession_df(),
+                              max_sessions=2)
+        self.assertEqual(list(summary["model_ID"]), ["a", "bad", "c"])
+        self.assertEqual(list(summary["ok"]), [True, False, True])
+        self.assertIn("bad model", summary.loc[1, "error"])
+        self.assertLessEqual(driver.max_open, 2)
+        loaded = set(p["model_ID"] for _, p in driver.log)
+        self.assertEqual(loaded, {"a", "c"})
+        marked = [p["model_ID"] for s, p in driver.log if "ModelLoad" in s]
+        self.assertEqual(sorted(marked), ["a", "c"])
+
+
+class SessionPoolTestCase(unittest.TestCase):
+    def test_session_passes_through(self):
+        driver = RecordingDriver()
+        with SessionPool(driver, 1).session() as session:
+            session.run("RETURN 1")
+        self.assertEqual(driver.log, [("RETURN 1", None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
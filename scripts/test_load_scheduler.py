@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+import unittest
+
+from config import DIRS
+from cypher_views import read_views
+from load_scheduler import (
+    TABLE_TASK_NAME,
+    LoadSchedule,
+    LoadTask,
+    summary_task,
+    view_task,
+)
+from succession_graph import SUMMARY_NAME
+from test_succession_graph import RecordingDriver, succession_df
+
+VIEWS_DIR = os.path.join(DIRS["scripts"], "..", "views")
+
+
+def noop(driver):
+    pass
+
+
+class LoadScheduleTestCase(unittest.TestCase):
+    def views_schedule(self, table_run=noop):
+        tasks = [view_task(v, {"model_ID": "m"})
+                 for v in read_views(VIEWS_DIR)]
+        tasks.append(LoadTask(TABLE_TASK_NAME, table_run, 2,
+                              ["abstract/LandCoverType_w.cql"]))
+        tasks.append(summary_task(succession_df(), "start", "delta_D",
+                                  {"model_ID": "m"}))
+        return LoadSchedule(tasks)
+
+    def test_summary_runs_after_table(self):
+        schedule = self.views_schedule()
+        order = schedule.order
+        self.assertLess(order.index(TABLE_TASK_NAME),
+                        order.index(SUMMARY_NAME))
+        self.assertEqual(schedule.dependencies[TABLE_TASK_NAME],
+                         {"abstract/LandCoverType_w.cql"})
+        self.assertEqual(
+            schedule.dependencies[
+                "landcover_change/AgroPastoralist/activities_w.cql"],
+            {"abstract/Agent_w.cql", "abstract/LandCoverType_w.cql"})
+
+    def test_run_sends_every_statement(self):
+        driver = RecordingDriver()
+        timings = self.views_schedule().run(driver, max_workers=2)
+        self.assertEqual(len(timings), 5)
+        # 1 agent, 9 land cover types, 8 activities and 2 summary statements
+        self.assertEqual(len(driver.log), 20)
+        self.assertTrue(driver.log[-1][0].startswith("UNWIND"))
+        self.assertEqual(len(driver.log[-1][1]["rows"]), 3)
+
+    def test_independent_tasks_run_concurrently(self):
+        both_started = threading.Barrier(2, timeout=5)
+
+        def wait_for_other(driver):
+            both_started.wait()
+
+        LoadSchedule([LoadTask("a", wait_for_other),
+                      LoadTask("b", wait_for_other)]).run(None, max_workers=2)
+
+    def test_failure_stops_dependents(self):
+        ran = []
+
+        def fail(driver):
+            raise RuntimeError("boom")
+
+        def slow(driver):
+            time.sleep(0.05)
+            ran.append("slow")
+
+        schedule = LoadSchedule([
+            LoadTask("fail", fail), LoadTask("slow", slow),
+            LoadTask("after", lambda d: ran.append("after"), 1)])
+        with self.assertRaises(RuntimeError):
+            schedule.run(None)
+        self.assertEqual(ran, ["slow"])
+
+    def test_invalid_dependencies(self):
+        with self.assertRaises(ValueError):
+            LoadSchedule([LoadTask("a", noop, dependencies=["b"]),
+                          LoadTask("b", noop, dependencies=["a"])])
+        with self.assertRaises(ValueError):
+            LoadSchedule([LoadTask("a", noop, dependencies=["c"])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import unittest
+
+from config import DIRS
+from memory_graph import MemoryGraphLoader, parse_statement
+from test_succession_graph import succession_df
+
+VIEWS_DIR = os.path.join(DIRS["scripts"], "..", "views")
+PARAMS = {"model_ID": "m"}
+
+
+def loaded_graph(params=PARAMS, loader=None):
+    loader = loader or MemoryGraphLoader()
+    loader.load_cypher(VIEWS_DIR, "_w", params)
+    loader.load_tabular(succession_df(), "start", "delta_D",
+                        global_params=params)
+    loader.load_transition_summary(succession_df(), "start", "delta_D",
+                                   global_params=params)
+    loader.commit()
+    return loader
+
+
+class MemoryGraphTestCase(unittest.TestCase):
+    def test_parse_statement(self):
+        clauses = parse_statement(
+            'MATCH (a:A {code:"x, MERGE y"}), (b:B) '
+            'MERGE (a)<-[:R]-(c:C {k:$k})-[:S]->(b)', {"k": 1})
+        self.assertEqual([k for k, _ in clauses], ["MATCH", "MERGE"])
+        self.assertEqual(clauses[0][1][0][0].props, {"code": "x, MERGE y"})
+        path = clauses[1][1][0]
+        self.assertEqual([p.var for p in path[::2]], ["a", "c", "b"])
+        self.assertEqual([(r.rel_type, r.outgoing) for r in path[1::2]],
+                         [("R", False), ("S", True)])
+        with self.assertRaises(ValueError):
+            parse_statement("MATCH (a:A) WITH a MERGE (a)-[:R]->(a)")
+
+    def test_load(self):
+        loader = loaded_graph()
+        node_counts, rel_counts = loader.graph.counts()
+        self.assertEqual(node_counts, {
+            "AgentType": 1, "LandCoverType": 9, "EcoEngineeringActivity": 8,
+            "SuccessionTrajectory": 3, "EnvironCondition": 3})
+        self.assertEqual(rel_counts, {"PRACTICES": 8, "SOURCE": 11,
+                                      "TARGET": 11, "CAUSES": 3,
+                                      "TRANSITIONS_TO": 3})
+        self.assertEqual(loader.graph.skipped, [])
+
+    def test_states_merged_with_view_nodes(self):
+        graph = loaded_graph().graph
+        oak = graph.find_nodes("LandCoverType", {"code": "Oak"})
+        self.assertEqual(len(oak), 1)
+        self.assertEqual(graph.node_properties(oak[0])["num"], 8)
+        trans = graph.neighbours(oak[0], "TARGET", outgoing=False)
+        self.assertEqual(len(trans), 1)
+        causes = graph.neighbours(trans[0], "CAUSES", outgoing=False)
+        self.assertEqual(graph.node_properties(causes[0])["delta_t"], 20)
+
+    def test_table_merge_is_idempotent(self):
+        loader = loaded_graph()
+        before = loader.graph.counts()
+        loader.load_tabular(succession_df(), "start", "delta_D",
+                            global_params=PARAMS)
+        loader.load_transition_summary(succession_df(), "start", "delta_D",
+                                       global_params=PARAMS)
+        loader.commit()
+        self.assertEqual(loader.graph.counts(), before)
+
+    def test_transition_summary(self):
+        graph = loaded_graph().graph
+        rels = graph.find_relationships_of_type("TRANSITIONS_TO")
+        pine_oak = [r for r in rels
+                    if graph.node_properties(graph.rel_starts[r])["code"]
+                    == "Pine"]
+        self.assertEqual(len(pine_oak), 1)
+        self.assertEqual(graph.rel_properties[pine_oak[0]],
+                         {"min_delta_t": 20, "max_delta_t": 20,
+                          "model_ID": "m"})
+
+    def test_refresh_only_deletes_matching_model(self):
+        loader = loaded_graph(loader=loaded_graph({"model_ID": "other"}))
+        loader.refresh_graph(PARAMS)
+        self.assertEqual(loader.graph.find_nodes(props=PARAMS), [])
+        self.assertEqual(loader.graph.counts(),
+                         loaded_graph({"model_ID": "other"}).graph.counts())
+        oak = loader.graph.find_nodes("LandCoverType", {"code": "Oak"})
+        self.assertEqual(len(loader.graph.neighbours(oak[0], "TARGET",
+                                                     outgoing=False)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
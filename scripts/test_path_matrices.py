@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from constants import AgroSuccessLct as AsLct, Aspect, Succession, Water
+from path_matrices import (
+    NO_PATH,
+    PathMatrices,
+    cache_file_for_table,
+    cached_path_matrices,
+    longest_path_times,
+)
+from test_transition_lookup import agrosuccess_table
+
+INF = np.inf
+
+
+class PathMatricesTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.df = agrosuccess_table()
+        cls.matrices = PathMatrices.from_table(cls.df)
+
+    def test_burnt_to_oak(self):
+        burnt, oak = AsLct.BURNT.value, AsLct.OAK.value
+        # Fastest via Shrubland, slowest via Pine and TransForest too
+        self.assertEqual(self.matrices.min_delta_t[burnt, oak], 2 + 10)
+        self.assertEqual(self.matrices.max_delta_t[burnt, oak],
+                         2 + 12 + 20 + 26)
+        self.assertTrue(self.matrices.reachable[burnt, oak])
+        self.assertEqual(self.matrices.min_delta_t[oak, burnt], NO_PATH)
+        self.assertFalse(self.matrices.reachable[oak, burnt])
+
+    def test_frame_labelled_with_aliases(self):
+        frame = self.matrices.frame("min_delta_t")
+        self.assertEqual(frame.loc["Pine", "Pine"], 0)
+        self.assertEqual(frame.loc["Pine", "TransForest"], 20)
+
+    def test_by_conditions_matches_filtered_table(self):
+        by_cond = PathMatrices.from_table(self.df, by_conditions=True)
+        self.assertEqual(by_cond.min_delta_t.shape,
+                         (2, 2, 2, 2, 2, 3, len(AsLct), len(AsLct)))
+        conditions = {"succession": Succession.REGENERATION,
+                      "aspect": Aspect.NORTH, "pine": 1, "oak": 1,
+                      "deciduous": 0, "water": Water.MESIC}
+        mask = np.ones(len(self.df.index), dtype=bool)
+        for col, value in conditions.items():
+            value = getattr(value, "alias", bool(value))
+            mask &= (self.df[col] == value).to_numpy()
+        expected = PathMatrices.from_table(self.df[mask])
+        for name in ["min_delta_t", "max_delta_t", "reachable"]:
+            pd.testing.assert_frame_equal(by_cond.frame(name, **conditions),
+                                          expected.frame(name))
+        with self.assertRaises(TypeError):
+            by_cond.frame("min_delta_t")
+
+    def test_longest_path_with_cycle(self):
+        # 0 -> 1 -> 2 -> 0, and 0 -> 2 directly
+        max_t = np.array([[-INF, 1, 5], [-INF, -INF, 2], [3, -INF, -INF]])
+        np.testing.assert_array_equal(longest_path_times(max_t),
+                                      [[0, 1, 5], [5, 0, 2], [3, 4, 0]])
+
+    def test_cached_alongside_table(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "agrosuccess_succession.csv")
+            self.df.to_csv(path, index=False)
+            matrices = cached_path_matrices(path)
+            cache_path = cache_file_for_table(path)
+            self.assertTrue(os.path.isfile(cache_path))
+            mtime = os.path.getmtime(cache_path)
+            np.testing.assert_array_equal(
+                cached_path_matrices(path).max_delta_t, matrices.max_delta_t)
+            self.assertEqual(os.path.getmtime(cache_path), mtime)
+
+            self.df.iloc[1:].to_csv(path, index=False)
+            self.assertIsNone(PathMatrices.load(cache_path, "stale"))
+            cached_path_matrices(path)
+            self.assertEqual(len(os.listdir(tmp_dir)), 2)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
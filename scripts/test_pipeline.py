@@ -0,0 +1,67 @@
+import tempfile
+import unittest
+
+import pandas as pd
+
+from pipeline import Pipeline
+
+
+def add_const(df, col, value):
+    df = df.copy()
+    df[col] = value
+    return df
+
+
+def double(df, col):
+    df = df.copy()
+    df[col] = df[col] * 2
+    return df
+
+
+class PipelineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({"x": [1, 2, 3]})
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def make_pipeline(self, late_value=10):
+        return (Pipeline(self.tmpdir.name)
+                .register("a", add_const, col="y", value=1)
+                .register("b", double, col="x")
+                .register("c", add_const, col="z", value=late_value))
+
+    def test_uncached_runs_everything(self):
+        p = Pipeline().register("b", double, col="x")
+        self.assertEqual(list(p.run(self.df)["x"]), [2, 4, 6])
+        self.assertEqual(p.executed, ["b"])
+
+    def test_rerun_uses_cache(self):
+        first = self.make_pipeline()
+        expected = first.run(self.df)
+        second = self.make_pipeline()
+        pd.testing.assert_frame_equal(second.run(self.df), expected)
+        self.assertEqual(second.executed, [])
+
+    def test_changed_late_stage_reruns_from_that_stage(self):
+        self.make_pipeline().run(self.df)
+        p = self.make_pipeline(late_value=20)
+        result = p.run(self.df)
+        self.assertEqual(p.executed, ["c"])
+        self.assertEqual(list(result["z"]), [20, 20, 20])
+        self.assertEqual(list(result["x"]), [2, 4, 6])
+
+    def test_changed_input_reruns_everything(self):
+        self.make_pipeline().run(self.df)
+        p = self.make_pipeline()
+        p.run(pd.DataFrame({"x": [1, 2, 4]}))
+        self.assertEqual(p.executed, ["a", "b", "c"])
+
+    def test_duplicate_stage_name_raises(self):
+        with self.assertRaises(ValueError):
+            Pipeline().register("a", double).register("a", double)
+
+
+if __name__ == "__main__":
+    unittest.main()
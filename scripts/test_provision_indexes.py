@@ -0,0 +1,51 @@
+import os
+import unittest
+
+from config import DIRS
+from cypher_views import read_views
+from provision_indexes import (
+    index_specs,
+    index_statement,
+    pattern_keys,
+    provision_indexes,
+)
+from succession_graph import DEFAULT_LABELS
+from test_succession_graph import RecordingDriver
+
+VIEWS_DIR = os.path.join(DIRS["scripts"], "..", "views")
+
+
+class ProvisionIndexesTestCase(unittest.TestCase):
+    def test_pattern_keys_ignore_create(self):
+        statement = ("MATCH (a:X {b:1, model_ID:$model_ID}) "
+                     "CREATE (c:Y {d:2})-[:R]->(a) MERGE (e:Z {f:$f})")
+        self.assertEqual(pattern_keys(statement),
+                         [("X", ("b", "model_ID")), ("Z", ("f",))])
+
+    def test_index_specs(self):
+        specs = index_specs(read_views(VIEWS_DIR), ["transID", "delta_t"],
+                            {"model_ID": "m"}, DEFAULT_LABELS)
+        self.assertIn(("LandCoverType", ("code", "model_ID")), specs)
+        self.assertIn(("SuccessionTrajectory", ("model_ID",)), specs)
+        self.assertIn(("EnvironCondition", ("delta_t", "model_ID",
+                                            "transID")), specs)
+        self.assertEqual(specs, sorted(set(specs)))
+
+    def test_index_statement(self):
+        self.assertEqual(
+            index_statement("LandCoverType", ("code", "model_ID")),
+            "CREATE INDEX ON :`LandCoverType`(`code`, `model_ID`)")
+
+    def test_provision_waits_for_indexes(self):
+        driver = RecordingDriver()
+        specs = [("A", ("x",)), ("B", ("y", "z"))]
+        timings = provision_indexes(driver, specs, timeout=10)
+        self.assertEqual(sorted(timings), ["await_s", "create_s"])
+        self.assertEqual([s for s, _ in driver.log[:2]],
+                         [index_statement(*spec) for spec in specs])
+        self.assertEqual(driver.log[2], ("CALL db.awaitIndexes($timeout)",
+                                         {"timeout": 10}))
+
+
+if __name__ == '__main__':
+    unittest.main()
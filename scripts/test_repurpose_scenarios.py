@@ -0,0 +1,79 @@
+import os
+import tempfile
+import unittest
+import warnings
+
+from generate_trans_table import generate_base_table
+from repurpose_scenarios import (
+    parse_scenario,
+    run_scenarios,
+    scenario_out_file,
+)
+from repurpose_trans_rules_agrosuccess import (
+    make_repurpose_pipeline,
+    translate_millington_trans_table,
+)
+from schema import (
+    read_agrosuccess_table,
+    read_millington_table,
+    write_agrosuccess_table,
+)
+
+
+class RunScenariosTestCase(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter("ignore")
+        self.tmpdir = tempfile.TemporaryDirectory()
+        src = os.path.join(self.tmpdir.name, "millington.csv")
+        generate_base_table().to_csv(src, index=False)
+        self.m_df = read_millington_table(src)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_parse_scenario(self):
+        s = parse_scenario({"name": "wheat_only", "crop_types": ["WHEAT"],
+                            "state_map": {"HOLM_OAK": "DECIDUOUS"}})
+        self.assertEqual(s["name"], "wheat_only")
+        self.assertEqual([m.name for m in s["options"]["crop_types"]],
+                         ["WHEAT"])
+        with self.assertRaises(ValueError):
+            parse_scenario({"name": "x", "crop_types": ["RICE"]})
+        with self.assertRaises(ValueError):
+            parse_scenario({"name": "../x"})
+
+    def test_scenarios_written_and_failures_isolated(self):
+        scenarios = [parse_scenario(spec) for spec in [
+            {"name": "default"},
+            {"name": "wheat_only", "crop_types": ["WHEAT"]},
+            # Leaves urban in the table, which has no AgroSuccess code
+            {"name": "keep_urban", "dropped_states": ["HOLM_OAK_W_PASTURE"]},
+            # Shrubland is made from pasture and scrubland by another stage
+            {"name": "burnt_as_shrubland",
+             "state_map": {"BURNT": "SHRUBLAND"}},
+        ]]
+        summary = run_scenarios(
+            translate_millington_trans_table(self.m_df.copy()), scenarios,
+            self.tmpdir.name, max_workers=2)
+        self.assertEqual(list(summary["name"]),
+                         ["default", "wheat_only", "keep_urban",
+                          "burnt_as_shrubland"])
+        self.assertEqual(list(summary["ok"]), [True, True, False, False])
+        self.assertIn("SHRUBLAND", summary["error"].iloc[3])
+
+        expected = make_repurpose_pipeline("start", "delta_D").run(self.m_df)
+        path = os.path.join(self.tmpdir.name, "expected.csv")
+        write_agrosuccess_table(expected, path)
+        with open(path, "rb") as f1, \
+                open(scenario_out_file(self.tmpdir.name, "default"),
+                     "rb") as f2:
+            self.assertEqual(f1.read(), f2.read())
+
+        wheat_only = read_agrosuccess_table(
+            scenario_out_file(self.tmpdir.name, "wheat_only"))
+        self.assertNotIn("DAL", set(wheat_only["start"]))
+        self.assertLess(len(wheat_only.index), len(expected.index))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import io
+import os
+import tempfile
+import unittest
+import warnings
+
+import pandas as pd
+
+from constants import AgroSuccessLct as AsLct, MillingtonPaperLct as MLct
+from generate_trans_table import generate_base_table
+from repurpose_trans_rules_agrosuccess import (
+    STATE_MAP,
+    convert_millington_names_to_agrosuccess,
+    drop_holm_oak_w_pasture_and_urban,
+    make_repurpose_pipeline,
+    replace_cropland_with_new_crop_types,
+    repurpose_in_chunks,
+    translate_millington_trans_table,
+)
+from schema import write_agrosuccess_table
+
+# Small coded Millington table exercising every stage: dropped states,
+# cropland, transitions between pasture and scrubland, and self-transitions
+MILLINGTON_CSV = """\
+start,succession,aspect,pine,oak,deciduous,water,delta_D,delta_T
+11,0,0,1,0,0,1,1,2
+11,0,0,0,0,0,1,5,2
+1,1,0,0,1,0,1,2,20
+1,1,0,0,0,0,1,1,0
+2,1,1,0,1,0,2,6,25
+5,1,0,1,0,0,0,1,10
+5,1,0,0,0,1,1,4,10
+5,1,1,0,0,0,1,3,10
+3,1,0,0,0,0,2,5,3
+3,1,1,0,0,0,0,3,0
+7,0,0,0,0,0,1,5,3
+8,1,0,0,0,0,1,5,4
+8,1,1,0,0,0,2,3,5
+10,1,0,0,0,0,0,5,1
+9,0,0,0,0,0,0,9,0
+4,1,0,0,0,0,1,4,0
+6,0,1,0,1,0,1,6,0
+"""
+
+
+class RepurposeInChunksTestCase(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter("ignore")
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.src = os.path.join(self.tmpdir.name, "millington.csv")
+        with open(self.src, "w") as f:
+            f.write(MILLINGTON_CSV)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def written(self, df, name):
+        path = os.path.join(self.tmpdir.name, name)
+        write_agrosuccess_table(df, path)
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_streaming_output_identical(self):
+        pipeline = make_repurpose_pipeline("start", "delta_D")
+        expected = pipeline.run(pd.read_csv(io.StringIO(MILLINGTON_CSV)))
+        self.assertEqual(len(expected.index), 10)
+        expected = self.written(expected, "in_memory.csv")
+        out = os.path.join(self.tmpdir.name, "streamed.csv")
+        for chunksize in [1, 4, 100]:
+            n = repurpose_in_chunks(self.src, out, "start", "delta_D",
+                                    chunksize, tmp_dir=self.tmpdir.name)
+            self.assertEqual(n, 10)
+            with open(out, "rb") as f:
+                self.assertEqual(f.read(), expected)
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)),
+                         ["in_memory.csv", "millington.csv", "streamed.csv"])
+
+    def test_pipeline_keeps_compact_columns(self):
+        pipeline = make_repurpose_pipeline("start", "delta_D")
+        df = pipeline.run(pd.read_csv(io.StringIO(MILLINGTON_CSV)))
+        self.assertFalse((df.dtypes == object).any())
+
+    def test_duplicates_across_chunks_detected(self):
+        # Pasture and scrubland both go to pine under the same conditions,
+        # so merging them duplicates a transition
+        with open(self.src, "a") as f:
+            f.write("3,1,0,1,0,0,0,1,10\n")
+        out = os.path.join(self.tmpdir.name, "streamed.csv")
+        with self.assertRaises(AssertionError):
+            repurpose_in_chunks(self.src, out, "start", "delta_D", 4)
+
+
+class RepurposeVariantOptionsTestCase(unittest.TestCase):
+    def setUp(self):
+        warnings.simplefilter("ignore")
+        self.df = translate_millington_trans_table(
+            pd.read_csv(io.StringIO(MILLINGTON_CSV)))
+
+    def test_empty_dropped_states_drops_nothing(self):
+        df = drop_holm_oak_w_pasture_and_urban(self.df, "start", "delta_D",
+                                               dropped_states=[])
+        self.assertEqual(len(df.index), len(self.df.index))
+
+    def test_empty_crop_types_removes_cropland(self):
+        n_cropland = (self.df["start"] == MLct.CROPLAND.alias).sum()
+        df = replace_cropland_with_new_crop_types(self.df, "start", "delta_D",
+                                                  crop_types=[])
+        self.assertGreater(n_cropland, 0)
+        self.assertEqual(len(df.index), len(self.df.index) - n_cropland)
+        self.assertFalse((df["start"] == MLct.CROPLAND.alias).any())
+
+    def test_custom_state_map_checked(self):
+        merged = dict(STATE_MAP)
+        merged[MLct.DECIDUOUS] = AsLct.OAK
+        renames_pasture = {MLct.PASTURE: AsLct.PINE}
+        makes_wheat = {MLct.BURNT: AsLct.WHEAT}
+        for state_map, message in [(merged, "OAK"),
+                                   (renames_pasture, "PASTURE"),
+                                   (makes_wheat, "WHEAT")]:
+            with self.assertRaisesRegex(AssertionError, message):
+                convert_millington_names_to_agrosuccess(
+                    self.df.copy(), "start", "delta_D", state_map=state_map)
+
+
+class RepurposeSyntheticTableTestCase(unittest.TestCase):
+    def test_output_only_has_agrosuccess_transitions(self):
+        pipeline = make_repurpose_pipeline("start", "delta_D")
+        df = pipeline.run(generate_base_table())
+        states = set(df["start"]) | set(df["delta_D"])
+        self.assertTrue({"Wheat", "DAL", "Shrubland"} <= states)
+        self.assertFalse(states & {"urban", "cropland", "pasture"})
+        self.assertFalse((df["start"] == df["delta_D"]).any())
+        self.assertEqual(df.index.name, "transID")
+
+
+if __name__ == "__main__":
+    unittest.main()
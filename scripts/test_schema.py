@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from schema import (
+    AGROSUCCESS_SCHEMA,
+    apply_schema,
+    read_agrosuccess_table,
+    read_millington_table,
+    write_agrosuccess_table,
+)
+
+
+class SchemaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_read_millington_table_uses_int8(self):
+        path = self.write("m.csv", "start,succession,aspect,pine,oak,"
+                          "deciduous,water,delta_D,delta_T\n"
+                          "5,1,0,1,0,0,2,1,15\n")
+        df = read_millington_table(path)
+        self.assertEqual(df["start"].dtype, np.int8)
+        self.assertEqual(df["delta_T"].dtype, np.int16)
+
+    def test_read_millington_table_rejects_unknown_code(self):
+        path = self.write("m.csv", "start,succession,aspect,pine,oak,"
+                          "deciduous,water,delta_D,delta_T\n"
+                          "5,1,0,1,0,0,3,1,15\n")
+        with self.assertRaisesRegex(ValueError, "Water"):
+            read_millington_table(path)
+
+    def test_agrosuccess_round_trip_keeps_names(self):
+        df = pd.DataFrame({
+            "start": ["Burnt"], "succession": ["secondary"],
+            "aspect": ["north"], "pine": [True], "oak": [False],
+            "deciduous": [False], "water": ["mesic"], "delta_D": ["Pine"],
+            "delta_T": [15],
+        })
+        df.index.name = "transID"
+        path = os.path.join(self.tmpdir.name, "as.csv")
+        write_agrosuccess_table(df, path)
+        with open(path) as f:
+            self.assertIn("0,Burnt,secondary,north,True,False,False,mesic,"
+                          "Pine,15", f.read())
+        read_df = read_agrosuccess_table(path)
+        self.assertIsInstance(read_df["start"].dtype, pd.CategoricalDtype)
+        self.assertEqual(read_df.loc[0, "delta_D"], "Pine")
+
+    def test_apply_schema_rejects_unknown_name(self):
+        df = pd.DataFrame({col: ["x"] for col in AGROSUCCESS_SCHEMA})
+        with self.assertRaisesRegex(ValueError, "'start'"):
+            apply_schema(df, AGROSUCCESS_SCHEMA)
+
+    def test_write_leaves_callers_frame_unchanged(self):
+        df = pd.DataFrame({
+            "start": ["Burnt"], "succession": ["secondary"],
+            "aspect": ["north"], "pine": [True], "oak": [False],
+            "deciduous": [False], "water": ["mesic"], "delta_D": ["Pine"],
+            "delta_T": [15],
+        })
+        dtypes = df.dtypes.copy()
+        write_agrosuccess_table(df, os.path.join(self.tmpdir.name, "as.csv"))
+        pd.testing.assert_series_equal(df.dtypes, dtypes)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+import pandas as pd
+
+from state_adjacency import StateAdjacencyIndex
+
+
+class StateAdjacencyIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        # urban is the only way to reach quarry; burnt is reachable from
+        # both urban and pine; pine is only reachable from itself.
+        df = pd.DataFrame({
+            "start": ["urban", "urban", "pine", "pine", "burnt", "quarry"],
+            "delta_D": ["quarry", "burnt", "burnt", "pine", "scrub", "quarry"],
+        })
+        self.index = StateAdjacencyIndex(df, "start", "delta_D")
+
+    def test_edges_ignore_self_transitions(self):
+        self.assertEqual(self.index.targets("pine"), {"burnt"})
+        self.assertEqual(self.index.sources("burnt"), {"urban", "pine"})
+        self.assertEqual(self.index.in_degree("quarry"), 1)
+
+    def test_exclusive_targets(self):
+        self.assertEqual(self.index.exclusive_targets("urban"), ["quarry"])
+        self.assertTrue(self.index.is_exclusive_source("urban"))
+        self.assertFalse(self.index.is_exclusive_source("pine"))
+
+    def test_exclusive_sources_for_all_states(self):
+        self.assertEqual(self.index.exclusive_sources(),
+                         {"burnt": ["scrub"], "urban": ["quarry"]})
+
+    def test_orphan_states(self):
+        self.assertEqual(self.index.orphan_states(), ["pine", "urban"])
+
+    def test_remove_state(self):
+        self.index.remove_state("urban")
+        self.assertEqual(self.index.sources("burnt"), {"pine"})
+        self.assertEqual(self.index.exclusive_targets("pine"), ["burnt"])
+        self.assertIn("quarry", self.index.orphan_states())
+        self.assertFalse(self.index.has_start_state("urban"))
+
+    def test_remove_state_matches_dropping_rows(self):
+        df = pd.DataFrame({
+            "start": ["urban", "pine", "pine", "burnt", "oak"],
+            "delta_D": ["burnt", "burnt", "pine", "scrub", "burnt"],
+        })
+        for state in ["burnt", "scrub", "urban"]:
+            index = StateAdjacencyIndex(df, "start", "delta_D")
+            index.remove_state(state)
+            kept = df[(df["start"] != state) & (df["delta_D"] != state)]
+            rebuilt = StateAdjacencyIndex(kept, "start", "delta_D")
+            self.assertEqual(index.states, rebuilt.states)
+            for s in sorted(df["start"].unique()):
+                self.assertEqual(index.has_start_state(s),
+                                 rebuilt.has_start_state(s), (state, s))
+        # burnt's only transition was to scrub
+        self.index.remove_state("scrub")
+        self.assertFalse(self.index.has_start_state("burnt"))
+        self.assertIn("burnt", self.index.states)
+        # pine still transitions to itself
+        self.index.remove_state("burnt")
+        self.assertTrue(self.index.has_start_state("pine"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+from cypher_views import CypherView
+from load_scheduler import view_task
+from statement_profiling import (
+    StatementProfiler,
+    set_profiler,
+    table_source,
+    total_db_hits,
+)
+from succession_graph import load_succession_batched
+from test_succession_graph import (
+    RecordingDriver,
+    RecordingSession,
+    succession_df,
+)
+
+
+class Counters(object):
+    nodes_created = 2
+    relationships_created = 1
+
+
+class Summary(object):
+    counters = Counters()
+    profile = {"dbHits": 3, "children": [{"dbHits": 4, "children": []}]}
+
+
+class SummarySession(RecordingSession):
+    def consume(self):
+        return Summary()
+
+
+class SummaryDriver(RecordingDriver):
+    def session(self):
+        return SummarySession(self.log)
+
+
+class StatementProfilingTestCase(unittest.TestCase):
+    def tearDown(self):
+        set_profiler(None)
+
+    def load(self, profiler, driver):
+        set_profiler(profiler)
+        view = CypherView("v.cql", "abstract/v_w.cql", 0, None,
+                          ["MERGE (:A {k:1})", "MERGE (:A {k:2})"])
+        view_task(view, {"model_ID": "m"}).run(driver)
+        load_succession_batched(driver, succession_df(), "start", "delta_D",
+                                {"model_ID": "m"}, batch_size=2)
+
+    def test_records_sources(self):
+        profiler = StatementProfiler()
+        self.load(profiler, RecordingDriver())
+        df = profiler.statements("m")
+        self.assertEqual(df["source"].tolist(), [
+            "abstract/v_w.cql", "abstract/v_w.cql",
+            "succession_table rows 0-1", "succession_table rows 2-2"])
+        self.assertEqual(df["index"].tolist(), [0, 1, 0, 0])
+        self.assertTrue(df["db_hits"].isnull().all())
+        self.assertEqual(len(profiler.statements("other")), 0)
+        report = profiler.report("m")
+        self.assertEqual(len(report), 3)
+        self.assertEqual(report.loc[report["source"] == "abstract/v_w.cql",
+                                    "statements"].item(), 2)
+        self.assertTrue(report["seconds"].is_monotonic_decreasing)
+
+    def test_db_hits_and_counters(self):
+        driver = SummaryDriver()
+        profiler = StatementProfiler(db_hits=True)
+        self.load(profiler, driver)
+        self.assertTrue(all(s.startswith("PROFILE ") for s, _ in driver.log))
+        report = profiler.report("m")
+        self.assertEqual(report["db_hits"].sum(), 4 * 7)
+        self.assertEqual(report["nodes_created"].sum(), 4 * 2)
+        self.assertEqual(report["properties_set"].sum(), 0)
+
+    def test_helpers(self):
+        self.assertEqual(table_source("t", 10, 5), "t rows 10-14")
+        self.assertIsNone(total_db_hits(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
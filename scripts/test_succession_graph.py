@@ -0,0 +1,109 @@
+import unittest
+
+import pandas as pd
+
+from succession_graph import (
+    iter_batches,
+    load_succession_batched,
+    load_transition_summary,
+    succession_rows,
+    transition_summary_rows,
+    unwind_statement,
+)
+
+
+class RecordingSession(object):
+    """Stand-in for a Neo4j session recording the statements it's sent."""
+
+    def __init__(self, log):
+        self.log = log
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, statement, parameters=None):
+        self.log.append((statement, parameters))
+        return self
+
+    def consume(self):
+        return None
+
+
+class RecordingDriver(object):
+    def __init__(self):
+        self.log = []
+
+    def session(self):
+        return RecordingSession(self.log)
+
+
+def succession_df():
+    return pd.DataFrame({
+        "transID": [0, 1, 2],
+        "start": pd.Categorical(["Burnt", "Burnt", "Pine"]),
+        "succession": ["regeneration", "secondary", "secondary"],
+        "pine": [True, False, True],
+        "delta_D": pd.Categorical(["Pine", "Shrubland", "Oak"]),
+        "delta_t": pd.Series([2, 3, 20], dtype="int16"),
+    })
+
+
+class SuccessionGraphTestCase(unittest.TestCase):
+    def test_rows_are_python_values(self):
+        rows = succession_rows(succession_df(), "start", "delta_D")
+        self.assertEqual(rows[1], {"start": "Burnt", "end": "Shrubland",
+                                   "transID": 1, "succession": "secondary",
+                                   "pine": False, "delta_t": 3})
+        self.assertIs(type(rows[1]["delta_t"]), int)
+        self.assertIs(type(rows[1]["pine"]), bool)
+
+    def test_transition_summary(self):
+        df = succession_df()
+        df.loc[1, "delta_D"] = "Pine"
+        rows = transition_summary_rows(df, "start", "delta_D")
+        self.assertEqual(rows, [
+            {"start": "Burnt", "end": "Pine", "min_delta_t": 2,
+             "max_delta_t": 3},
+            {"start": "Pine", "end": "Oak", "min_delta_t": 20,
+             "max_delta_t": 20}])
+        driver = RecordingDriver()
+        self.assertEqual(load_transition_summary(
+            driver, df, "start", "delta_D", {"model_ID": "m"}), 2)
+        (delete, _), (create, params) = driver.log
+        self.assertIn("DELETE tr", delete)
+        self.assertEqual(params["rows"], rows)
+
+    def test_statement(self):
+        statement = unwind_statement(["transID", "pine"], {"model_ID": "m"},
+                                     labels={"State": "LCT"})
+        self.assertIn("MERGE (start:`LCT` {`code`:row.`start`, "
+                      "`model_ID`:$`model_ID`})", statement)
+        self.assertIn("(cond:`EnvironCondition` {`transID`:row.`transID`, "
+                      "`pine`:row.`pine`, `model_ID`:$`model_ID`})"
+                      "-[:CAUSES]->(trans)", statement)
+        with self.assertRaises(ValueError):
+            unwind_statement([], {"rows": 1})
+
+    def test_batches(self):
+        self.assertEqual(list(iter_batches(list(range(5)), 2)),
+                         [[0, 1], [2, 3], [4]])
+        with self.assertRaises(ValueError):
+            list(iter_batches([1], 0))
+
+    def test_load_sends_one_statement_per_batch(self):
+        driver = RecordingDriver()
+        timings = load_succession_batched(driver, succession_df(), "start",
+                                          "delta_D", {"model_ID": "m"},
+                                          batch_size=2)
+        self.assertEqual([t["rows"] for t in timings], [2, 1])
+        self.assertEqual(len(driver.log), 2)
+        params = driver.log[1][1]
+        self.assertEqual(params["model_ID"], "m")
+        self.assertEqual([r["transID"] for r in params["rows"]], [2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import pandas as pd
+
+from trans_table_filters import (
+    drop_states,
+    drop_self_transitions,
+    drop_transitions,
+)
+
+
+class TransTableFiltersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "start": ["pine", "urban", "burnt", "pasture", "scrubland"],
+            "delta_D": ["pine", "burnt", "urban", "scrubland", "pine"],
+            "delta_T": [0, 1, 2, 3, 4],
+        })
+
+    def test_drop_states_checks_start_and_end(self):
+        df, n_dropped = drop_states(self.df, {"urban"}, "start", "delta_D")
+        self.assertEqual(n_dropped, 2)
+        self.assertEqual(list(df["delta_T"]), [0, 3, 4])
+
+    def test_drop_self_transitions(self):
+        df, n_dropped = drop_self_transitions(self.df, "start", "delta_D")
+        self.assertEqual(n_dropped, 1)
+        self.assertEqual(list(df["delta_T"]), [1, 2, 3, 4])
+
+    def test_drop_transitions_respects_direction(self):
+        df, n_dropped = drop_transitions(
+            self.df, [("pasture", "scrubland"), ("pine", "burnt")],
+            "start", "delta_D")
+        self.assertEqual(n_dropped, 1)
+        self.assertNotIn(3, list(df["delta_T"]))
+
+    def test_nothing_to_drop(self):
+        df, n_dropped = drop_states(self.df, ["oak"], "start", "delta_D")
+        self.assertEqual(n_dropped, 0)
+        self.assertEqual(len(df.index), len(self.df.index))
+
+
+if __name__ == "__main__":
+    unittest.main()
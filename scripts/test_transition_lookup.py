@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+
+from constants import AgroSuccessLct as AsLct, Aspect, Succession, Water
+from generate_trans_table import generate_base_table
+from repurpose_trans_rules_agrosuccess import make_repurpose_pipeline
+from schema import (
+    AGROSUCCESS_CONDITION_ENUMS,
+    AGROSUCCESS_SCHEMA,
+    apply_schema,
+)
+from transition_lookup import NO_RULE, TransitionLookup, enum_codes
+
+
+def agrosuccess_table():
+    df = make_repurpose_pipeline("start", "delta_D").run(
+        generate_base_table())
+    return apply_schema(df, AGROSUCCESS_SCHEMA).reset_index()
+
+
+class TransitionLookupTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.df = agrosuccess_table()
+        cls.lookup = TransitionLookup.from_table(cls.df)
+        cls.codes = [enum_codes(cls.df["start"], AsLct)] + [
+            enum_codes(cls.df[col], trans_enum)
+            for col, trans_enum in AGROSUCCESS_CONDITION_ENUMS.items()]
+
+    def test_every_rule_found(self):
+        self.assertEqual(self.lookup.n_rules, len(self.df.index))
+        result = self.lookup.lookup(*self.codes)
+        np.testing.assert_array_equal(result.target,
+                                      enum_codes(self.df["delta_D"], AsLct))
+        np.testing.assert_array_equal(result.delta_t, self.df["delta_T"])
+        np.testing.assert_array_equal(self.lookup.rule_ids(*self.codes),
+                                      self.df["transID"])
+
+    def test_single_query_with_enum_members(self):
+        row = self.df.iloc[0]
+        target, delta_t = self.lookup.lookup(
+            AsLct.from_alias(row["start"]), Succession[row["succession"]
+                                                       .upper()],
+            Aspect[row["aspect"].upper()], row["pine"], row["oak"],
+            row["deciduous"], Water[row["water"].upper()])
+        self.assertEqual(target, AsLct.from_alias(row["delta_D"]).value)
+        self.assertEqual(delta_t, row["delta_T"])
+
+    def test_missing_rules_use_sentinel(self):
+        target, delta_t = self.lookup.lookup(
+            np.array([AsLct.OAK.value] * 2), 0, 0, [0, 1], 0, 0, 2)
+        np.testing.assert_array_equal(target, [NO_RULE, NO_RULE])
+        np.testing.assert_array_equal(delta_t, [NO_RULE, NO_RULE])
+
+    def test_invalid_codes(self):
+        with self.assertRaises(ValueError):
+            self.lookup.lookup(9, 0, 0, 0, 0, 0, 0)
+        with self.assertRaises(ValueError):
+            self.lookup.lookup(0, 0, 0, 0, 0, 0, -1)
+        with self.assertRaises(ValueError):
+            enum_codes(["Burnt", "Tundra"], AsLct)
+
+    def test_duplicate_rules_rejected(self):
+        with self.assertRaises(ValueError):
+            TransitionLookup.from_table(
+                self.df.iloc[[0, 0]].reset_index(drop=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import unittest
+
+from graph_db import load_generation_statement
+from transition_queries import (
+    LRUCache,
+    TransitionQueries,
+    TransitionTimes,
+    Trajectory,
+    invalidate_model,
+    model_reloaded,
+    reloading_model,
+    summary_statement,
+    trajectory_statement,
+)
+
+PARAMS = {"model_ID": "m"}
+
+
+class QuerySession(object):
+    """Session returning canned records, logging the queries it's sent.
+
+    Reads of the model's load generation are counted separately, and
+    statements changing it, i.e. reloads, give it a new value.
+    """
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, statement, parameters=None):
+        if "ModelLoad" in statement:
+            if statement.startswith("MERGE"):
+                self.driver.generation += 1
+                return self
+            self.driver.generation_reads += 1
+            return [{"generation": self.driver.generation}]
+        self.driver.log.append((statement, parameters))
+        if "TRANSITIONS_TO" in statement:
+            if parameters["end"] == "Oak":
+                return [{"min_delta_t": 20, "max_delta_t": 25}]
+            return []
+        return [{"target": "Oak", "delta_t": 20}]
+
+    def consume(self):
+        return None
+
+
+class QueryDriver(object):
+    def __init__(self):
+        self.log = []
+        self.generation = 0
+        self.generation_reads = 0
+
+    def session(self):
+        return QuerySession(self)
+
+
+class TransitionQueriesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.driver = QueryDriver()
+        self.queries = TransitionQueries(self.driver, max_size=2)
+
+    def test_statements_match_on_parameters(self):
+        statement = trajectory_statement(["pine"], PARAMS)
+        self.assertIn("{`code`:$start, `model_ID`:$`model_ID`}", statement)
+        self.assertIn("`pine`:$conditions.`pine`", statement)
+        self.assertIn("{`code`:$end, `model_ID`:$`model_ID`}",
+                      summary_statement(PARAMS))
+        with self.assertRaises(ValueError):
+            trajectory_statement([], {"start": 1})
+
+    def test_repeated_queries_cached(self):
+        for _ in range(3):
+            result = self.queries.trajectories(PARAMS, "Pine", pine=True)
+        self.assertEqual(result, (Trajectory("Oak", 20),))
+        self.assertEqual(len(self.driver.log), 1)
+        self.assertEqual(self.driver.log[0][1],
+                         {"model_ID": "m", "start": "Pine",
+                          "conditions": {"pine": True}})
+        stats = self.queries.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.size), (2, 1, 1))
+
+    def test_missing_transition_cached(self):
+        self.assertEqual(self.queries.transition_times(PARAMS, "Pine", "Oak"),
+                         TransitionTimes(20, 25))
+        self.assertIsNone(self.queries.transition_times(PARAMS, "Oak",
+                                                        "Pine"))
+        self.assertIsNone(self.queries.transition_times(PARAMS, "Oak",
+                                                        "Pine"))
+        self.assertEqual(len(self.driver.log), 2)
+
+    def test_least_recently_used_evicted(self):
+        self.queries.transition_times(PARAMS, "Pine", "Oak")
+        self.queries.transition_times(PARAMS, "Burnt", "Oak")
+        self.queries.transition_times(PARAMS, "Pine", "Oak")
+        self.queries.transition_times(PARAMS, "Oak", "Oak")
+        self.queries.transition_times(PARAMS, "Pine", "Oak")
+        self.assertEqual(len(self.driver.log), 3)
+        self.assertEqual(self.queries.stats().evictions, 1)
+
+    def test_reload_invalidates_model(self):
+        other = {"model_ID": "other"}
+        self.queries.transition_times(PARAMS, "Pine", "Oak")
+        self.queries.transition_times(other, "Pine", "Oak")
+        invalidate_model("m")
+        self.queries.transition_times(other, "Pine", "Oak")
+        self.queries.transition_times(PARAMS, "Pine", "Oak")
+        self.assertEqual(len(self.driver.log), 3)
+        self.assertEqual(self.queries.stats().invalidations, 1)
+
+    def test_reload_in_other_process_seen(self):
+        queries = TransitionQueries(self.driver, check_interval=0)
+        queries.transition_times(PARAMS, "Pine", "Oak")
+        queries.transition_times(PARAMS, "Pine", "Oak")
+        self.assertEqual(len(self.driver.log), 1)
+        # As another process's loader would
+        self.driver.session().run(load_generation_statement(PARAMS), PARAMS)
+        queries.transition_times(PARAMS, "Pine", "Oak")
+        self.assertEqual(len(self.driver.log), 2)
+        self.assertEqual(queries.stats().invalidations, 1)
+
+    def test_generation_read_at_most_once_per_interval(self):
+        queries = TransitionQueries(self.driver, check_interval=3600)
+        for _ in range(3):
+            queries.transition_times(PARAMS, "Pine", "Oak")
+        self.driver.session().run(load_generation_statement(PARAMS), PARAMS)
+        queries.transition_times(PARAMS, "Pine", "Oak")
+        self.assertEqual(self.driver.generation_reads, 1)
+        self.assertEqual(len(self.driver.log), 1)
+
+    def test_model_reloaded_marks_and_invalidates(self):
+        self.queries.transition_times(PARAMS, "Pine", "Oak")
+        model_reloaded(self.driver, PARAMS)
+        self.assertEqual(self.driver.generation, 1)
+        self.assertEqual(self.queries.stats().invalidations, 1)
+
+    def test_reloading_model_marks_on_exit(self):
+        with reloading_model(self.driver, PARAMS):
+            self.assertEqual(self.driver.generation, 0)
+        self.assertEqual(self.driver.generation, 1)
+        with self.assertRaises(KeyError):
+            with reloading_model(self.driver, PARAMS):
+                raise KeyError("load failed")
+        self.assertEqual(self.driver.generation, 2)
+
+    def test_reloading_model_keeps_original_error(self):
+        class UnreachableDriver(object):
+            def session(self):
+                raise IOError("server unreachable")
+
+        with self.assertLogs(level="ERROR"):
+            with self.assertRaises(KeyError):
+                with reloading_model(UnreachableDriver(), PARAMS):
+                    raise KeyError("load failed")
+
+    def test_missing_model_id(self):
+        queries = TransitionQueries(self.driver)
+        self.assertEqual(queries.transition_times({}, "Pine", "Oak"),
+                         TransitionTimes(20, 25))
+
+    def test_value_computed_during_invalidation_not_cached(self):
+        cache = LRUCache()
+
+        def compute():
+            cache.invalidate("m")
+            return 1
+
+        self.assertEqual(cache.get(("m", 0), compute), 1)
+        self.assertEqual(cache.stats().size, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+"""
+trans_table_filters.py
+~~~~~~~~~~~~~~~~~~~~~~
+
+Vectorised row filters for land cover transition tables.
+
+Each filter is expressed as a boolean mask over the rows of the table,
+computed by comparing whole columns at once rather than by inspecting rows
+one at a time with ``df.apply(..., axis=1)``. The `drop_*` functions remove
+the rows selected by a mask and log, and return, the number of rows removed.
+"""
+import logging
+
+import numpy as np
+
+
+def states_mask(df, states, start_col, end_col):
+    """Mask of rows whose start or end state is one of `states`."""
+    states = list(states)
+    return df[start_col].isin(states).values | df[end_col].isin(states).values
+
+
+def self_transition_mask(df, start_col, end_col):
+    """Mask of rows whose start state is the same as their end state."""
+    return df[start_col].values == df[end_col].values
+
+
+def transitions_mask(df, transitions, start_col, end_col):
+    """Mask of rows describing any of the given transitions.
+
+    Args:
+        transitions (list of tuple): (start state, end state) pairs.
+    """
+    mask = np.zeros(len(df.index), dtype=bool)
+    for start, end in transitions:
+        mask |= (df[start_col].values == start) & (df[end_col].values == end)
+    return mask
+
+
+def drop_rows(df, mask, description="matching rows"):
+    """Remove rows selected by `mask` from `df`.
+
+    Args:
+        df (:obj:`pandas.DataFrame`): Transition table.
+        mask (:obj:`numpy.ndarray`): Boolean array, True for rows to drop.
+        description (str, optional): What the dropped rows represent, used
+            when logging the number of rows removed.
+
+    Returns:
+        tuple: The filtered :obj:`pandas.DataFrame` and the number of rows
+            which were removed.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    n_dropped = int(mask.sum())
+    logging.info("Dropped {0} of {1} rows: {2}".format(
+        n_dropped, len(df.index), description))
+    return df[~mask], n_dropped
+
+
+def drop_states(df, states, start_col, end_col):
+    """Remove rows with any of `states` as their start or end state."""
+    states = list(states)
+    return drop_rows(df, states_mask(df, states, start_col, end_col),
+                     "start or end state in {0}".format(states))
+
+
+def drop_self_transitions(df, start_col, end_col):
+    """Remove rows whose start state is the same as their end state."""
+    return drop_rows(df, self_transition_mask(df, start_col, end_col),
+                     "start state same as end state")
+
+
+def drop_transitions(df, transitions, start_col, end_col):
+    """Remove rows describing any of the given (start, end) transitions."""
+    transitions = list(transitions)
+    return drop_rows(df,
+                     transitions_mask(df, transitions, start_col, end_col),
+                     "transitions {0}".format(transitions))
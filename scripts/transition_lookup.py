@@ -0,0 +1,203 @@
+"""
+transition_lookup.py
+~~~~~~~~~~~~~~~~~~~~
+
+Compile the AgroSuccess transition table into dense lookup arrays.
+
+Each rule in `agrosuccess_succession.csv` gives the end state and transition
+time for a start state under one combination of conditions. Finding the rule
+for a state by filtering the table, or by querying the graph, is slow when
+it has to be done for many cells. Here the table is turned into arrays with
+one axis for the start state and one for each condition column, in table
+order, indexed by the codes of the enums in `constants.py`:
+
+========== ==================== =====
+axis       enum                 size
+========== ==================== =====
+start      `AgroSuccessLct`     9
+succession `Succession`         2
+aspect     `Aspect`             2
+pine       `SeedPresence`       2
+oak        `SeedPresence`       2
+deciduous  `SeedPresence`       2
+water      `Water`              3
+========== ==================== =====
+
+so a query is a single array index, whether for one cell or many.
+Combinations without a rule hold `NO_RULE` in every array.
+"""
+from enum import Enum
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from constants import AgroSuccessLct as AsLct, SeedPresence
+from schema import (
+    AGROSUCCESS_CONDITION_ENUMS,
+    TIME_DTYPE,
+    read_agrosuccess_table,
+)
+
+NO_RULE = -1
+STATE_DTYPE = np.int8
+RULE_ID_DTYPE = np.int32
+AXIS_ENUMS = [("start", AsLct)] + list(AGROSUCCESS_CONDITION_ENUMS.items())
+
+Transition = namedtuple("Transition", ["target", "delta_t"])
+
+
+def enum_codes(values, trans_enum):
+    """Codes of the `trans_enum` members with the given aliases.
+
+    Args:
+        values (array-like): Aliases as in the AgroSuccess table, e.g.
+            'Burnt' or 'north', or for `SeedPresence` booleans.
+        trans_enum (:obj:`enum.Enum`): Enum the values belong to.
+
+    Returns:
+        :obj:`numpy.ndarray`: Codes as int8.
+
+    Raises:
+        ValueError: If a value isn't an alias of a member of `trans_enum`.
+    """
+    if trans_enum is SeedPresence:
+        return np.asarray(values).astype(STATE_DTYPE)
+    members = list(trans_enum)
+    cat = pd.Categorical(np.asarray(values, dtype=object),
+                         categories=[m.alias for m in members])
+    if (cat.codes < 0).any():
+        unknown = sorted(set(np.asarray(values, dtype=object)[cat.codes < 0]),
+                         key=str)
+        raise ValueError("Unknown {0} value(s): {1}".format(
+            trans_enum.__name__, unknown))
+    return np.array([m.value for m in members], dtype=STATE_DTYPE)[cat.codes]
+
+
+def _as_index(value, size, name):
+    """Array of codes from a code, enum member, or array of either."""
+    if isinstance(value, Enum):
+        value = value.value
+    index = np.asarray(value)
+    if index.dtype == bool:
+        index = index.astype(np.intp)
+    if not np.issubdtype(index.dtype, np.integer):
+        raise TypeError("Codes for '{0}' must be integers, got {1}"
+                        .format(name, index.dtype))
+    if index.size and (index.min() < 0 or index.max() >= size):
+        raise ValueError("Codes for '{0}' must be in [0, {1})"
+                         .format(name, size))
+    return index
+
+
+class TransitionLookup(object):
+    """Transition rules in dense arrays indexed by state and condition codes.
+
+    Attributes:
+        target (:obj:`numpy.ndarray`): `AgroSuccessLct` code of each rule's
+            end state.
+        delta_t (:obj:`numpy.ndarray`): Transition time of each rule.
+        rule_id (:obj:`numpy.ndarray`): Each rule's `transID`.
+    """
+
+    def __init__(self, target, delta_t, rule_id):
+        shape = tuple(len(trans_enum) for _, trans_enum in AXIS_ENUMS)
+        for name, arr in [("target", target), ("delta_t", delta_t),
+                          ("rule_id", rule_id)]:
+            if arr.shape != shape:
+                raise ValueError("Expected {0} with shape {1}, got {2}"
+                                 .format(name, shape, arr.shape))
+        self.target = target
+        self.delta_t = delta_t
+        self.rule_id = rule_id
+
+    @classmethod
+    def from_codes(cls, index, target, delta_t, rule_ids):
+        """Compile rules given as arrays of codes.
+
+        Args:
+            index (list of array): Codes of each rule's start state and
+                conditions, in the order of `AXIS_ENUMS`.
+            target (array): `AgroSuccessLct` code of each rule's end state.
+            delta_t (array): Each rule's transition time.
+            rule_ids (array): Each rule's `transID`.
+
+        Raises:
+            ValueError: If two rules share a start state and conditions.
+        """
+        shape = tuple(len(trans_enum) for _, trans_enum in AXIS_ENUMS)
+        index = tuple(np.asarray(codes, dtype=np.intp) for codes in index)
+        flat = np.ravel_multi_index(index, shape)
+        if len(np.unique(flat)) < len(flat):
+            raise ValueError("Table has more than one rule for some start "
+                             "states and conditions")
+        lookup = cls(np.full(shape, NO_RULE, dtype=STATE_DTYPE),
+                     np.full(shape, NO_RULE, dtype=TIME_DTYPE),
+                     np.full(shape, NO_RULE, dtype=RULE_ID_DTYPE))
+        lookup.target[index] = target
+        lookup.delta_t[index] = delta_t
+        lookup.rule_id[index] = rule_ids
+        return lookup
+
+    @classmethod
+    def from_table(cls, df, start_col="start", end_col="delta_D",
+                   time_col="delta_T", id_col="transID"):
+        """Compile the rules in an AgroSuccess transition table.
+
+        Args:
+            df (:obj:`pandas.DataFrame`): Table as made by
+                `repurpose_trans_rules_agrosuccess.py`. If it has no
+                `id_col` column, rules are numbered by row.
+
+        Raises:
+            ValueError: If two rules share a start state and conditions.
+        """
+        cols = [start_col] + list(AGROSUCCESS_CONDITION_ENUMS)
+        index = [enum_codes(df[col], trans_enum)
+                 for col, (_, trans_enum) in zip(cols, AXIS_ENUMS)]
+        rule_ids = (df[id_col].to_numpy() if id_col in df.columns
+                    else np.arange(len(df.index)))
+        return cls.from_codes(index, enum_codes(df[end_col], AsLct),
+                              df[time_col].to_numpy(), rule_ids)
+
+    @classmethod
+    def from_csv(cls, path):
+        """Compile the rules in an AgroSuccess transition table file."""
+        return cls.from_table(read_agrosuccess_table(path))
+
+    @property
+    def n_rules(self):
+        return int((self.target != NO_RULE).sum())
+
+    def _index(self, start, conditions):
+        if len(conditions) != len(AXIS_ENUMS) - 1:
+            raise TypeError("Expected {0} conditions, got {1}".format(
+                len(AXIS_ENUMS) - 1, len(conditions)))
+        return tuple(_as_index(value, len(trans_enum), name)
+                     for value, (name, trans_enum)
+                     in zip((start,) + tuple(conditions), AXIS_ENUMS))
+
+    def lookup(self, start, succession, aspect, pine, oak, deciduous, water):
+        """End state and transition time for states under conditions.
+
+        Each argument is a code, an enum member, or an array of codes.
+        Arrays are broadcast against each other.
+
+        Returns:
+            :obj:`Transition`: `AgroSuccessLct` code of the end state and the
+                transition time, as scalars or arrays, `NO_RULE` where there
+                is no rule.
+
+        Raises:
+            ValueError: If a code is out of range for its enum.
+        """
+        index = self._index(start, (succession, aspect, pine, oak, deciduous,
+                                    water))
+        return Transition(self.target[index], self.delta_t[index])
+
+    def rule_ids(self, start, succession, aspect, pine, oak, deciduous,
+                 water):
+        """`transID` of the rule for each query, `NO_RULE` where none."""
+        index = self._index(start, (succession, aspect, pine, oak, deciduous,
+                                    water))
+        return self.rule_id[index]
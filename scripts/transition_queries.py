@@ -0,0 +1,345 @@
+"""
+transition_queries.py
+~~~~~~~~~~~~~~~~~~~~~
+
+Query transitions in a loaded model, caching the results.
+
+Tools using the graph made by `load_agrosuccess_model.py` ask the same few
+questions of it over and over:
+
+- which trajectories leave a land cover type under given environmental
+  conditions, and
+- what are the least and greatest transition times between two land cover
+  types, from the `TRANSITIONS_TO` summary.
+
+:obj:`TransitionQueries` answers these, keeping the most recently used
+answers in a bounded cache keyed by the `model_ID` and the query's
+parameters, so repeated questions don't each need a round trip to the
+database.
+
+A model's answers only change when it's reloaded, so the loaders call
+:func:`model_reloaded`, using :func:`reloading_model`, once they've finished
+changing a model. This drops
+its answers from every :obj:`TransitionQueries` in the process, and gives
+the model a new load generation in the graph (see `graph_db.py`). Before
+answering a query, :obj:`TransitionQueries` reads the model's generation,
+at most once every `check_interval` seconds, and drops the model's answers
+if it has changed. So caches in other processes see reloads too.
+"""
+import time
+import logging
+import threading
+import weakref
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from graph_db import mark_model_loaded, read_load_generation
+from succession_graph import (
+    DEFAULT_LABELS,
+    SUMMARY_REL_TYPE,
+    TIME_COL,
+    property_map,
+    quote_name,
+)
+
+DEFAULT_CACHE_SIZE = 4096
+# Seconds between reads of each model's load generation
+DEFAULT_CHECK_INTERVAL = 1.0
+CONDITIONS_PARAM = "conditions"
+
+Trajectory = namedtuple("Trajectory", ["target", "delta_t"])
+TransitionTimes = namedtuple("TransitionTimes", ["min_delta_t",
+                                                 "max_delta_t"])
+CacheStats = namedtuple("CacheStats", ["hits", "misses", "evictions",
+                                       "invalidations", "size", "max_size"])
+
+_caches = weakref.WeakSet()
+_caches_lock = threading.Lock()
+
+
+def invalidate_model(model_id):
+    """Drop cached answers for `model_id` from every cache in the process.
+
+    Called by the loaders once a model has been reloaded.
+    """
+    with _caches_lock:
+        caches = list(_caches)
+    for cache in caches:
+        cache.invalidate(model_id)
+
+
+def model_reloaded(driver, global_params):
+    """Tell caches in this process and others that a model was reloaded.
+
+    Called by the loaders once they've finished changing a model, or have
+    failed part way through.
+    """
+    try:
+        mark_model_loaded(driver, global_params)
+    finally:
+        invalidate_model(global_params.get("model_ID"))
+
+
+@contextmanager
+def reloading_model(driver, global_params):
+    """Call :func:`model_reloaded` once the block changing a model exits.
+
+    Enter it once the model is about to be changed, so a loader which fails
+    before touching the model, e.g. as the server can't be reached, doesn't
+    mark it. If the block raises, an error from :func:`model_reloaded` is
+    logged rather than hiding the block's.
+    """
+    try:
+        yield
+    except BaseException:
+        try:
+            model_reloaded(driver, global_params)
+        except Exception:
+            logging.exception("Couldn't mark model {0} as reloaded".format(
+                global_params.get("model_ID")))
+        raise
+    model_reloaded(driver, global_params)
+
+
+def _param_map(items, global_params):
+    """Cypher map literal of `items` and the global parameters."""
+    return "{" + ", ".join(items + [
+        "{0}:${0}".format(quote_name(k)) for k in global_params]) + "}"
+
+
+def trajectory_statement(condition_keys, global_params, labels=None):
+    """Statement finding trajectories from a state under given conditions.
+
+    Args:
+        condition_keys (list of str): Condition properties to match, whose
+            values are given in the `$conditions` map parameter. The start
+            state's code is given in the `$start` parameter.
+        global_params (dict): Parameters identifying the model.
+        labels (dict, optional): Labels to use in place of those in
+            `succession_graph.DEFAULT_LABELS`.
+    """
+    if CONDITIONS_PARAM in global_params or "start" in global_params:
+        raise ValueError("Global parameter names 'start' and '{0}' are "
+                         "reserved for query parameters"
+                         .format(CONDITIONS_PARAM))
+    labels = dict(DEFAULT_LABELS, **(labels or {}))
+    state, trans, cond = [quote_name(labels[k])
+                          for k in ("State", "Transition", "Condition")]
+    gp = property_map([], global_params)
+    cond_items = ["{0}:${1}.{0}".format(quote_name(k), CONDITIONS_PARAM)
+                  for k in condition_keys]
+    return "\n".join([
+        "MATCH (src:{0} {1})<-[:SOURCE]-(trans:{2} {3})-[:TARGET]->"
+        "(tgt:{0} {3})".format(state, _param_map(["`code`:$start"],
+                                                 global_params), trans, gp),
+        "MATCH (cond:{0} {1})-[:CAUSES]->(trans)".format(
+            cond, _param_map(cond_items, global_params)),
+        "RETURN tgt.code AS target, cond.{0} AS delta_t".format(
+            quote_name(TIME_COL)),
+        "ORDER BY target, delta_t",
+    ])
+
+
+def summary_statement(global_params, labels=None):
+    """Statement finding the `TRANSITIONS_TO` summary between two states.
+
+    The codes of the states are given in the `$start` and `$end` parameters.
+    """
+    if "start" in global_params or "end" in global_params:
+        raise ValueError("Global parameter names 'start' and 'end' are "
+                         "reserved for query parameters")
+    labels = dict(DEFAULT_LABELS, **(labels or {}))
+    state = quote_name(labels["State"])
+    return "\n".join([
+        "MATCH (src:{0} {1})-[tr:{2} {3}]->(tgt:{0} {4})".format(
+            state, _param_map(["`code`:$start"], global_params),
+            quote_name(SUMMARY_REL_TYPE), property_map([], global_params),
+            _param_map(["`code`:$end"], global_params)),
+        "RETURN tr.min_delta_t AS min_delta_t, "
+        "tr.max_delta_t AS max_delta_t",
+    ])
+
+
+class LRUCache(object):
+    """Bounded mapping discarding its least recently used items first.
+
+    Keys are tuples whose first item is a `model_ID`. Safe to share across
+    threads.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped on invalidation, so answers computed before then aren't kept
+        self._generations = {}
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, key, compute):
+        """Value cached for `key`, or the result of `compute()` if none.
+
+        `compute` is called without holding the cache's lock, so concurrent
+        misses for the same key may each compute the value. Values computed
+        while the key's model is invalidated are returned but not cached.
+        """
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            generation = self._generation(key[0])
+        value = compute()
+        with self._lock:
+            if generation != self._generation(key[0]):
+                return value
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, model_id=None):
+        """Drop items for `model_id`, or every item if None.
+
+        Returns:
+            int: Number of items dropped.
+        """
+        with self._lock:
+            self._generations[model_id] = (
+                self._generations.get(model_id, 0) + 1)
+            keys = [k for k in self._items
+                    if model_id is None or k[0] == model_id]
+            for key in keys:
+                del self._items[key]
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def _generation(self, model_id):
+        return (self._generations.get(model_id, 0)
+                + self._generations.get(None, 0))
+
+    def stats(self):
+        with self._lock:
+            return CacheStats(self.hits, self.misses, self.evictions,
+                              self.invalidations, len(self._items),
+                              self.max_size)
+
+
+class TransitionQueries(object):
+    """Cached queries for the transitions of models loaded in the graph.
+
+    Answers are cached against the `model_ID` in the global parameters
+    passed to each query, so one instance can serve several models.
+    """
+
+    def __init__(self, driver, max_size=DEFAULT_CACHE_SIZE, labels=None,
+                 check_interval=DEFAULT_CHECK_INTERVAL):
+        """
+        Args:
+            driver: Connected driver, or anything else with a `session`
+                method, e.g. a :obj:`graph_db.SessionPool`.
+            max_size (int, optional): Largest number of answers cached.
+            labels (dict, optional): Labels to use in place of those in
+                `succession_graph.DEFAULT_LABELS`.
+            check_interval (float, optional): Seconds for which a model's
+                load generation is trusted before it's read again. If 0 it's
+                read before every query, if None it's never read.
+        """
+        self.driver = driver
+        self.labels = labels
+        self.check_interval = check_interval
+        self.cache = LRUCache(max_size)
+        # Global parameters -> (load generation, time it was read)
+        self._generations = {}
+        self._generations_lock = threading.Lock()
+        with _caches_lock:
+            _caches.add(self)
+
+    def _run(self, statement, parameters):
+        with self.driver.session() as session:
+            return list(session.run(statement, parameters))
+
+    def _check_generation(self, global_params):
+        """Drop the model's answers if it's been reloaded since last read."""
+        if self.check_interval is None:
+            return
+        key = tuple(sorted(global_params.items()))
+        now = time.monotonic()
+        with self._generations_lock:
+            seen = self._generations.get(key)
+        if seen is not None and now - seen[1] < self.check_interval:
+            return
+        with self.driver.session() as session:
+            generation = read_load_generation(session, global_params)
+        with self._generations_lock:
+            self._generations[key] = (generation, now)
+        if seen is not None and seen[0] != generation:
+            self.invalidate(global_params.get("model_ID"))
+
+    def trajectories(self, global_params, start, **conditions):
+        """Trajectories from state `start` under the given conditions.
+
+        Args:
+            global_params (dict): Parameters identifying the model,
+                including its `model_ID`.
+            start (str): Code of the start state, e.g. 'Pine'.
+            **conditions: Values of `EnvironCondition` properties to match,
+                e.g. `succession='regeneration', pine=True`. Conditions not
+                given match any value.
+
+        Returns:
+            tuple of :obj:`Trajectory`: Code of the end state and transition
+                time of each matching trajectory.
+        """
+        self._check_generation(global_params)
+        keys = sorted(conditions)
+        cache_key = (global_params.get("model_ID"), "trajectories",
+                     tuple(sorted(global_params.items())), start,
+                     tuple((k, conditions[k]) for k in keys))
+
+        def query():
+            records = self._run(
+                trajectory_statement(keys, global_params, self.labels),
+                dict(global_params, start=start,
+                     **{CONDITIONS_PARAM: conditions}))
+            return tuple(Trajectory(r["target"], r["delta_t"])
+                         for r in records)
+
+        return self.cache.get(cache_key, query)
+
+    def transition_times(self, global_params, start, end):
+        """Least and greatest transition times from `start` to `end`.
+
+        Returns:
+            :obj:`TransitionTimes`: From the `TRANSITIONS_TO` summary, or
+                None if there is no transition between the states.
+        """
+        self._check_generation(global_params)
+        cache_key = (global_params.get("model_ID"), "transition_times",
+                     tuple(sorted(global_params.items())), start, end)
+
+        def query():
+            records = self._run(summary_statement(global_params, self.labels),
+                                dict(global_params, start=start, end=end))
+            if not records:
+                return None
+            return TransitionTimes(records[0]["min_delta_t"],
+                                   records[0]["max_delta_t"])
+
+        return self.cache.get(cache_key, query)
+
+    def invalidate(self, model_id=None):
+        """Drop cached answers for `model_id`, or all answers if None."""
+        return self.cache.invalidate(model_id)
+
+    def stats(self):
+        """Cache hits, misses, evictions and invalidations so far.
+
+        Returns:
+            :obj:`CacheStats`
+        """
+        return self.cache.stats()